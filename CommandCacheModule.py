@@ -0,0 +1,189 @@
+#   CommandCacheModule.py
+#   Result cache for idempotent (read-only) whitelisted commands in the AION RWX API
+
+import json
+import time
+import shlex
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from SecurityModule import verify_api_token
+
+#   --- Configuration ---
+COMMAND_CACHE_ENABLED = True  #   Cacheable whitelist entries are still opt-in per command
+COMMAND_CACHE_MAX_BYTES = 8 * 1024 * 1024  #   Total size of cached outputs
+COMMAND_CACHE_MAX_ENTRY_BYTES = 1024 * 1024  #   Larger outputs are never cached
+COMMAND_CACHE_DEFAULT_TTL = 10  #   Seconds, for entries declaring "cacheable": true without a ttl
+READ_ONLY_METHODS = ("GET", "HEAD", "OPTIONS")
+
+#   --- Filesystem Change Tracking ---
+#   Incremented after every request that may have modified files under BASE_DIRECTORY.
+#   Entries declared with "invalidate_on_change" are only served while it is unchanged.
+FS_GENERATION = 0
+_generation_lock = threading.Lock()
+
+def note_fs_change():
+    """Records that files under BASE_DIRECTORY may have changed."""
+    global FS_GENERATION
+    with _generation_lock:
+        FS_GENERATION += 1
+
+def fs_generation() -> int:
+    """Returns the current filesystem generation."""
+    return FS_GENERATION
+
+def load_cache_policies(path: str = "whitelist.json") -> List[Tuple[List[str], Dict[str, Any]]]:
+    """
+    Loads the cache policies declared in the command whitelist.
+
+    Whitelist entries are either plain command strings (never cached) or objects:
+        {"command": "git status", "cacheable": true, "ttl": 5, "invalidate_on_change": true}
+
+    Args:
+        path: Path of the whitelist file.
+
+    Returns:
+        A list of (command parts, policy) pairs, longest commands first.
+    """
+    try:
+        with open(path, "r") as file:
+            entries = json.load(file).get("allowed_commands", [])
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []  #   load_whitelist already logs these errors
+    policies = []
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("cacheable"):
+            continue
+        policy = {
+            "ttl": float(entry.get("ttl", COMMAND_CACHE_DEFAULT_TTL)),
+            "invalidate_on_change": bool(entry.get("invalidate_on_change", False)),
+        }
+        policies.append((shlex.split(entry["command"].strip().lower()), policy))
+    policies.sort(key=lambda item: len(item[0]), reverse=True)
+    return policies
+
+CACHE_POLICIES = load_cache_policies()
+
+def normalize_command(command: str) -> str:
+    """Returns the cache key of a command (whitespace and quoting normalized)."""
+    return shlex.join(shlex.split(command.strip()))
+
+def match_cache_policy(command: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cache policy for a command, or None if it is not cacheable.
+    A policy applies to the exact command and to the command with extra arguments,
+    mirroring the prefix matching of is_command_allowed.
+    """
+    if not COMMAND_CACHE_ENABLED or not CACHE_POLICIES:
+        return None
+    parts = shlex.split(command.strip().lower())
+    for policy_parts, policy in CACHE_POLICIES:
+        if parts[:len(policy_parts)] == policy_parts:
+            return policy
+    return None
+
+class CommandCache:
+    """
+    LRU cache of command outputs, bounded by the total size of the cached outputs.
+    """
+
+    def __init__(self, max_bytes: int = COMMAND_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the cached output for key, or None if missing, expired or invalidated."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry["expires"] <= now or (entry["generation"] is not None and entry["generation"] != FS_GENERATION):
+                self.remove(key)
+                self.stats["invalidations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry["output"]
+
+    def put(self, key: str, output: str, policy: Dict[str, Any], generation: int):
+        """
+        Caches a command output under the given policy.
+
+        Args:
+            key: The normalized command.
+            output: The command output.
+            policy: The cache policy of the command (ttl, invalidate_on_change).
+            generation: FS_GENERATION observed before the command ran.
+        """
+        entry_size = len(key) + len(output.encode("utf-8"))
+        if entry_size > min(COMMAND_CACHE_MAX_ENTRY_BYTES, self.max_bytes):
+            return
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            self.entries[key] = {
+                "output": output,
+                "size": entry_size,
+                "expires": time.monotonic() + policy["ttl"],
+                "generation": generation if policy["invalidate_on_change"] else None,
+            }
+            self.size += entry_size
+            while self.size > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self.remove(oldest)
+                self.stats["evictions"] += 1
+
+    def remove(self, key: str):
+        """Removes an entry. Caller holds self.lock."""
+        entry = self.entries.pop(key)
+        self.size -= entry["size"]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.size, max_bytes=self.max_bytes)
+
+COMMAND_CACHE = CommandCache()
+
+def setup_command_cache(app: FastAPI):
+    """
+    Registers the filesystem change tracking middleware and the cache metrics endpoint.
+
+    Every request that is not read-only (by HTTP method) bumps FS_GENERATION once it
+    completes, unless the endpoint marked it read-only via request.state.read_only
+    (as /execute/ does for cacheable commands).
+
+    Args:
+        app: The FastAPI application instance.
+    """
+
+    @app.middleware("http")
+    async def track_fs_changes(request: Request, call_next):
+        try:
+            return await call_next(request)
+        finally:
+            if request.method not in READ_ONLY_METHODS and not getattr(request.state, "read_only", False):
+                note_fs_change()
+
+    @app.get("/metrics/command_cache/")
+    async def get_command_cache_metrics(request: Request):
+        """
+        Returns hit/miss/eviction counters and the size of the command result cache.
+        """
+        verify_api_token(request)
+        return JSONResponse(dict(COMMAND_CACHE.metrics(), fs_generation=FS_GENERATION))
+
+    logging.info(f"Command cache: {len(CACHE_POLICIES)} cacheable whitelist entries")
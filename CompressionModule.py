@@ -0,0 +1,205 @@
+#   CompressionModule.py
+#   Accept-Encoding negotiation and precompressed response cache for the AION RWX API
+
+import gzip
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from SecurityModule import verify_api_token
+from IOModule import run_io
+from SerializationModule import render_content, negotiate_media_type
+
+#   --- Optional Codecs ---
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+#   --- Configuration ---
+COMPRESSION_ENABLED = True
+COMPRESSION_MIN_BYTES = 1024  #   Smaller bodies are sent as-is (headers would eat the saving)
+COMPRESSION_LEVELS = {"zstd": 3, "br": 5, "gzip": 6}  #   Fast levels; the cache amortizes the cost for hot files
+COMPRESSION_CACHE_MAX_BYTES = 32 * 1024 * 1024  #   Total size of cached compressed bodies
+COMPRESSION_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024  #   Larger compressed bodies are never cached
+
+#   Server preference among the codecs that are installed (best ratio/speed first)
+SUPPORTED_ENCODINGS = tuple(
+    name for name, available in (("zstd", zstandard is not None), ("br", brotli is not None), ("gzip", True))
+    if available
+)
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Picks a content coding from an Accept-Encoding header.
+
+    The client's q-values decide first; ties are broken by SUPPORTED_ENCODINGS order.
+    "identity" and unsupported codings are never chosen.
+
+    Args:
+        accept_encoding: The Accept-Encoding header value (may be None).
+
+    Returns:
+        "zstd", "br", "gzip" or None for an uncompressed response.
+    """
+    if not COMPRESSION_ENABLED or not accept_encoding:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    wildcard = weights.get("*", 0.0)
+    best, best_weight = None, 0.0
+    for name in SUPPORTED_ENCODINGS:
+        weight = weights.get(name, wildcard)
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    Compresses data with the given content coding (blocking; run through run_io).
+
+    Args:
+        data: The uncompressed body.
+        encoding: "zstd", "br" or "gzip".
+
+    Returns:
+        The compressed body.
+    """
+    level = COMPRESSION_LEVELS[encoding]
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)  #   mtime=0 keeps the output reproducible
+
+class CompressedCache:
+    """
+    LRU cache of compressed response bodies, bounded by their total size.
+    Keys identify a version of a file (path, mtime, size), so a modified file is
+    simply a new key and old variants age out.
+    """
+
+    def __init__(self, max_bytes: int = COMPRESSION_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: "OrderedDict[Tuple[Any, ...], bytes]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[bytes]:
+        with self.lock:
+            body = self.entries.get(key)
+            if body is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return body
+
+    def put(self, key: Tuple[Any, ...], body: bytes):
+        if len(body) > min(COMPRESSION_CACHE_MAX_ENTRY_BYTES, self.max_bytes):
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = body
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, oldest = self.entries.popitem(last=False)
+                self.size -= len(oldest)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.size, max_bytes=self.max_bytes)
+
+COMPRESSED_CACHE = CompressedCache()
+COMPRESSION_STATS = {"compressed": 0, "skipped_small": 0, "bytes_in": 0, "bytes_out": 0}
+
+def file_version_key(sub_path: str, st) -> Tuple[Any, ...]:
+    """
+    Returns the cache key of a file version: its path plus inode, mtime and size.
+
+    Args:
+        sub_path: The request path of the file.
+        st: The os.stat_result of the file as it was read.
+    """
+    return (sub_path, st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+async def compressed_response(request: Request, content: Any, cache_key: Optional[Tuple[Any, ...]] = None) -> Response:
+    """
+    Builds a response in the format negotiated by SerializationModule (Accept),
+    compressed according to the request's Accept-Encoding.
+
+    Compression runs on the shared I/O pool (zlib, zstd and brotli release the GIL),
+    bodies below COMPRESSION_MIN_BYTES are sent uncompressed, and with a cache_key
+    the compressed body is cached so an unchanged file is only compressed once.
+
+    Args:
+        request: The incoming request.
+        content: The response content.
+        cache_key: Identifies the version of the content (see file_version_key), or None.
+
+    Returns:
+        A Response with Content-Encoding (if compressed) and Vary headers.
+    """
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding and cache_key is not None:
+        media_type = negotiate_media_type(request.headers.get("accept"))
+        cached = COMPRESSED_CACHE.get(cache_key + (media_type, encoding))
+        if cached is not None:
+            return Response(cached, media_type=media_type, headers=dict(headers, **{"Content-Encoding": encoding}))
+    body, media_type = render_content(request, content)
+    if encoding is None:
+        return Response(body, media_type=media_type, headers=headers)
+    if len(body) < COMPRESSION_MIN_BYTES:
+        COMPRESSION_STATS["skipped_small"] += 1
+        return Response(body, media_type=media_type, headers=headers)
+    compressed = await run_io("compress", compress, body, encoding)
+    COMPRESSION_STATS["compressed"] += 1
+    COMPRESSION_STATS["bytes_in"] += len(body)
+    COMPRESSION_STATS["bytes_out"] += len(compressed)
+    if cache_key is not None:
+        COMPRESSED_CACHE.put(cache_key + (media_type, encoding), compressed)
+    return Response(compressed, media_type=media_type, headers=dict(headers, **{"Content-Encoding": encoding}))
+
+def setup_compression_endpoints(app: FastAPI):
+    """
+    Registers the compression metrics endpoint.
+
+    Args:
+        app: The FastAPI application instance.
+    """
+
+    @app.get("/metrics/compression/")
+    async def get_compression_metrics(request: Request):
+        """
+        Returns compression counters and the size of the precompressed cache.
+        """
+        verify_api_token(request)
+        return JSONResponse(dict(COMPRESSION_STATS, encodings=list(SUPPORTED_ENCODINGS), cache=COMPRESSED_CACHE.metrics()))
+
+    logging.info(f"Response compression: {', '.join(SUPPORTED_ENCODINGS)}")
@@ -0,0 +1,582 @@
+#   CopyModule.py
+#   Server-side copy and move of files and directory trees for the AION RWX API
+#
+#   Data never leaves the kernel: each file is cloned (FICLONE reflink) where the
+#   filesystem supports it, otherwise copied with copy_file_range, sendfile, or as a
+#   last resort pread/pwrite. Trees are planned with a descriptor-based walk (symlinks
+#   are skipped, never followed) and their files are copied by a pool of worker
+#   threads. Every operation is a transfer with progress counters; short ones answer
+#   the request directly, long ones continue in the background (202).
+
+import os
+import stat
+import time
+import uuid
+import errno
+import fcntl
+import asyncio
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import FastAPI, HTTPException, status, Query, Request
+from fastapi.responses import JSONResponse
+from SecurityModule import verify_api_token
+from PathModule import PathResolver, get_path_resolver, split_path
+from IOModule import run_io
+from CommandCacheModule import note_fs_change
+
+#   --- Configuration ---
+COPY_WORKERS = int(os.getenv("COPY_WORKERS", "8"))  #   Threads copying files of trees (shared by all transfers)
+COPY_MAX_TRANSFERS = 16  #   Transfers running at once; further requests get 503
+COPY_CHUNK = 8 * 1024 * 1024  #   Bytes per copy_file_range/sendfile call (progress and cancellation granularity)
+COPY_WAIT_SECONDS = 2.0  #   Requests wait this long for a transfer before answering 202 with its id
+COPY_RESULT_TTL = 3600  #   Seconds a finished transfer stays queryable
+
+FICLONE = 0x40049409  #   ioctl(dst, FICLONE, src): share all extents (btrfs, XFS, bcachefs, ...)
+CLONE_UNSUPPORTED = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.EPERM, errno.ENOSYS)
+
+class TransferCancelled(Exception):
+    """Raised inside a transfer when the client cancels it."""
+
+class Transfer:
+    """State and progress counters of one copy or move."""
+
+    def __init__(self, kind: str, source: str, destination: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.source = source
+        self.destination = destination
+        self.status = "running"
+        self.files_total = 0
+        self.files_done = 0
+        self.bytes_total = 0
+        self.bytes_done = 0
+        self.skipped = 0  #   Symlinks, sockets, devices, ... (never copied)
+        self.methods: Dict[str, int] = {}
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+        self.future: Future = Future()
+        self.lock = threading.Lock()
+
+    def add_bytes(self, count: int):
+        with self.lock:
+            self.bytes_done += count
+        if self.cancelled.is_set():
+            raise TransferCancelled()
+
+    def file_done(self, method: str):
+        with self.lock:
+            self.files_done += 1
+            self.methods[method] = self.methods.get(method, 0) + 1
+
+    def view(self) -> Dict[str, Any]:
+        with self.lock:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "source": self.source,
+                "destination": self.destination,
+                "status": self.status,
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "bytes_total": self.bytes_total,
+                "bytes_done": self.bytes_done,
+                "skipped": self.skipped,
+                "methods": dict(self.methods),
+                "elapsed": round(elapsed, 3),
+                "bytes_per_second": int(self.bytes_done / elapsed) if elapsed > 0 else None,
+                "error": self.error,
+            }
+
+COPY_STATS = {"transfers": 0, "files": 0, "bytes": 0, "failed": 0, "cancelled": 0,
+              "reflink": 0, "copy_file_range": 0, "sendfile": 0, "read_write": 0}
+_clone_unsupported: Set[int] = set()  #   st_dev values where FICLONE failed (not retried)
+_stats_lock = threading.Lock()
+
+#   --- File Copy ---
+def copy_data(src_fd: int, dst_fd: int, st: os.stat_result, transfer: Transfer) -> str:
+    """
+    Copies the content of src_fd into the empty file dst_fd without passing it
+    through Python buffers where the kernel allows it.
+
+    Returns:
+        The method used: "reflink", "copy_file_range", "sendfile" or "read_write".
+    """
+    if st.st_size and st.st_dev not in _clone_unsupported:
+        try:
+            fcntl.ioctl(dst_fd, FICLONE, src_fd)
+            transfer.add_bytes(st.st_size)
+            return "reflink"
+        except OSError as e:
+            if e.errno not in CLONE_UNSUPPORTED:
+                raise
+            _clone_unsupported.add(st.st_dev)
+    method = "copy_file_range" if hasattr(os, "copy_file_range") else "sendfile"
+    offset = 0
+    while True:
+        if method == "copy_file_range":
+            try:
+                copied = os.copy_file_range(src_fd, dst_fd, COPY_CHUNK, offset, offset)
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP) or offset:
+                    raise
+                method = "sendfile"
+                continue
+        elif method == "sendfile":
+            try:
+                os.lseek(dst_fd, offset, os.SEEK_SET)
+                copied = os.sendfile(dst_fd, src_fd, offset, COPY_CHUNK)
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.ENOSYS) or offset:
+                    raise
+                method = "read_write"
+                continue
+        else:
+            data = os.pread(src_fd, COPY_CHUNK, offset)
+            copied = os.pwrite(dst_fd, data, offset) if data else 0
+        if copied == 0:
+            return method
+        offset += copied
+        transfer.add_bytes(copied)
+
+def copy_file(paths: PathResolver, src_parts: Tuple[str, ...], dst_parts: Tuple[str, ...], overwrite: bool, transfer: Transfer):
+    """
+    Copies one regular file into a temporary file next to the destination, then
+    renames it into place, so readers never see a partial copy. Mode and
+    timestamps are preserved (like cp -p).
+
+    Raises:
+        FileExistsError: If the destination exists and overwrite is False.
+        IsADirectoryError: If the source is not a regular file.
+    """
+    src_handle = paths.acquire_dir(src_parts[:-1])
+    try:
+        dst_handle = paths.acquire_dir(dst_parts[:-1])
+        try:
+            src_fd = paths.open_component(src_handle.fd, src_parts[-1], os.O_RDONLY | os.O_NONBLOCK)  #   Never blocks on a FIFO
+            try:
+                st = os.fstat(src_fd)
+                if not stat.S_ISREG(st.st_mode):
+                    raise IsADirectoryError(errno.EISDIR, "Not a regular file", "/".join(src_parts))
+                temp_name = f".copy-{uuid.uuid4().hex}"
+                dst_fd = paths.open_component(dst_handle.fd, temp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, st.st_mode & 0o777)
+                try:
+                    method = copy_data(src_fd, dst_fd, st, transfer)
+                    os.fchmod(dst_fd, st.st_mode & 0o777)  #   Not subject to the umask applied at creation
+                    os.utime(dst_fd, ns=(st.st_atime_ns, st.st_mtime_ns))
+                except BaseException:
+                    os.close(dst_fd)
+                    os.unlink(temp_name, dir_fd=dst_handle.fd)
+                    raise
+                os.close(dst_fd)
+                if overwrite:
+                    os.replace(temp_name, dst_parts[-1], src_dir_fd=dst_handle.fd, dst_dir_fd=dst_handle.fd)
+                else:
+                    try:
+                        #   Fails atomically if the destination exists
+                        os.link(temp_name, dst_parts[-1], src_dir_fd=dst_handle.fd, dst_dir_fd=dst_handle.fd, follow_symlinks=False)
+                    finally:
+                        os.unlink(temp_name, dir_fd=dst_handle.fd)
+            finally:
+                os.close(src_fd)
+        finally:
+            paths.release(dst_handle)
+    finally:
+        paths.release(src_handle)
+    transfer.file_done(method)
+    with _stats_lock:
+        COPY_STATS[method] += 1
+        COPY_STATS["files"] += 1
+        COPY_STATS["bytes"] += st.st_size
+
+#   --- Trees ---
+def plan_tree(paths: PathResolver, src_parts: Tuple[str, ...], transfer: Transfer) -> Tuple[List[Tuple[Tuple[str, ...], int]], List[Tuple[Tuple[str, ...], int]]]:
+    """
+    Walks a source tree with descriptors (os.fwalk), skipping symlinks and special files.
+
+    Returns:
+        The directories (relative parts, mode) in creation order and the regular
+        files (relative parts, size).
+    """
+    directories: List[Tuple[Tuple[str, ...], int]] = []
+    files: List[Tuple[Tuple[str, ...], int]] = []
+    handle = paths.acquire_dir(src_parts)
+    try:
+        for dir_path, dir_names, file_names, dir_fd in os.fwalk(os.curdir, dir_fd=handle.fd):
+            relative = os.path.relpath(dir_path, os.curdir)
+            parts = () if relative == os.curdir else tuple(relative.split(os.sep))
+            directories.append((parts, os.fstat(dir_fd).st_mode & 0o777))
+            for name in list(dir_names):
+                if stat.S_ISLNK(os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_mode):
+                    dir_names.remove(name)  #   fwalk lists links to directories here
+                    transfer.skipped += 1
+            for name in file_names:
+                st = os.stat(name, dir_fd=dir_fd, follow_symlinks=False)
+                if stat.S_ISREG(st.st_mode):
+                    files.append((parts + (name,), st.st_size))
+                else:
+                    transfer.skipped += 1
+            if transfer.cancelled.is_set():
+                raise TransferCancelled()
+    finally:
+        paths.release(handle)
+    return directories, files
+
+def make_directories(paths: PathResolver, dst_parts: Tuple[str, ...], directories: List[Tuple[Tuple[str, ...], int]], merge: bool):
+    """Creates the destination directories (parents first); with merge, existing directories are reused."""
+    for parts, mode in directories:
+        target = dst_parts + parts
+        handle = paths.acquire_dir(target[:-1])
+        try:
+            try:
+                os.mkdir(target[-1], mode, dir_fd=handle.fd)
+            except FileExistsError:
+                if not (merge and stat.S_ISDIR(os.stat(target[-1], dir_fd=handle.fd, follow_symlinks=False).st_mode)):
+                    raise
+        finally:
+            paths.release(handle)
+
+class TransferManager:
+    """Runs transfers on driver threads and copies their files on a shared worker pool."""
+
+    def __init__(self, paths: PathResolver, workers: int = COPY_WORKERS):
+        self.paths = paths
+        self.workers = workers
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.transfers: Dict[str, Transfer] = {}
+        self.lock = threading.Lock()
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="aion-copy")
+            return self.executor
+
+    def stop(self):
+        for transfer in list(self.transfers.values()):
+            transfer.cancelled.set()
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get(self, transfer_id: str) -> Optional[Transfer]:
+        return self.transfers.get(transfer_id)
+
+    def reap(self):
+        """Forgets transfers that finished more than COPY_RESULT_TTL seconds ago."""
+        cutoff = time.time() - COPY_RESULT_TTL
+        with self.lock:
+            for transfer_id, transfer in list(self.transfers.items()):
+                if transfer.finished_at is not None and transfer.finished_at < cutoff:
+                    del self.transfers[transfer_id]
+
+    def start(self, transfer: Transfer, src_parts: Tuple[str, ...], dst_parts: Tuple[str, ...], is_dir: bool, overwrite: bool, delete_source: bool):
+        """
+        Registers a transfer and runs it on its own driver thread.
+
+        Raises:
+            OverflowError: If COPY_MAX_TRANSFERS transfers are already running.
+        """
+        self.reap()
+        with self.lock:
+            if sum(1 for t in self.transfers.values() if t.finished_at is None) >= COPY_MAX_TRANSFERS:
+                raise OverflowError("Too many transfers in progress")
+            self.transfers[transfer.id] = transfer
+        with _stats_lock:
+            COPY_STATS["transfers"] += 1
+        threading.Thread(
+            target=self.run, args=(transfer, src_parts, dst_parts, is_dir, overwrite, delete_source),
+            name=f"aion-transfer-{transfer.id[:8]}", daemon=True,
+        ).start()
+
+    def run(self, transfer: Transfer, src_parts: Tuple[str, ...], dst_parts: Tuple[str, ...], is_dir: bool, overwrite: bool, delete_source: bool):
+        try:
+            if is_dir:
+                self.copy_tree(transfer, src_parts, dst_parts, overwrite)
+            else:
+                copy_file(self.paths, src_parts, dst_parts, overwrite, transfer)
+            if delete_source:
+                remove_source(self.paths, transfer.source, is_dir)
+            transfer.status = "succeeded"
+        except TransferCancelled as e:
+            transfer.status = "cancelled"
+            transfer.exception = e
+            with _stats_lock:
+                COPY_STATS["cancelled"] += 1
+        except BaseException as e:
+            transfer.status = "failed"
+            transfer.error = str(e)
+            transfer.exception = e
+            with _stats_lock:
+                COPY_STATS["failed"] += 1
+            logging.error(f"{transfer.kind} {transfer.source} -> {transfer.destination} failed: {e}")
+        finally:
+            transfer.finished_at = time.time()
+            note_fs_change()  #   Finishes after the request that started it when it runs in the background
+            transfer.future.set_result(transfer.status)
+            logging.info(f"{transfer.kind} {transfer.source} -> {transfer.destination}: {transfer.status} "
+                         f"({transfer.files_done} files, {transfer.bytes_done} bytes)")
+
+    def copy_tree(self, transfer: Transfer, src_parts: Tuple[str, ...], dst_parts: Tuple[str, ...], overwrite: bool):
+        """Plans the tree, creates its directories, then copies its files in parallel."""
+        directories, files = plan_tree(self.paths, src_parts, transfer)
+        with transfer.lock:
+            transfer.files_total = len(files)
+            transfer.bytes_total = sum(size for _, size in files)
+        make_directories(self.paths, dst_parts, directories, merge=overwrite)
+        executor = self.get_executor()
+        window = self.workers * 4  #   Bounded number of queued file copies
+        running: Set[Future] = set()
+        try:
+            for parts, _ in files:
+                if transfer.cancelled.is_set():
+                    raise TransferCancelled()
+                if len(running) >= window:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()  #   Re-raises the first failure and stops the transfer
+                running.add(executor.submit(copy_file, self.paths, src_parts + parts, dst_parts + parts, overwrite, transfer))
+            for future in list(running):
+                future.result()
+                running.discard(future)
+        except BaseException:
+            transfer.cancelled.set()  #   Stops the copies still running
+            wait(running)
+            raise
+
+def remove_source(paths: PathResolver, sub_path: str, is_dir: bool):
+    """Removes the source of a move that had to be copied (across filesystems)."""
+    if is_dir:
+        paths.rmtree(sub_path)
+    else:
+        paths.remove(sub_path)
+
+def prepare_transfer(paths: PathResolver, source: str, destination: str, recursive: bool, overwrite: bool) -> Tuple[Tuple[str, ...], Tuple[str, ...], os.stat_result]:
+    """
+    Resolves and validates the source and destination of a copy or move.
+
+    Returns:
+        The source parts, destination parts and the source stat result.
+
+    Raises:
+        FileNotFoundError: If the source or the destination's directory does not exist.
+        FileExistsError: If the destination exists (without overwrite, or with another type).
+        PermissionError: For symlinks and the base directory itself.
+        ValueError: For directories without recursive and destinations inside the source.
+    """
+    src_parts = split_path(paths.base_dir, source)
+    dst_parts = split_path(paths.base_dir, destination)
+    if not src_parts or not dst_parts:
+        raise PermissionError(errno.EACCES, "Operation not allowed on the base directory")
+    st = paths.lstat(source)
+    if stat.S_ISLNK(st.st_mode):
+        raise PermissionError(errno.EACCES, "Symbolic links are not allowed", source)
+    is_dir = stat.S_ISDIR(st.st_mode)
+    if not is_dir and not stat.S_ISREG(st.st_mode):
+        raise ValueError("Source is not a regular file or directory")
+    if is_dir and not recursive:
+        raise ValueError("Source is a directory; set recursive=true")
+    if dst_parts[:len(src_parts)] == src_parts:
+        raise ValueError("Destination is inside the source")
+    paths.release(paths.acquire_dir(dst_parts[:-1]))  #   FileNotFoundError if the destination directory is missing
+    try:
+        target = paths.lstat(destination)
+    except FileNotFoundError:
+        return src_parts, dst_parts, st
+    if stat.S_ISLNK(target.st_mode):
+        raise PermissionError(errno.EACCES, "Symbolic links are not allowed", destination)
+    if not overwrite or stat.S_ISDIR(target.st_mode) != is_dir:
+        raise FileExistsError(errno.EEXIST, "Destination exists", destination)
+    return src_parts, dst_parts, st
+
+def setup_copy_endpoints(app: FastAPI, base_dir: str) -> TransferManager:
+    """
+    Sets up the copy, move and transfer progress endpoints.
+
+    Args:
+        app: The FastAPI application instance.
+        base_dir: The base directory for file operations.
+
+    Returns:
+        The TransferManager serving the endpoints.
+    """
+    paths = get_path_resolver(base_dir)
+    manager = TransferManager(paths)
+    app.router.add_event_handler("shutdown", manager.stop)
+
+    def raise_for(e: BaseException, path: str, action: str):
+        """Maps errors of copies and moves to HTTP errors."""
+        if isinstance(e, FileExistsError) or (isinstance(e, OSError) and e.errno == errno.ENOTEMPTY):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Destination already exists")
+        if isinstance(e, (FileNotFoundError, NotADirectoryError)):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File or directory not found")
+        if isinstance(e, PermissionError):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden")
+        if isinstance(e, (ValueError, IsADirectoryError)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if isinstance(e, OSError) and e.errno in (errno.ENOSPC, errno.EDQUOT):
+            raise HTTPException(status_code=status.HTTP_507_INSUFFICIENT_STORAGE, detail="Not enough space")
+        logging.error(f"Error during {action} of {path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to {action}: {e}",
+        )
+
+    async def run_transfer(transfer: Transfer, src_parts: Tuple[str, ...], dst_parts: Tuple[str, ...], st: os.stat_result, overwrite: bool, delete_source: bool) -> JSONResponse:
+        """Starts a transfer and waits up to COPY_WAIT_SECONDS for it; answers 202 if it is still running."""
+        is_dir = stat.S_ISDIR(st.st_mode)
+        if not is_dir:
+            transfer.files_total, transfer.bytes_total = 1, st.st_size
+        try:
+            manager.start(transfer, src_parts, dst_parts, is_dir, overwrite, delete_source)
+        except OverflowError as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "5"}
+            )
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(transfer.future)), COPY_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                transfer.view(), status_code=status.HTTP_202_ACCEPTED, headers={"Location": f"/transfers/{transfer.id}"}
+            )
+        if transfer.status == "failed":
+            raise_for(transfer.exception, transfer.source, transfer.kind)
+        return JSONResponse(transfer.view())
+
+    @app.post("/copy/")
+    async def copy_path(
+        request: Request,
+        source_path: str = Query(..., description="File or directory to copy"),
+        destination_path: str = Query(..., description="Path of the copy"),
+        recursive: bool = Query(False, description="Copy a directory and everything below it"),
+        overwrite: bool = Query(False, description="Replace an existing file (or merge into an existing directory)"),
+    ):
+        """
+        Copies a file or directory tree on the server (reflink, copy_file_range or
+        sendfile). Symlinks below a copied directory are skipped.
+
+        Returns:
+            The transfer (200 when it finished within COPY_WAIT_SECONDS, otherwise
+            202 with a Location to poll at /transfers/{id}).
+
+        Raises:
+            HTTPException: 400, 403, 404, 409, 503 or 507.
+        """
+        verify_api_token(request)
+        try:
+            src_parts, dst_parts, st = await run_io("stat", prepare_transfer, paths, source_path, destination_path, recursive, overwrite)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise_for(e, source_path, "copy")
+        logging.info(f"Copy started: {source_path} -> {destination_path}")
+        return await run_transfer(Transfer("copy", source_path, destination_path), src_parts, dst_parts, st, overwrite, False)
+
+    @app.post("/move/")
+    async def move_path(
+        request: Request,
+        source_path: str = Query(..., description="File or directory to move"),
+        destination_path: str = Query(..., description="New path"),
+        overwrite: bool = Query(False, description="Replace an existing file or empty directory"),
+    ):
+        """
+        Moves a file or directory tree. Within one filesystem this is a single
+        atomic rename; otherwise the tree is copied and the source removed.
+        """
+        verify_api_token(request)
+        try:
+            src_parts, dst_parts, st = await run_io("stat", prepare_transfer, paths, source_path, destination_path, True, overwrite)
+            await run_io("write", paths.rename, source_path, destination_path, overwrite)
+        except HTTPException:
+            raise
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise_for(e, source_path, "move")
+            logging.info(f"Move across filesystems, copying: {source_path} -> {destination_path}")
+            return await run_transfer(Transfer("move", source_path, destination_path), src_parts, dst_parts, st, overwrite, True)
+        except Exception as e:
+            raise_for(e, source_path, "move")
+        logging.info(f"Moved: {source_path} -> {destination_path}")
+        return JSONResponse({"status": "success", "message": "Moved", "method": "rename"})
+
+    @app.get("/transfers/{transfer_id}")
+    async def get_transfer(request: Request, transfer_id: str):
+        """
+        Returns the progress of a copy or move: files and bytes done and total,
+        the copy methods used and the throughput.
+        """
+        verify_api_token(request)
+        transfer = manager.get(transfer_id)
+        if transfer is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transfer not found")
+        return JSONResponse(transfer.view())
+
+    @app.delete("/transfers/{transfer_id}")
+    async def cancel_transfer(request: Request, transfer_id: str):
+        """
+        Cancels a running transfer. Files already copied are kept; partial files are removed.
+        """
+        verify_api_token(request)
+        transfer = manager.get(transfer_id)
+        if transfer is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Transfer not found")
+        transfer.cancelled.set()
+        logging.info(f"Transfer cancel requested: {transfer_id}")
+        return JSONResponse(transfer.view())
+
+    @app.get("/metrics/copy/")
+    async def get_copy_metrics(request: Request):
+        """
+        Returns copy counters, including how many files each copy method handled.
+        """
+        verify_api_token(request)
+        active = sum(1 for transfer in list(manager.transfers.values()) if transfer.finished_at is None)
+        return JSONResponse(dict(COPY_STATS, active=active, workers=manager.workers))
+
+    return manager
+
+#   --- Benchmark ---
+if __name__ == "__main__":
+    import shutil
+    import tempfile
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory(dir=os.getenv("COPY_BENCHMARK_DIR")) as base_dir:
+        paths = get_path_resolver(base_dir)
+        with open(os.path.join(base_dir, "large.bin"), "wb") as file:
+            file.write(os.urandom(1024 * 1024) * 256)
+        os.mkdir(os.path.join(base_dir, "tree"))
+        for index in range(2000):
+            with open(os.path.join(base_dir, "tree", f"file_{index:04d}.txt"), "wb") as file:
+                file.write(os.urandom(16 * 1024))
+
+        def timed(label: str, func):
+            started = time.perf_counter()
+            func()
+            print(f"{label:45s} {time.perf_counter() - started:7.3f} s")
+
+        def python_copy(source: str, target: str):
+            with open(source, "rb") as src, open(target, "wb") as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+
+        timed("256 MB file, Python read/write loop", lambda: python_copy(os.path.join(base_dir, "large.bin"), os.path.join(base_dir, "large.py")))
+        transfer = Transfer("copy", "large.bin", "large.copy")
+        timed("256 MB file, copy_file", lambda: copy_file(paths, ("large.bin",), ("large.copy",), False, transfer))
+        print(f"    method: {transfer.methods}")
+        timed("2000 x 16 KB tree, shutil.copytree", lambda: shutil.copytree(os.path.join(base_dir, "tree"), os.path.join(base_dir, "tree_shutil")))
+        manager = TransferManager(paths)
+        for workers in (1, COPY_WORKERS):
+            manager.workers = workers
+            manager.stop()
+            transfer = Transfer("copy", "tree", f"tree_{workers}")
+            timed(f"2000 x 16 KB tree, TransferManager ({workers} workers)", lambda: manager.copy_tree(transfer, ("tree",), (f"tree_{workers}",), False))
+        manager.stop()
@@ -6,7 +6,11 @@ import logging
 from typing import Optional
 from fastapi import FastAPI, HTTPException, status, Query, Body, Request
 from fastapi.responses import FileResponse, JSONResponse
-from SecurityModule import safe_path, verify_api_token  #   Import security functions
+from SecurityModule import verify_api_token  #   Import security functions
+from PathModule import get_path_resolver  #   dirfd-anchored, symlink-safe path resolution
+from IOModule import run_io  #   Blocking calls run on the shared I/O pool
+from CompressionModule import compressed_response, file_version_key  #   Accept-Encoding negotiation
+from PatchModule import file_etag  #   ETag sent with /read/ for If-Match on /patch/
 from pydantic import BaseModel
 
 #   (FastAPI app instance is expected to be initialized elsewhere and passed in)
@@ -19,6 +23,7 @@ def setup_file_endpoints(app: FastAPI, base_dir: str):
         app: The FastAPI application instance.
         base_dir: The base directory for file operations.
     """
+    paths = get_path_resolver(base_dir)
 
     #   --- File Management ---
     class FileOperationResponse(BaseModel):
@@ -36,18 +41,20 @@ def setup_file_endpoints(app: FastAPI, base_dir: str):
         Creates a new file with optional content.
         """
         verify_api_token(request)
-        target_path = safe_path(base_dir, file_path)
-        if os.path.exists(target_path):
+        try:
+            await run_io("write", paths.write_text, file_path, content)  #   O_EXCL: no check-then-create race
+            logging.info(f"File created: {file_path}")
+            return JSONResponse({"status": "success", "message": "File created"})
+        except FileExistsError:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT, detail="File already exists"
             )
-        try:
-            with open(target_path, "w") as file:
-                file.write(content)
-            logging.info(f"File created: {target_path}")
-            return JSONResponse({"status": "success", "message": "File created"})
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
         except OSError as e:
-            logging.error(f"Error creating file {target_path}: {e}")
+            logging.error(f"Error creating file {file_path}: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to create file: {e}",
@@ -61,17 +68,20 @@ def setup_file_endpoints(app: FastAPI, base_dir: str):
         Deletes a specified file.
         """
         verify_api_token(request)
-        target_path = safe_path(base_dir, file_path)
-        if not os.path.exists(target_path):
+        try:
+            await run_io("delete", paths.remove, file_path)
+            logging.info(f"File deleted: {file_path}")
+            return JSONResponse({"status": "success", "message": "File deleted"})
+        except (FileNotFoundError, NotADirectoryError):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
             )
-        try:
-            os.remove(target_path)
-            logging.info(f"File deleted: {target_path}")
-            return JSONResponse({"status": "success", "message": "File deleted"})
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
         except OSError as e:
-            logging.error(f"Error deleting file {target_path}: {e}")
+            logging.error(f"Error deleting file {file_path}: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to delete file: {e}",
@@ -87,22 +97,24 @@ def setup_file_endpoints(app: FastAPI, base_dir: str):
         Renames a file.
         """
         verify_api_token(request)
-        old_path = safe_path(base_dir, old_file_path)
-        new_path = safe_path(base_dir, new_file_path)
-        if not os.path.exists(old_path):
+        try:
+            await run_io("write", paths.rename, old_file_path, new_file_path)
+            logging.info(f"File renamed from {old_file_path} to {new_file_path}")
+            return JSONResponse({"status": "success", "message": "File renamed"})
+        except (FileNotFoundError, NotADirectoryError):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
             )
-        if os.path.exists(new_path):
+        except FileExistsError:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT, detail="File already exists at new path"
             )
-        try:
-            os.rename(old_path, new_path)
-            logging.info(f"File renamed from {old_path} to {new_path}")
-            return JSONResponse({"status": "success", "message": "File renamed"})
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
         except OSError as e:
-            logging.error(f"Error renaming file from {old_path} to {new_path}: {e}")
+            logging.error(f"Error renaming file from {old_file_path} to {new_file_path}: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to rename file: {e}",
@@ -117,17 +129,23 @@ def setup_file_endpoints(app: FastAPI, base_dir: str):
         Reads the content of a specified file.
         """
         verify_api_token(request)
-        target_path = safe_path(base_dir, file_path)
-        if not os.path.isfile(target_path):
+        try:
+            content, version = await run_io("read", paths.read_text_versioned, file_path)
+            cache_key = file_version_key(file_path, version) if version is not None else None
+            response = await compressed_response(request, {"content": content}, cache_key)
+            if version is not None:
+                response.headers["ETag"] = file_etag(version)  #   For If-Match on /patch/
+            return response
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
             )
-        try:
-            with open(target_path, "r") as file:
-                content = file.read()
-            return JSONResponse({"content": content})
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
         except OSError as e:
-            logging.error(f"Error reading file {target_path}: {e}")
+            logging.error(f"Error reading file {file_path}: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to read file: {e}",
@@ -142,16 +160,19 @@ def setup_file_endpoints(app: FastAPI, base_dir: str):
         Lists files and directories in a specified path.
         """
         verify_api_token(request)
-        target_path = safe_path(base_dir, path)
-        if not os.path.exists(target_path):
+        try:
+            files = await run_io("read", paths.listdir, path)
+            return await compressed_response(request, {"files": files})
+        except (FileNotFoundError, NotADirectoryError):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Folder not found"
             )
-        try:
-            files = os.listdir(target_path)
-            return JSONResponse({"files": files})
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
         except OSError as e:
-            logging.error(f"Error listing files in {target_path}: {e}")
+            logging.error(f"Error listing files in {path}: {e}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to list files: {e}",
@@ -0,0 +1,205 @@
+#   IOModule.py
+#   Shared thread pool for blocking filesystem I/O in the AION RWX API
+
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from SecurityModule import verify_api_token
+
+#   --- Configuration ---
+#   Total number of worker threads shared by all filesystem operations
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "16"))
+#   Maximum concurrent operations per class, so e.g. recursive deletes cannot starve reads
+IO_CLASS_LIMITS: Dict[str, int] = {
+    "stat": IO_POOL_SIZE,  #   exists/isfile/getsize checks
+    "read": max(1, IO_POOL_SIZE * 3 // 4),  #   file reads and directory listings
+    "write": max(1, IO_POOL_SIZE // 2),  #   file creation, uploads, renames, mkdir
+    "delete": max(1, IO_POOL_SIZE // 4),  #   single file and empty directory removal
+    "bulk": max(1, IO_POOL_SIZE // 8),  #   recursive tree operations (rmtree, copytree)
+    "compress": max(1, min(IO_POOL_SIZE // 4, os.cpu_count() or 1)),  #   response compression (CPU-bound)
+}
+
+#   --- Executor State ---
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_stats_lock = threading.Lock()
+IO_STATS: Dict[str, Dict[str, float]] = {}  #   {op_class: counters}
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """
+    Returns the shared I/O thread pool, creating it on first use.
+
+    Returns:
+        The ThreadPoolExecutor used for all filesystem calls.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="aion-io")
+    return _executor
+
+def shutdown_io_executor():
+    """Shuts down the shared I/O thread pool, waiting for running operations to finish."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+    _semaphores.clear()
+
+def _class_stats(op_class: str) -> Dict[str, float]:
+    """Returns (creating if needed) the counters for an operation class. Caller holds _stats_lock."""
+    stats = IO_STATS.get(op_class)
+    if stats is None:
+        stats = IO_STATS[op_class] = {
+            "waiting": 0,  #   waiting for a class slot
+            "queued": 0,  #   submitted to the pool, not yet started by a worker
+            "running": 0,
+            "completed": 0,
+            "failed": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "run_seconds_total": 0.0,
+        }
+    return stats
+
+def _get_semaphore(op_class: str) -> asyncio.Semaphore:
+    """Returns the semaphore enforcing the concurrency limit of an operation class."""
+    semaphore = _semaphores.get(op_class)
+    if semaphore is None:
+        if op_class not in IO_CLASS_LIMITS:
+            raise ValueError(f"Unknown I/O operation class: {op_class}")
+        semaphore = _semaphores[op_class] = asyncio.Semaphore(IO_CLASS_LIMITS[op_class])
+    return semaphore
+
+def _release_from_thread(loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore):
+    """Releases a class slot on its event loop; called from the thread that finished the call."""
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:  #   Loop already closed: nothing can be waiting on it
+        semaphore.release()
+
+async def run_io(op_class: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Runs a blocking filesystem call on the shared I/O pool without blocking the event loop.
+
+    Args:
+        op_class: The operation class (a key of IO_CLASS_LIMITS) used for concurrency limits and metrics.
+        func: The blocking function to call.
+        *args: Positional arguments for func.
+        **kwargs: Keyword arguments for func.
+
+    Returns:
+        The return value of func. Exceptions raised by func propagate unchanged.
+    """
+    semaphore = _get_semaphore(op_class)
+    enqueued = time.monotonic()
+    with _stats_lock:
+        stats = _class_stats(op_class)
+        stats["waiting"] += 1
+    try:
+        await semaphore.acquire()
+    finally:
+        with _stats_lock:
+            stats["waiting"] -= 1
+    state = {"started": False}  #   Guards the queued counter if the caller is cancelled
+    submitted = False
+    try:
+        with _stats_lock:
+            stats["queued"] += 1
+
+        def call():
+            started = time.monotonic()
+            with _stats_lock:
+                if not state.get("abandoned"):
+                    stats["queued"] -= 1
+                state["started"] = True
+                stats["running"] += 1
+                waited = started - enqueued
+                stats["wait_seconds_total"] += waited
+                stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+            ok = False
+            try:
+                result = func(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                with _stats_lock:
+                    stats["running"] -= 1
+                    stats["completed" if ok else "failed"] += 1
+                    stats["run_seconds_total"] += time.monotonic() - started
+
+        loop = asyncio.get_running_loop()
+        future = get_io_executor().submit(call)
+        submitted = True
+        #   The slot is freed when the call really ends (or is cancelled before it starts),
+        #   not when the awaiting coroutine is cancelled while the thread is still running it
+        future.add_done_callback(lambda _: _release_from_thread(loop, semaphore))
+        return await asyncio.wrap_future(future, loop=loop)
+    except asyncio.CancelledError:
+        with _stats_lock:
+            if not state["started"]:
+                state["abandoned"] = True
+                stats["queued"] -= 1
+        raise
+    finally:
+        if not submitted:
+            semaphore.release()
+
+def io_metrics() -> Dict[str, Any]:
+    """
+    Returns a snapshot of the I/O pool queue depths and per-class counters.
+
+    Returns:
+        A dictionary with pool-wide totals and a per-class breakdown.
+    """
+    with _stats_lock:
+        classes = {}
+        for op_class, limit in IO_CLASS_LIMITS.items():
+            stats = dict(_class_stats(op_class))
+            finished = stats["completed"] + stats["failed"]
+            stats["limit"] = limit
+            stats["avg_wait_ms"] = round(1000 * stats["wait_seconds_total"] / finished, 3) if finished else 0.0
+            stats["avg_run_ms"] = round(1000 * stats["run_seconds_total"] / finished, 3) if finished else 0.0
+            classes[op_class] = stats
+    return {
+        "pool_size": IO_POOL_SIZE,
+        "running": sum(s["running"] for s in classes.values()),
+        "queued": sum(s["queued"] for s in classes.values()),
+        "waiting": sum(s["waiting"] for s in classes.values()),
+        "classes": classes,
+    }
+
+def setup_io_endpoints(app: FastAPI):
+    """
+    Registers the I/O metrics endpoint and shuts the pool down with the application.
+
+    Args:
+        app: The FastAPI application instance.
+    """
+    app.router.add_event_handler("shutdown", shutdown_io_executor)
+
+    @app.get("/metrics/io/")
+    async def get_io_metrics(request: Request):
+        """
+        Returns queue-depth and latency metrics of the shared I/O pool.
+        """
+        verify_api_token(request)
+        return JSONResponse(io_metrics())
+
+#   --- Blocking Helpers (run via run_io) ---
+def write_all(fd: int, data) -> int:
+    """Writes all of data to a file descriptor, looping over short writes."""
+    view = memoryview(data)
+    total = len(view)
+    while view:
+        count = os.write(fd, view)
+        view = view[count:]
+    return total
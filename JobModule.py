@@ -0,0 +1,458 @@
+#   JobModule.py
+#   Background job queue for long-running whitelisted commands in the AION RWX API
+
+import os
+import json
+import base64
+import time
+import uuid
+import shlex
+import heapq
+import logging
+import threading
+import subprocess
+from typing import Any, Callable, Dict, List, Optional
+from fastapi import FastAPI, HTTPException, status, Query, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, validator
+from SecurityModule import verify_api_token
+from IOModule import run_io
+from CommandCacheModule import note_fs_change
+
+#   --- Configuration ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))  #   Maximum number of jobs running at once
+JOB_DIR = os.getenv("JOB_DIR", os.path.join(os.path.expanduser("~"), ".aion", "jobs"))  #   Job records and output; must be outside BASE_DIRECTORY
+JOB_TIMEOUT = 3600  #   Seconds before a running job is killed
+JOB_RESULT_TTL = 3600  #   Seconds a finished job (status and output) is retained
+JOB_MAX_QUEUED = 1000  #   Maximum number of queued jobs
+JOB_OUTPUT_CHUNK = 65536  #   Default number of output bytes returned per poll
+JOB_OUTPUT_MAX_CHUNK = 1048576  #   Maximum number of output bytes returned per poll
+JOB_REAP_INTERVAL = 60  #   Seconds between retention sweeps
+JOB_KILL_GRACE = 5  #   Seconds between SIGTERM and SIGKILL when cancelling
+
+FINISHED_STATES = ("succeeded", "failed", "cancelled", "timed_out", "interrupted")
+
+def utf8_boundary(data: bytes) -> int:
+    """Returns the length of data without a trailing incomplete UTF-8 sequence."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            return len(data)
+        if byte >= 0xC0:  #   Lead byte: 110xxxxx, 1110xxxx or 11110xxx
+            needed = 2 if byte < 0xE0 else 3 if byte < 0xF0 else 4
+            return len(data) if back >= needed else len(data) - back
+    return len(data)  #   Only continuation bytes: invalid, decoded with replacement characters
+
+class SubmitJobRequest(BaseModel):
+    command: str
+    priority: int = 5  #   0 (highest) to 9 (lowest)
+    #   Request model for /jobs/ endpoint
+
+    @validator("command")
+    def sanitize_command(cls, value: str):
+        """Strips surrounding whitespace (same as /execute/)."""
+        return value.strip()
+
+    @validator("priority")
+    def check_priority(cls, value: int):
+        """Restricts priority to the 0-9 range."""
+        if not 0 <= value <= 9:
+            raise ValueError("priority must be between 0 and 9")
+        return value
+
+class JobManager:
+    """
+    Runs submitted commands on a bounded pool of worker threads, in priority order.
+
+    Each job is persisted as <job_dir>/<id>.json and its combined stdout/stderr is
+    written to <job_dir>/<id>.log, so queued jobs survive a restart and clients can
+    fetch output incrementally by byte offset. Finished jobs are deleted after
+    JOB_RESULT_TTL seconds. Commands are checked against the whitelist again when
+    restored and before they run, so a record on disk is never trusted on its own.
+    """
+
+    def __init__(self, job_dir: str, is_command_allowed: Callable[[str], bool], workers: int = JOB_WORKERS):
+        self.job_dir = job_dir
+        self.is_command_allowed = is_command_allowed
+        self.workers = workers
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.processes: Dict[str, subprocess.Popen] = {}
+        self.queue: List[tuple] = []  #   heap of (priority, sequence, job_id)
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.threads: List[threading.Thread] = []
+        self.stopping = False
+
+    #   --- Persistence ---
+    def record_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def output_path(self, job_id: str) -> str:
+        return os.path.join(self.job_dir, f"{job_id}.log")
+
+    def save(self, job: Dict[str, Any]):
+        """Atomically writes a job record to disk."""
+        path = self.record_path(job["id"])
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump(job, file)
+        os.replace(temp_path, path)
+
+    def load(self):
+        """
+        Restores job records from disk. Queued jobs are re-queued unless their command
+        is no longer allowed, in which case they are marked "failed"; jobs that were
+        running when the previous worker stopped are marked "interrupted".
+        """
+        os.makedirs(self.job_dir, mode=0o700, exist_ok=True)
+        restored = []
+        for name in os.listdir(self.job_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.job_dir, name), "r") as file:
+                    job = json.load(file)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error(f"Skipping unreadable job record {name}: {e}")
+                continue
+            if not isinstance(job, dict) or not isinstance(job.get("command"), str) or job.get("status") not in ("queued", "running") + FINISHED_STATES \
+                    or not isinstance(job.get("priority"), int) or not isinstance(job.get("created_at"), (int, float)):
+                logging.error(f"Skipping malformed job record {name}")
+                continue
+            for field in ("returncode", "error", "started_at", "finished_at"):
+                job.setdefault(field, None)
+            if job["status"] in FINISHED_STATES and not isinstance(job["finished_at"], (int, float)):
+                job["finished_at"] = time.time()  #   The reaper needs it
+            job["id"] = name[:-len(".json")]  #   The file name, not the record, decides where the job is saved
+            if job["status"] == "queued" and not self.is_command_allowed(str(job.get("command", ""))):
+                logging.warning(f"Not restoring job {job['id']}: command not allowed: {job.get('command')}")
+                job["status"] = "failed"
+                job["finished_at"] = time.time()
+                job["error"] = "Command not allowed"
+                self.save(job)
+            elif job["status"] == "running":
+                job["status"] = "interrupted"
+                job["finished_at"] = time.time()
+                job["error"] = "Worker restarted while the job was running"
+                self.save(job)
+            restored.append(job)
+        with self.lock:
+            for job in sorted(restored, key=lambda j: j["created_at"]):
+                self.jobs[job["id"]] = job
+                if job["status"] == "queued":
+                    self.push(job)
+        if restored:
+            logging.info(f"Restored {len(restored)} job records from {self.job_dir}")
+
+    #   --- Queue ---
+    def push(self, job: Dict[str, Any]):
+        """Adds a job to the priority queue. Caller holds self.lock."""
+        self.sequence += 1
+        heapq.heappush(self.queue, (job["priority"], self.sequence, job["id"]))
+        self.available.notify()
+
+    def start(self):
+        """Restores persisted jobs and starts the worker and retention threads."""
+        self.load()
+        self.stopping = False
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.worker, name=f"aion-job-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        reaper = threading.Thread(target=self.reaper, name="aion-job-reaper", daemon=True)
+        reaper.start()
+        self.threads.append(reaper)
+
+    def stop(self):
+        """Stops the workers. Running jobs are left to finish; queued jobs stay on disk."""
+        with self.lock:
+            self.stopping = True
+            self.available.notify_all()
+
+    def submit(self, command: str, priority: int) -> Dict[str, Any]:
+        """
+        Queues a command and returns its job record.
+
+        Raises:
+            HTTPException: 503 Service Unavailable if the queue is full.
+        """
+        job = {
+            "id": uuid.uuid4().hex,
+            "command": command,
+            "priority": priority,
+            "status": "queued",
+            "returncode": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self.lock:
+            if len(self.queue) >= JOB_MAX_QUEUED:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Job queue is full"
+                )
+            self.jobs[job["id"]] = job
+            self.save(job)
+            self.push(job)
+        logging.info(f"Job queued: {job['id']} (priority={priority}) {command}")
+        return dict(job)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancels a queued or running job. Returns the job record, or None if unknown."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                job["status"] = "cancelled"
+                job["finished_at"] = time.time()
+                self.save(job)  #   The worker skips it when it is dequeued
+            elif job["status"] == "running":
+                job["cancel_requested"] = True
+                process = self.processes.get(job_id)
+                if process is not None:
+                    process.terminate()
+                    timer = threading.Timer(JOB_KILL_GRACE, self.kill_if_running, args=(process,))
+                    timer.daemon = True
+                    timer.start()
+            return dict(job)
+
+    @staticmethod
+    def kill_if_running(process: subprocess.Popen):
+        if process.poll() is None:
+            process.kill()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    #   --- Workers ---
+    def worker(self):
+        """Takes the highest-priority queued job and runs it, until stop() is called."""
+        while True:
+            with self.lock:
+                while not self.queue and not self.stopping:
+                    self.available.wait()
+                if self.stopping:
+                    return
+                _, _, job_id = heapq.heappop(self.queue)
+                job = self.jobs.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue  #   Cancelled or reaped while queued
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                self.save(job)
+            self.run(job)
+
+    def run(self, job: Dict[str, Any]):
+        """Runs one job, streaming its output to the job's log file."""
+        job_id = job["id"]
+        logging.info(f"Job started: {job_id} {job['command']}")
+        result: Dict[str, Any] = {}
+        try:
+            if not self.is_command_allowed(job["command"]):
+                logging.warning(f"Refusing to run job {job_id}: command not allowed: {job['command']}")
+                raise ValueError("Command not allowed")
+            with open(self.output_path(job_id), "wb") as output:
+                process = subprocess.Popen(
+                    shlex.split(job["command"]),
+                    stdout=output,
+                    stderr=subprocess.STDOUT,
+                )
+                with self.lock:
+                    self.processes[job_id] = process
+                    if job.get("cancel_requested"):
+                        process.terminate()
+                try:
+                    result["returncode"] = process.wait(timeout=JOB_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                    result["status"] = "timed_out"
+                    result["error"] = f"Job exceeded {JOB_TIMEOUT} seconds"
+        except (OSError, ValueError) as e:
+            result["status"] = "failed"
+            result["error"] = str(e)
+        with self.lock:
+            self.processes.pop(job_id, None)
+            if "status" not in result:
+                if job.get("cancel_requested"):
+                    result["status"] = "cancelled"
+                elif result["returncode"] == 0:
+                    result["status"] = "succeeded"
+                else:
+                    result["status"] = "failed"
+            job.update(result)
+            job["finished_at"] = time.time()
+            self.save(job)
+        note_fs_change()  #   The command may have changed files after the submitting request bumped the generation
+        logging.info(f"Job finished: {job_id} status={job['status']} returncode={job['returncode']}")
+
+    def reaper(self):
+        """Deletes finished jobs older than JOB_RESULT_TTL, together with their output."""
+        while not self.stopping:
+            time.sleep(JOB_REAP_INTERVAL)
+            self.reap()
+
+    def reap(self):
+        now = time.time()
+        with self.lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job["status"] in FINISHED_STATES and now - job["finished_at"] > JOB_RESULT_TTL
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+        for job_id in expired:
+            for path in (self.record_path(job_id), self.output_path(job_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    logging.error(f"Error removing expired job file {path}: {e}")
+        if expired:
+            logging.info(f"Removed {len(expired)} expired jobs")
+
+    def read_output(self, job_id: str, offset: int, limit: int) -> bytes:
+        """Reads up to limit bytes of a job's output starting at offset."""
+        try:
+            with open(self.output_path(job_id), "rb") as output:
+                output.seek(offset)
+                return output.read(limit)
+        except FileNotFoundError:
+            return b""
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns the public fields of a job record."""
+    return {key: value for key, value in job.items() if key != "cancel_requested"}
+
+def setup_job_endpoints(app: FastAPI, base_dir: str, is_command_allowed: Callable[[str], bool], job_dir: str = JOB_DIR) -> JobManager:
+    """
+    Sets up the background job endpoints (submit, status, output, cancel).
+
+    Args:
+        app: The FastAPI application instance.
+        base_dir: The base directory served by the API.
+        is_command_allowed: The whitelist check applied to submitted, restored and started commands.
+        job_dir: Where job records and output are kept. It must not be inside base_dir,
+                 since API clients can write there and could plant job records.
+
+    Returns:
+        The JobManager serving the endpoints.
+
+    Raises:
+        ValueError: If job_dir is inside base_dir.
+    """
+    job_root, base_root = os.path.realpath(job_dir), os.path.realpath(base_dir)
+    if os.path.commonpath([job_root, base_root]) == base_root:
+        raise ValueError(f"JOB_DIR must be outside BASE_DIRECTORY: {job_dir}")
+    manager = JobManager(job_root, is_command_allowed)
+    app.router.add_event_handler("startup", manager.start)
+    app.router.add_event_handler("shutdown", manager.stop)
+
+    def get_job_or_404(job_id: str) -> Dict[str, Any]:
+        job = manager.get(job_id)
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+            )
+        return job
+
+    @app.post("/jobs/", status_code=status.HTTP_202_ACCEPTED)
+    async def submit_job(request: Request, job_request: SubmitJobRequest):
+        """
+        Queues a whitelisted command and returns its job id immediately.
+
+        Raises:
+            HTTPException: 400 Bad Request if the command is empty.
+            HTTPException: 403 Forbidden if the command is not allowed.
+            HTTPException: 503 Service Unavailable if the queue is full.
+        """
+        verify_api_token(request)
+        command = job_request.command
+        if not command:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Command cannot be empty"
+            )
+        if not is_command_allowed(command):
+            logging.warning(f"Unauthorized job command attempt: {command}")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Command not allowed"
+            )
+        job = await run_io("write", manager.submit, command, job_request.priority)
+        return JSONResponse(job_view(job), status_code=status.HTTP_202_ACCEPTED)
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(request: Request, job_id: str):
+        """
+        Returns the status of a job, including the current size of its output.
+        """
+        verify_api_token(request)
+        job = job_view(get_job_or_404(job_id))
+        try:
+            job["output_size"] = await run_io("stat", os.path.getsize, manager.output_path(job_id))
+        except OSError:
+            job["output_size"] = 0
+        return JSONResponse(job)
+
+    @app.get("/jobs/{job_id}/output")
+    async def get_job_output(
+        request: Request,
+        job_id: str,
+        offset: int = Query(0, ge=0, description="Byte offset to read from"),
+        limit: int = Query(JOB_OUTPUT_CHUNK, ge=1, le=JOB_OUTPUT_MAX_CHUNK, description="Maximum bytes to return"),
+        encoding: str = Query("utf-8", description="Output encoding: utf-8 or base64"),
+    ):
+        """
+        Returns job output from a byte offset. Poll again with next_offset until
+        complete is true to follow the output of a running job.
+        """
+        verify_api_token(request)
+        if encoding not in ("utf-8", "base64"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="encoding must be utf-8 or base64")
+        job = get_job_or_404(job_id)
+        finished = job["status"] in FINISHED_STATES
+        if encoding == "base64":
+            data = await run_io("read", manager.read_output, job_id, offset, limit)
+            exhausted = len(data) < limit
+            output = base64.b64encode(data).decode("ascii")
+        else:
+            #   A character split by limit (or still being written) is left for the next poll.
+            #   Up to 3 extra bytes are read so a character longer than limit is still returned whole.
+            raw = await run_io("read", manager.read_output, job_id, offset, limit + 3)
+            end = utf8_boundary(raw[:limit]) or utf8_boundary(raw[:4])
+            if not end and finished:
+                end = len(raw[:limit])  #   Output ends in a truncated character: return it with a replacement character
+            data = raw[:end]
+            exhausted = end == len(raw) and len(raw) < limit + 3
+            output = data.decode("utf-8", errors="replace")
+        next_offset = offset + len(data)
+        return JSONResponse({
+            "id": job_id,
+            "status": job["status"],
+            "offset": offset,
+            "next_offset": next_offset,
+            "output": output,
+            "encoding": encoding,
+            "complete": finished and exhausted,
+        })
+
+    @app.delete("/jobs/{job_id}")
+    async def cancel_job(request: Request, job_id: str):
+        """
+        Cancels a queued or running job. Finished jobs are left unchanged.
+        """
+        verify_api_token(request)
+        job = await run_io("write", manager.cancel, job_id)
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Job not found"
+            )
+        logging.info(f"Job cancel requested: {job_id}")
+        return JSONResponse(job_view(job))
+
+    return manager
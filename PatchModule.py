@@ -0,0 +1,453 @@
+#   PatchModule.py
+#   In-place ranged edits (byte ranges, line ranges, unified diffs) for the AION RWX API
+
+import os
+import re
+import uuid
+import fcntl
+import base64
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, status, Query, Body, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, validator
+from SecurityModule import verify_api_token
+from PathModule import get_path_resolver, PathResolver
+from IOModule import run_io
+
+#   --- Configuration ---
+PATCH_REQUIRE_IF_MATCH = False  #   Reject patches without an If-Match header (428)
+PATCH_COPY_CHUNK = 1024 * 1024  #   Bytes per copy_file_range call when rewriting a file
+PATCH_OPEN_RETRIES = 5  #   Attempts to lock the current file while other patches replace it
+PATCH_MODES = ("bytes", "lines", "diff")
+PATCH_GENERATIONS = 4096  #   Inodes whose patch count is remembered for their ETags
+
+HUNK_HEADER = re.compile(rb"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+class PreconditionFailed(Exception):
+    """Raised when If-Match does not match the file's current ETag."""
+
+class PatchConflict(ValueError):
+    """Raised when a diff's context or removed lines do not match the file."""
+
+class LineRangeError(ValueError):
+    """Raised when a line number is past the end of the file."""
+
+    def __init__(self, message: str, line_count: int):
+        super().__init__(message)
+        self.line_count = line_count
+
+#   Patches per (device, inode). Two same-size writes within one timestamp tick leave
+#   mtime and ctime unchanged, so every patch also bumps this counter (under the flock).
+_generations: "OrderedDict[Tuple[int, int], int]" = OrderedDict()
+_generations_lock = threading.Lock()
+
+def bump_generation(st: os.stat_result):
+    """Records a new version of the file behind st. Called while the file is locked."""
+    key = (st.st_dev, st.st_ino)
+    with _generations_lock:
+        _generations[key] = _generations.pop(key, 0) + 1
+        while len(_generations) > PATCH_GENERATIONS:
+            _generations.popitem(last=False)
+
+def file_etag(st: os.stat_result) -> str:
+    """
+    Returns the ETag of a file version (inode, mtime, ctime, size and patch generation),
+    as a quoted string. ctime cannot be set back with utime(), unlike mtime.
+    /read/ sends the same value, so clients can use it in If-Match.
+    """
+    with _generations_lock:
+        generation = _generations.get((st.st_dev, st.st_ino), 0)
+    return f'"{st.st_ino:x}-{st.st_mtime_ns:x}-{st.st_ctime_ns:x}-{st.st_size:x}-{generation:x}"'
+
+class PatchRequest(BaseModel):
+    mode: str  #   "bytes", "lines" or "diff"
+    #   bytes: write data at offset (in place)
+    offset: Optional[int] = None
+    data: Optional[str] = None
+    encoding: str = "utf-8"  #   "utf-8" or "base64" for data
+    #   lines: replace lines start_line..end_line (1-based, inclusive) with content;
+    #   end_line = start_line - 1 inserts before start_line
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    content: Optional[str] = None
+    #   diff: a unified diff of one file
+    diff: Optional[str] = None
+    #   Request model for /patch/ endpoint
+
+    @validator("mode")
+    def check_mode(cls, value: str):
+        if value not in PATCH_MODES:
+            raise ValueError(f"mode must be one of {', '.join(PATCH_MODES)}")
+        return value
+
+    @validator("encoding")
+    def check_encoding(cls, value: str):
+        if value not in ("utf-8", "base64"):
+            raise ValueError("encoding must be utf-8 or base64")
+        return value
+
+def check_if_match(if_match: Optional[str], st: os.stat_result):
+    """
+    Validates an If-Match header against the file's current ETag.
+
+    Raises:
+        PreconditionFailed: If no listed ETag matches (or the header is missing and required).
+    """
+    if if_match is None:
+        if PATCH_REQUIRE_IF_MATCH:
+            raise PreconditionFailed("If-Match header required")
+        return
+    tags = [tag.strip() for tag in if_match.split(",")]
+    if "*" not in tags and file_etag(st) not in tags:
+        raise PreconditionFailed(f"ETag mismatch, current ETag is {file_etag(st)}")
+
+def open_locked(paths: PathResolver, dir_fd: int, name: str, flags: int = os.O_RDWR, blocking: bool = True) -> int:
+    """
+    Opens a file for patching and takes an exclusive flock on it. Patches that
+    rewrite a file replace its inode, so after locking we make sure the descriptor
+    still refers to the file at the path (otherwise the lock would guard a stale copy).
+    With blocking=False a file locked by another writer raises BlockingIOError at once.
+    """
+    for _ in range(PATCH_OPEN_RETRIES):
+        fd = paths.open_component(dir_fd, name, flags)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+    raise BlockingIOError("File is being replaced concurrently")
+
+def copy_range(src_fd: int, dst_fd: int, offset: int, end: int):
+    """Copies src[offset:end] to the current position of dst in the kernel where possible."""
+    while offset < end:
+        count = min(PATCH_COPY_CHUNK, end - offset)
+        if hasattr(os, "copy_file_range"):
+            try:
+                copied = os.copy_file_range(src_fd, dst_fd, count, offset)
+            except OSError:
+                copied = os.write(dst_fd, os.pread(src_fd, count, offset))  #   e.g. across filesystems on old kernels
+        else:
+            copied = os.write(dst_fd, os.pread(src_fd, count, offset))
+        if copied == 0:
+            break
+        offset += copied
+
+def line_offsets(src_fd: int, wanted: List[int]) -> Dict[int, int]:
+    """
+    Returns the byte offset at which each wanted (1-based) line starts, reading the
+    file sequentially in chunks. Line count + 1 (the position for appending) maps to
+    the file size.
+
+    Raises:
+        LineRangeError: If a wanted line is beyond line count + 1.
+    """
+    offsets: Dict[int, int] = {}
+    targets = sorted(set(wanted))
+    index = 0
+    line, position = 1, 0
+    while index < len(targets) and targets[index] <= 1:
+        offsets[targets[index]] = 0
+        index += 1
+    while index < len(targets):
+        chunk = os.pread(src_fd, PATCH_COPY_CHUNK, position)
+        if not chunk:
+            break
+        start = 0
+        while index < len(targets):
+            newline = chunk.find(b"\n", start)
+            if newline < 0:
+                break
+            line += 1
+            start = newline + 1
+            while index < len(targets) and targets[index] == line:
+                offsets[line] = position + start
+                index += 1
+        position += len(chunk)
+    if index < len(targets):
+        open_end = position > 0 and os.pread(src_fd, 1, position - 1) != b"\n"
+        line_count = line if open_end else line - 1
+        for target in targets[index:]:
+            if target > line_count + 1:
+                raise LineRangeError(f"line {target} is past the end of the file ({line_count} lines)", line_count)
+            offsets[target] = position  #   Appending after the last line
+    return offsets
+
+def needs_separator(src_fd: int, offset: int, size: int) -> bool:
+    """True when inserting at offset would join the file's unterminated last line."""
+    return offset == size > 0 and os.pread(src_fd, 1, size - 1) != b"\n"
+
+def rewrite_file(dir_fd: int, name: str, src_fd: int, write_body) -> os.stat_result:
+    """
+    Writes a new version of a file to a temporary file in the same directory with
+    write_body(temp_fd), then atomically renames it over the original. The original's
+    permission bits are preserved.
+
+    Returns:
+        The stat result of the new file.
+    """
+    temp_name = f".patch-{uuid.uuid4().hex}"
+    temp_fd = os.open(temp_name, os.O_RDWR | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o600, dir_fd=dir_fd)  #   Readable for verification
+    try:
+        try:
+            fcntl.flock(temp_fd, fcntl.LOCK_EX)  #   Readers and patches of the new version wait for its generation
+            os.fchmod(temp_fd, os.fstat(src_fd).st_mode & 0o7777)
+            write_body(temp_fd)
+            os.fsync(temp_fd)
+            os.replace(temp_name, name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+            new_stat = os.fstat(temp_fd)  #   After the rename, which updates ctime
+            bump_generation(new_stat)  #   The inode number may be one reused from an older file
+        finally:
+            os.close(temp_fd)
+    except BaseException:
+        try:
+            os.unlink(temp_name, dir_fd=dir_fd)
+        except OSError:
+            pass
+        raise
+    return new_stat
+
+def patch_bytes(fd: int, patch: PatchRequest) -> os.stat_result:
+    """Writes data at offset in place with pwrite (the file may grow, but not gain holes)."""
+    if patch.offset is None or patch.data is None:
+        raise ValueError("bytes mode requires offset and data")
+    data = base64.b64decode(patch.data, validate=True) if patch.encoding == "base64" else patch.data.encode("utf-8")
+    size = os.fstat(fd).st_size
+    if not 0 <= patch.offset <= size:
+        raise ValueError(f"offset must be between 0 and the file size ({size})")
+    written = 0
+    while written < len(data):
+        written += os.pwrite(fd, data[written:], patch.offset + written)
+    os.fsync(fd)
+    new_stat = os.fstat(fd)
+    bump_generation(new_stat)
+    return new_stat
+
+def patch_lines(dir_fd: int, name: str, fd: int, patch: PatchRequest) -> os.stat_result:
+    """Replaces a range of lines, copying the unchanged parts in the kernel."""
+    if patch.start_line is None or patch.content is None:
+        raise ValueError("lines mode requires start_line and content")
+    start_line = patch.start_line
+    end_line = patch.end_line if patch.end_line is not None else start_line
+    if start_line < 1 or end_line < start_line - 1:
+        raise ValueError("invalid line range")
+    try:
+        offsets = line_offsets(fd, [start_line, end_line + 1])
+    except LineRangeError as e:
+        if patch.end_line is not None or start_line > e.line_count + 1:
+            raise LineRangeError(f"line range {start_line}-{end_line} is past the end of the file ({e.line_count} lines)", e.line_count)
+        end_line = start_line - 1  #   Only start_line, at line count + 1: append
+        offsets = line_offsets(fd, [start_line])
+    size = os.fstat(fd).st_size
+    content = patch.content.encode("utf-8")
+    if content and not content.endswith(b"\n") and offsets[end_line + 1] < size:
+        content += b"\n"  #   Keep the following line on its own line
+    if content and needs_separator(fd, offsets[start_line], size):
+        content = b"\n" + content  #   Appending after a last line without a newline
+
+    def write_body(temp_fd: int):
+        copy_range(fd, temp_fd, 0, offsets[start_line])
+        os.write(temp_fd, content)
+        copy_range(fd, temp_fd, offsets[end_line + 1], size)
+
+    return rewrite_file(dir_fd, name, fd, write_body)
+
+def parse_unified_diff(diff: bytes) -> List[Tuple[int, bytes, bytes, int]]:
+    """
+    Parses a single-file unified diff. Header lines (---, +++, diff, index) and
+    anything between hunks are ignored; hunk bodies are read using the line counts
+    from their @@ headers.
+
+    Returns:
+        A list of hunks as (old start line, old text, new text, old line count), where the texts
+        include line terminators ("\\ No newline at end of file" is honoured).
+    """
+    hunks: List[Tuple[int, bytes, bytes, int]] = []
+    lines = diff.split(b"\n")
+    index = 0
+    while index < len(lines):
+        match = HUNK_HEADER.match(lines[index])
+        index += 1
+        if not match:
+            continue
+        old_start = int(match.group(1))
+        old_count = int(match.group(2)) if match.group(2) is not None else 1
+        new_count = int(match.group(4)) if match.group(4) is not None else 1
+        if old_count == 0:
+            old_start += 1  #   Pure insertion after line old_start
+        old_lines: List[bytes] = []
+        new_lines: List[bytes] = []
+        touched: List[List[bytes]] = []
+        while len(old_lines) < old_count or len(new_lines) < new_count or (index < len(lines) and lines[index].startswith(b"\\")):
+            if index >= len(lines):
+                raise ValueError("diff ends inside a hunk")
+            line = lines[index]
+            index += 1
+            if line.startswith(b"\\"):
+                for target in touched:  #   The previous line has no trailing newline
+                    target[-1] = target[-1][:-1]
+                continue
+            kind, text = line[:1], line[1:] + b"\n"
+            if kind in (b" ", b""):
+                old_lines.append(text)
+                new_lines.append(text)
+                touched = [old_lines, new_lines]
+            elif kind == b"-":
+                old_lines.append(text)
+                touched = [old_lines]
+            elif kind == b"+":
+                new_lines.append(text)
+                touched = [new_lines]
+            else:
+                raise ValueError(f"Invalid diff line: {line[:80]!r}")
+        if len(old_lines) != old_count or len(new_lines) != new_count:
+            raise ValueError(f"Hunk at line {old_start} does not match its header counts")
+        hunks.append((old_start, b"".join(old_lines), b"".join(new_lines), old_count))
+    if not hunks:
+        raise ValueError("diff contains no hunks")
+    return hunks
+
+def patch_diff(dir_fd: int, name: str, fd: int, patch: PatchRequest) -> os.stat_result:
+    """Applies a unified diff, verifying every context and removed line."""
+    if not patch.diff:
+        raise ValueError("diff mode requires diff")
+    hunks = parse_unified_diff(patch.diff.encode("utf-8"))
+    wanted = []
+    for old_start, _, _, old_count in hunks:
+        wanted += [old_start, old_start + old_count]
+    offsets = line_offsets(fd, wanted)
+    size = os.fstat(fd).st_size
+    previous_end = 1
+    for old_start, old_text, _, old_count in hunks:
+        if old_start < previous_end:
+            raise ValueError("hunks overlap or are out of order")
+        start, end = offsets[old_start], offsets[old_start + old_count]
+        if os.pread(fd, end - start, start) != old_text:
+            raise PatchConflict(f"Hunk at line {old_start} does not apply")
+        previous_end = old_start + old_count
+
+    def write_body(temp_fd: int):
+        position = 0
+        for old_start, _, new_text, old_count in hunks:
+            copy_range(fd, temp_fd, position, offsets[old_start])
+            if new_text:
+                if needs_separator(fd, offsets[old_start], size):
+                    os.write(temp_fd, b"\n")
+                os.write(temp_fd, new_text)
+            position = offsets[old_start + old_count]
+        copy_range(fd, temp_fd, position, size)
+
+    return rewrite_file(dir_fd, name, fd, write_body)
+
+def apply_patch(paths: PathResolver, file_path: str, patch: PatchRequest, if_match: Optional[str]) -> os.stat_result:
+    """
+    Applies a patch to an existing file under an exclusive lock (blocking; run through run_io).
+
+    Byte-range writes are done in place with pwrite. Line-range and diff edits build
+    the new file next to the original, copying unchanged ranges with copy_file_range,
+    and replace it atomically, so readers never see a half-edited file.
+
+    Returns:
+        The stat result of the patched file.
+
+    Raises:
+        PreconditionFailed: If If-Match does not match the current ETag.
+        PatchConflict: If a diff does not apply.
+        ValueError: For invalid ranges or parameters.
+    """
+    handle, name = paths.parent(file_path)
+    try:
+        fd = open_locked(paths, handle.fd, name)
+        try:
+            check_if_match(if_match, os.fstat(fd))
+            if patch.mode == "bytes":
+                return patch_bytes(fd, patch)
+            if patch.mode == "lines":
+                return patch_lines(handle.fd, name, fd, patch)
+            return patch_diff(handle.fd, name, fd, patch)
+        finally:
+            os.close(fd)  #   Releases the lock
+    finally:
+        paths.release(handle)
+
+def setup_patch_endpoints(app: FastAPI, base_dir: str):
+    """
+    Sets up the ranged edit endpoint.
+
+    Args:
+        app: The FastAPI application instance.
+        base_dir: The base directory for file operations.
+    """
+    paths = get_path_resolver(base_dir)
+
+    @app.patch("/patch/")
+    async def patch_file(
+        request: Request,
+        file_path: str = Query(..., description="Path of the file to patch"),
+        patch: PatchRequest = Body(..., description="The edit to apply"),
+    ):
+        """
+        Applies a byte-range write, line-range replacement or unified diff to an existing file.
+
+        Send the ETag from /read/ (or a previous patch) in If-Match so that concurrent
+        edits are detected instead of silently overwritten.
+
+        Args:
+            request: The incoming request.
+            file_path: The path of the file to patch.
+            patch: The edit (see PatchRequest).
+
+        Returns:
+            A JSON response with the new ETag and size (also sent as the ETag header).
+
+        Raises:
+            HTTPException: 400 Bad Request for invalid ranges or parameters.
+            HTTPException: 404 Not Found if the file does not exist.
+            HTTPException: 409 Conflict if a diff does not apply.
+            HTTPException: 412 Precondition Failed if If-Match does not match.
+            HTTPException: 416 Range Not Satisfiable if a line is past the end of the file.
+            HTTPException: 428 Precondition Required if If-Match is required and missing.
+            HTTPException: 500 Internal Server Error if an error occurs while writing.
+        """
+        verify_api_token(request)
+        if_match = request.headers.get("if-match")
+        try:
+            new_stat = await run_io("write", apply_patch, paths, file_path, patch, if_match)
+        except PreconditionFailed as e:
+            raise HTTPException(
+                status_code=status.HTTP_428_PRECONDITION_REQUIRED if if_match is None else status.HTTP_412_PRECONDITION_FAILED,
+                detail=str(e),
+            )
+        except PatchConflict as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except LineRangeError as e:
+            raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, detail=str(e))
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+            )
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
+        except BlockingIOError as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except OSError as e:
+            logging.error(f"Error patching file {file_path}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to patch file: {e}",
+            )
+        etag = file_etag(new_stat)
+        logging.info(f"File patched: {file_path} (mode={patch.mode}, size={new_stat.st_size})")
+        return JSONResponse(
+            {"status": "success", "message": "File patched", "etag": etag, "size": new_stat.st_size},
+            headers={"ETag": etag},
+        )
@@ -0,0 +1,429 @@
+#   PathModule.py
+#   dirfd-anchored path resolution for the AION RWX API
+#
+#   Instead of building an absolute path string and then checking and opening it in
+#   separate steps, the resolver keeps an open descriptor for the base directory and
+#   walks paths one component at a time with *at() system calls (os.open(dir_fd=...),
+#   os.stat(dir_fd=...), ...). Symbolic links are never followed, so a link inside the
+#   tree cannot lead outside it, and the object that was checked is the object that is
+#   used. Descriptors of recently used directories are cached, so hot subtrees resolve
+#   with a single openat() for the final component.
+
+import os
+import stat
+import time
+import errno
+import fcntl
+import shutil
+import ctypes
+import ctypes.util
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from SecurityModule import safe_path
+
+#   --- Configuration ---
+PATH_CACHE_SIZE = 256  #   Maximum number of cached directory descriptors
+PATH_CACHE_TTL = 5.0  #   Seconds before a cached directory is re-resolved (bounds staleness from external changes)
+PATH_SPLIT_CACHE_SIZE = 4096  #   Cached request path -> components translations
+
+O_PATH = getattr(os, "O_PATH", os.O_RDONLY)  #   O_PATH is Linux-only
+O_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+DIR_FLAGS = O_PATH | os.O_DIRECTORY | os.O_NOFOLLOW | O_CLOEXEC
+RENAME_NOREPLACE = 1  #   renameat2() flag (linux/fs.h)
+
+try:
+    _renameat2 = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True).renameat2  #   glibc >= 2.28
+    _renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+except (OSError, AttributeError):
+    _renameat2 = None
+
+class SymlinkError(PermissionError):
+    """Raised when a path component is a symbolic link."""
+
+@lru_cache(maxsize=PATH_SPLIT_CACHE_SIZE)
+def split_path(base_dir: str, sub_path: Optional[str]) -> Tuple[str, ...]:
+    """
+    Translates a request path into components relative to base_dir.
+    Uses safe_path for decoding and containment, so the same paths are rejected (403/400).
+
+    Args:
+        base_dir: The base directory.
+        sub_path: The (URL-encoded) path from the request.
+
+    Returns:
+        A tuple of path components; empty for the base directory itself.
+    """
+    full_path = safe_path(base_dir, sub_path)
+    relative = os.path.relpath(full_path, os.path.abspath(base_dir))
+    if relative == os.curdir:
+        return ()
+    return tuple(relative.split(os.sep))
+
+class DirHandle:
+    """A reference-counted directory descriptor shared through the resolver cache."""
+
+    __slots__ = ("fd", "refs", "expires", "evicted", "identity")
+
+    def __init__(self, fd: int, expires: float):
+        self.fd = fd
+        self.refs = 0
+        self.expires = expires
+        self.evicted = False
+        info = os.fstat(fd)
+        self.identity = (info.st_dev, info.st_ino)  #   The directory the descriptor was opened on
+
+class PathResolver:
+    """
+    Resolves and opens paths relative to an open descriptor of the base directory.
+
+    All methods are blocking and are meant to be called through IOModule.run_io.
+    Missing paths raise FileNotFoundError; symbolic links raise SymlinkError
+    (a PermissionError).
+    """
+
+    def __init__(self, base_dir: str, cache_size: int = PATH_CACHE_SIZE, ttl: float = PATH_CACHE_TTL):
+        self.base_dir = os.path.abspath(base_dir)
+        self.base_fd = os.open(self.base_dir, DIR_FLAGS & ~os.O_NOFOLLOW)
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.cache: "OrderedDict[Tuple[str, ...], DirHandle]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.base_handle = DirHandle(self.base_fd, float("inf"))
+
+    #   --- Directory Handle Cache ---
+    def acquire_dir(self, parts: Tuple[str, ...]) -> DirHandle:
+        """
+        Returns a handle for the directory at parts (relative to the base), opening
+        uncached components one at a time without following symlinks. The caller
+        must call release() when done.
+
+        A cached handle is only reused while the path still names the directory it
+        was opened on: a directory renamed away (and perhaps recreated) by another
+        process would otherwise keep serving the old one until the TTL expires.
+        """
+        if not parts:
+            return self.base_handle  #   Never closed
+        now = time.monotonic()
+        with self.lock:
+            handle = self.cache.get(parts)
+            if handle is not None and handle.expires > now:
+                self.cache.move_to_end(parts)
+                handle.refs += 1
+            else:
+                handle = None
+        if handle is not None:
+            if self.is_current(parts, handle):
+                with self.lock:
+                    self.stats["hits"] += 1
+                return handle
+            with self.lock:
+                if self.cache.get(parts) is handle:
+                    self.evict(self.cache.pop(parts))
+            self.release(handle)
+        with self.lock:
+            self.stats["misses"] += 1
+        parent = self.acquire_dir(parts[:-1])
+        try:
+            fd = self.open_component(parent.fd, parts[-1], DIR_FLAGS)
+        finally:
+            self.release(parent)
+        handle = DirHandle(fd, now + self.ttl)
+        handle.refs = 1
+        with self.lock:
+            previous = self.cache.pop(parts, None)
+            if previous is not None:
+                self.evict(previous)
+            self.cache[parts] = handle
+            while len(self.cache) > self.cache_size:
+                _, oldest = self.cache.popitem(last=False)
+                self.evict(oldest)
+        return handle
+
+    def is_current(self, parts: Tuple[str, ...], handle: DirHandle) -> bool:
+        """
+        Checks that parts still resolves to the directory behind handle: one fstatat()
+        from the base, which costs less than re-opening every component.
+        """
+        try:
+            info = os.stat(os.path.join(*parts), dir_fd=self.base_fd, follow_symlinks=False)
+        except OSError:
+            return False
+        return stat.S_ISDIR(info.st_mode) and (info.st_dev, info.st_ino) == handle.identity
+
+    def release(self, handle: DirHandle):
+        """Releases a handle returned by acquire_dir."""
+        if handle.fd == self.base_fd:
+            return
+        with self.lock:
+            handle.refs -= 1
+            if handle.evicted and handle.refs == 0:
+                os.close(handle.fd)
+
+    def evict(self, handle: DirHandle):
+        """Drops a handle from the cache, closing it once unused. Caller holds self.lock."""
+        handle.evicted = True
+        self.stats["evictions"] += 1
+        if handle.refs == 0:
+            os.close(handle.fd)
+
+    def invalidate(self, sub_path: Optional[str]):
+        """
+        Drops cached handles for a directory and everything below it.
+        Called after renames and directory deletions.
+        """
+        parts = split_path(self.base_dir, sub_path)
+        with self.lock:
+            stale = [key for key in self.cache if key[:len(parts)] == parts]
+            for key in stale:
+                self.evict(self.cache.pop(key))
+
+    def open_component(self, dir_fd: int, name: str, flags: int, mode: int = 0o644) -> int:
+        """
+        Opens one path component relative to dir_fd without following symlinks.
+
+        Raises:
+            SymlinkError: If the component is a symbolic link.
+        """
+        try:
+            return os.open(name, flags | os.O_NOFOLLOW | O_CLOEXEC, mode, dir_fd=dir_fd)
+        except OSError as e:
+            if e.errno == errno.ELOOP or (e.errno == errno.ENOTDIR and self.is_symlink(dir_fd, name)):
+                logging.warning(f"Symlink rejected: {name}")
+                raise SymlinkError(errno.EACCES, "Symbolic links are not allowed", name)
+            raise
+
+    @staticmethod
+    def is_symlink(dir_fd: int, name: str) -> bool:
+        try:
+            return stat.S_ISLNK(os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_mode)
+        except OSError:
+            return False
+
+    def parent(self, sub_path: Optional[str]) -> Tuple[DirHandle, str]:
+        """
+        Returns (handle of the parent directory, final component) for a path.
+        The caller must release the handle.
+
+        Raises:
+            PermissionError: If the path is the base directory itself.
+        """
+        parts = split_path(self.base_dir, sub_path)
+        if not parts:
+            raise PermissionError(errno.EACCES, "Operation not allowed on the base directory")
+        return self.acquire_dir(parts[:-1]), parts[-1]
+
+    #   --- Operations ---
+    def open(self, sub_path: Optional[str], flags: int, mode: int = 0o644) -> int:
+        """Opens a file relative to the base directory in one step (openat with O_NOFOLLOW)."""
+        handle, name = self.parent(sub_path)
+        try:
+            return self.open_component(handle.fd, name, flags, mode)
+        finally:
+            self.release(handle)
+
+    def lstat(self, sub_path: Optional[str]) -> os.stat_result:
+        """Returns the stat result of a path without following a final symlink."""
+        parts = split_path(self.base_dir, sub_path)
+        if not parts:
+            return os.stat(self.base_fd)
+        handle = self.acquire_dir(parts[:-1])
+        try:
+            return os.stat(parts[-1], dir_fd=handle.fd, follow_symlinks=False)
+        finally:
+            self.release(handle)
+
+    def exists(self, sub_path: Optional[str]) -> bool:
+        try:
+            self.lstat(sub_path)
+            return True
+        except (FileNotFoundError, NotADirectoryError):
+            return False
+
+    def read_text(self, sub_path: str) -> str:
+        """
+        Reads a regular file as text.
+
+        Raises:
+            IsADirectoryError: If the path is not a regular file.
+        """
+        return self.read_text_versioned(sub_path)[0]
+
+    def read_text_versioned(self, sub_path: str) -> Tuple[str, Optional[os.stat_result]]:
+        """
+        Reads a regular file as text together with the stat result of what was read.
+        The stat result is None if the file changed while it was being read, so
+        callers never key caches on a torn read. A shared flock keeps out patches
+        (PatchModule holds an exclusive one), so the stat matches the patch generation
+        in the file's ETag. The lock is not waited for (an append holds it while its
+        client sends the body): a locked file is read without it and no stat is returned.
+
+        Raises:
+            IsADirectoryError: If the path is not a regular file.
+        """
+        fd = self.open(sub_path, os.O_RDONLY | os.O_NONBLOCK)  #   O_NONBLOCK: never hang on a FIFO
+        with open(fd, "r") as file:
+            if not stat.S_ISREG(os.fstat(fd).st_mode):
+                raise IsADirectoryError(errno.EISDIR, "Not a regular file", sub_path)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)  #   Released when the file is closed
+                locked = True
+            except BlockingIOError:
+                locked = False
+            before = os.fstat(fd)
+            content = file.read()
+            after = os.fstat(fd)
+        if not locked or (before.st_mtime_ns, before.st_size) != (after.st_mtime_ns, after.st_size):
+            return content, None
+        return content, after
+
+    def write_text(self, sub_path: str, content: str, exclusive: bool = True):
+        """
+        Writes a text file. With exclusive=True the file is created with O_EXCL,
+        so an existing file raises FileExistsError instead of being overwritten.
+        """
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_EXCL if exclusive else os.O_TRUNC)
+        fd = self.open(sub_path, flags)
+        with open(fd, "w") as file:
+            file.write(content)
+
+    def listdir(self, sub_path: Optional[str]) -> List[str]:
+        """Lists a directory (opened with O_NOFOLLOW, so a symlinked directory is rejected)."""
+        parts = split_path(self.base_dir, sub_path)
+        if parts:
+            fd = self.open(sub_path, os.O_RDONLY | os.O_DIRECTORY)
+        else:
+            fd = os.open(os.curdir, os.O_RDONLY | os.O_DIRECTORY | O_CLOEXEC, dir_fd=self.base_fd)
+        try:
+            return os.listdir(fd)
+        finally:
+            os.close(fd)
+
+    def remove(self, sub_path: str):
+        """Removes a file (or symlink) without following it."""
+        handle, name = self.parent(sub_path)
+        try:
+            os.unlink(name, dir_fd=handle.fd)
+        finally:
+            self.release(handle)
+
+    def rename(self, old_sub_path: str, new_sub_path: str, replace: bool = False):
+        """
+        Renames a file or directory within the base directory.
+
+        Raises:
+            FileExistsError: If the destination exists and replace is False.
+        """
+        old_handle, old_name = self.parent(old_sub_path)
+        try:
+            new_handle, new_name = self.parent(new_sub_path)
+            try:
+                if replace:
+                    os.rename(old_name, new_name, src_dir_fd=old_handle.fd, dst_dir_fd=new_handle.fd)
+                else:
+                    self.rename_noreplace(old_handle.fd, old_name, new_handle.fd, new_name)
+            finally:
+                self.release(new_handle)
+        finally:
+            self.release(old_handle)
+        self.invalidate(old_sub_path)
+        self.invalidate(new_sub_path)
+
+    @staticmethod
+    def rename_noreplace(old_fd: int, old_name: str, new_fd: int, new_name: str):
+        """
+        Renames without replacing an existing destination, atomically: checking for
+        the destination first would let another writer create it in between.
+        Uses renameat2(RENAME_NOREPLACE); where the kernel or file system lacks it,
+        files are hard-linked then unlinked and directories are renamed over an
+        empty placeholder created with mkdir (both fail with EEXIST on a race).
+        """
+        if _renameat2 is not None:
+            if _renameat2(old_fd, os.fsencode(old_name), new_fd, os.fsencode(new_name), RENAME_NOREPLACE) == 0:
+                return
+            error = ctypes.get_errno()
+            if error not in (errno.ENOSYS, errno.EINVAL):
+                raise OSError(error, os.strerror(error), new_name)
+        if not stat.S_ISDIR(os.stat(old_name, dir_fd=old_fd, follow_symlinks=False).st_mode):
+            os.link(old_name, new_name, src_dir_fd=old_fd, dst_dir_fd=new_fd, follow_symlinks=False)
+            os.unlink(old_name, dir_fd=old_fd)
+            return
+        os.mkdir(new_name, 0o700, dir_fd=new_fd)
+        try:
+            os.rename(old_name, new_name, src_dir_fd=old_fd, dst_dir_fd=new_fd)
+        except OSError:
+            try:
+                os.rmdir(new_name, dir_fd=new_fd)
+            except OSError:
+                pass
+            raise
+
+    def mkdir(self, sub_path: str, parents: bool = False, exist_ok: bool = False):
+        """Creates a directory, optionally with missing parents (like os.makedirs)."""
+        parts = split_path(self.base_dir, sub_path)
+        if not parts:
+            if exist_ok:
+                return
+            raise FileExistsError(errno.EEXIST, "Directory exists", sub_path)
+        if parents:
+            for index in range(1, len(parts)):
+                handle = self.acquire_dir(parts[:index - 1])
+                try:
+                    os.mkdir(parts[index - 1], dir_fd=handle.fd)
+                except FileExistsError:
+                    pass
+                finally:
+                    self.release(handle)
+        handle = self.acquire_dir(parts[:-1])
+        try:
+            os.mkdir(parts[-1], dir_fd=handle.fd)
+        except FileExistsError:
+            if not (exist_ok and stat.S_ISDIR(os.stat(parts[-1], dir_fd=handle.fd, follow_symlinks=False).st_mode)):
+                raise
+        finally:
+            self.release(handle)
+
+    def rmdir(self, sub_path: str):
+        """Removes an empty directory."""
+        handle, name = self.parent(sub_path)
+        try:
+            os.rmdir(name, dir_fd=handle.fd)
+        finally:
+            self.release(handle)
+        self.invalidate(sub_path)
+
+    def rmtree(self, sub_path: str):
+        """Removes a directory tree using the fd-based (symlink-attack resistant) shutil.rmtree."""
+        handle, name = self.parent(sub_path)
+        try:
+            shutil.rmtree(name, dir_fd=handle.fd)
+        finally:
+            self.release(handle)
+        self.invalidate(sub_path)
+
+    def metrics(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats, cached=len(self.cache), capacity=self.cache_size)
+
+_resolvers: Dict[str, PathResolver] = {}
+_resolvers_lock = threading.Lock()
+
+def get_path_resolver(base_dir: str) -> PathResolver:
+    """
+    Returns the shared PathResolver for a base directory, creating it on first use.
+
+    Args:
+        base_dir: The base directory.
+
+    Returns:
+        The resolver anchored at base_dir.
+    """
+    key = os.path.abspath(base_dir)
+    with _resolvers_lock:
+        resolver = _resolvers.get(key)
+        if resolver is None:
+            resolver = _resolvers[key] = PathResolver(key)
+        return resolver
@@ -1,58 +1,487 @@
 #   RateLimitModule.py
-#   Provides rate limiting functionality for the AION RWX API (Basic In-Memory Implementation - NOT Production Ready)
+#   Cost-aware rate limiting and admission control for the AION RWX API
+#
+#   Every request is weighted by what it costs the server (ENDPOINT_COSTS): a /list/
+#   costs 1 unit, an /execute/ 10, a recursive delete_directory 20. Three checks use
+#   these weights, in this order:
+#     1. Rate limiting (optional): a per-client token bucket of cost units (429).
+#     2. Per-client concurrency: the cost one client may have running or queued (429).
+#     3. Admission: the total cost running on the server is capped; further requests
+#        wait in a FIFO queue. When the queue delay stays above a target (CoDel) or
+#        the queue is full, new requests are shed immediately with 503 + Retry-After
+#        instead of letting every client's latency grow.
 
+import math
 import time
-from typing import Dict, List
+import asyncio
+import threading
+from collections import deque
+from urllib.parse import parse_qsl
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, Union
 from fastapi import FastAPI, HTTPException, status, Request
+from fastapi.responses import JSONResponse
+from SecurityModule import verify_api_token
 
 #   --- Configuration ---
-RATE_LIMIT_ENABLED = True  #   Enable/Disable rate limiting
+RATE_LIMIT_ENABLED = False  #   Per-client quotas; admission control below protects the server regardless
 RATE_WINDOW = 60  #   Seconds - Time window for checking requests
-RATE_MAX_REQUESTS = 100  #   Maximum allowed requests within the window
+RATE_MAX_REQUESTS = 100  #   Cost units allowed within the window (a burst may use all of them at once)
 
-#   --- In-Memory Request History (Replace with persistent storage for production) ---
-REQUEST_HISTORY: Dict[str, List[float]] = {}  #   {client_ip: [timestamps]}
+ADMISSION_ENABLED = True
+ADMISSION_MAX_COST = 64  #   Total cost of requests running at once
+ADMISSION_CLIENT_MAX_COST = 32  #   Cost one client may have running or queued
+ADMISSION_QUEUE_MAX = 256  #   Requests waiting for capacity before new ones are shed
+ADMISSION_QUEUE_TIMEOUT = 10.0  #   Seconds a request may wait for capacity
+ADMISSION_TARGET_DELAY = 0.05  #   Acceptable queue delay (CoDel target)
+ADMISSION_INTERVAL = 0.5  #   Queue delay above target for this long means overload (CoDel interval)
+ADMISSION_MAX_RETRY_AFTER = 30  #   Upper bound of the Retry-After hint in seconds
+ADMISSION_MAX_TRANSFERS = 32  #   Streaming uploads at once (TRANSFER_ENDPOINTS); they hold no cost
+ADMISSION_CLIENT_MAX_TRANSFERS = 4  #   Streaming uploads one client may have at once
+ADMISSION_CLIENT_HEADER: Optional[str] = None  #   e.g. "x-forwarded-for" behind a trusted proxy; default is the peer address
 
-def setup_rate_limiting(app: FastAPI):
+#   path prefix -> cost, or a function of (method, query parameters) returning the cost.
+#   The longest matching prefix wins; unlisted paths cost DEFAULT_COST. Cost 0 bypasses
+#   admission (metrics must stay reachable under overload; watch streams are long-lived
+#   but idle).
+DEFAULT_COST = 1.0
+CostFunction = Callable[[str, Dict[str, str]], float]
+ENDPOINT_COSTS: Dict[str, Union[float, CostFunction]] = {
+    "/metrics/": 0,
+    "/watch/": 0,
+    "/list/": 1,
+    "/read/": 1,
+    "/create_file/": 2,
+    "/patch/": 2,
+    "/upload/": 1,
+    "/delete_directory/": lambda method, query: 20 if query.get("recursive", "").lower() in ("true", "1") else 1,
+    "/execute/": 10,
+    "/jobs/": lambda method, query: 2 if method == "POST" else 1,
+    "/checksum/": 5,
+    "/sync/": 10,
+    "/copy/": lambda method, query: 10 if query.get("recursive", "").lower() in ("true", "1") else 3,
+    "/move/": 2,
+}
+
+#   path prefix -> methods whose request body is streamed by the handler. The time such a
+#   request spends waiting for a slow client is not server work, so it takes a transfer
+#   slot instead of cost; its disk writes are bounded by the run_io write slots.
+TRANSFER_ENDPOINTS: Dict[str, Tuple[str, ...]] = {
+    "/upload/": ("PUT",),
+}
+
+def is_transfer(method: str, path: str) -> bool:
+    """True if the request streams its body (TRANSFER_ENDPOINTS)."""
+    return any(path.startswith(prefix) and method in methods for prefix, methods in TRANSFER_ENDPOINTS.items())
+
+def endpoint_cost(method: str, path: str, query_string: bytes = b"") -> float:
     """
-    Sets up basic in-memory rate limiting middleware for the FastAPI app.
-    (Replace with a proper solution like Redis for production).
+    Returns the cost of a request from ENDPOINT_COSTS.
 
     Args:
-        app: The FastAPI application instance.
+        method: The HTTP method.
+        path: The request path.
+        query_string: The raw query string (for costs depending on parameters).
     """
+    best, best_length = DEFAULT_COST, -1
+    for prefix, cost in ENDPOINT_COSTS.items():
+        if path.startswith(prefix) and len(prefix) > best_length:
+            best, best_length = cost, len(prefix)
+    if callable(best):
+        return float(best(method, dict(parse_qsl(query_string.decode("latin-1")))))
+    return float(best)
 
-    @app.middleware("http")
-    async def rate_limit_middleware(request: Request, call_next):
-        client_ip = request.client.host  #   Get client IP (for basic identification)
-        if RATE_LIMIT_ENABLED:
-            check_rate_limit(client_ip)
-        response = await call_next(request)
-        return response
+#   --- Rate Limiting ---
+RATE_BUCKETS: Dict[str, Tuple[float, float]] = {}  #   {client: (tokens, last refill time)}
+_rate_lock = threading.Lock()
 
-def check_rate_limit(client_ip: str):
+def check_rate_limit(client_ip: str, cost: float = DEFAULT_COST):
     """
-    Basic in-memory rate limiting (Replace with a proper solution like Redis for production).
+    Token bucket rate limiting: a client earns RATE_MAX_REQUESTS cost units per
+    RATE_WINDOW seconds and may hold at most RATE_MAX_REQUESTS. Constant time per
+    request, unlike keeping every request timestamp.
 
     Args:
-        client_ip: The IP address of the client.
+        client_ip: The client identifier.
+        cost: The cost of the request.
+
+    Raises:
+        HTTPException: 429 Too Many Requests, with Retry-After, if the client lacks the tokens.
+    """
+    rate = RATE_MAX_REQUESTS / RATE_WINDOW
+    now = time.monotonic()
+    with _rate_lock:
+        tokens, last = RATE_BUCKETS.get(client_ip, (float(RATE_MAX_REQUESTS), now))
+        tokens = min(float(RATE_MAX_REQUESTS), tokens + (now - last) * rate)
+        if tokens < cost:
+            RATE_BUCKETS[client_ip] = (tokens, now)
+            retry_after = math.ceil((min(cost, RATE_MAX_REQUESTS) - tokens) / rate)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit exceeded",
+                headers={"Retry-After": str(max(1, retry_after))},
+            )
+        RATE_BUCKETS[client_ip] = (tokens - cost, now)
+        if len(RATE_BUCKETS) > 10000:
+            #   Drop clients whose bucket has refilled completely (they carry no state)
+            for client, (bucket_tokens, bucket_last) in list(RATE_BUCKETS.items()):
+                if bucket_tokens + (now - bucket_last) * rate >= RATE_MAX_REQUESTS:
+                    del RATE_BUCKETS[client]
+
+#   --- Admission Control ---
+class Rejected(Exception):
+    """A request refused by admission control."""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Caps the total cost of running requests and queues the rest in FIFO order.
+
+    Overload is detected CoDel-style (Controlled Delay), from how long the queue
+    has been standing rather than from its length: a queue that empties at least
+    once per ADMISSION_INTERVAL is absorbing a burst, and requests may wait up to
+    ADMISSION_QUEUE_TIMEOUT. A queue that has not emptied for ADMISSION_INTERVAL
+    means arrivals exceed capacity. The controller then sheds: new requests are
+    rejected at once, and queued requests that waited longer than
+    ADMISSION_TARGET_DELAY are rejected when they reach the head, so the requests
+    that are admitted keep a bounded latency.
+    """
+
+    def __init__(self, max_cost: float = ADMISSION_MAX_COST, client_max_cost: float = ADMISSION_CLIENT_MAX_COST):
+        self.max_cost = max_cost
+        self.client_max_cost = client_max_cost
+        self.running = 0.0
+        self.clients: Dict[str, float] = {}  #   Cost running or queued per client
+        self.queue: Deque[Tuple[float, asyncio.Future, float, str]] = deque()  #   (cost, future, enqueued at, client)
+        self.last_empty = time.monotonic()  #   Last time the queue was empty
+        self.latency_per_cost = 0.05  #   EWMA of service time per cost unit, for Retry-After
+        self.lock = threading.Lock()
+        self.stats = {"admitted": 0, "queued": 0, "shed": 0, "dropped": 0, "client_limited": 0, "timeouts": 0}
+
+    def overloaded(self, now: float) -> bool:
+        """True while a queue has been standing for ADMISSION_INTERVAL. Caller holds self.lock."""
+        return bool(self.queue) and now - self.last_empty > ADMISSION_INTERVAL
+
+    def retry_after(self) -> int:
+        """Estimates when capacity frees up: the queued and running cost at the recent service rate."""
+        queued = sum(entry[0] for entry in self.queue)
+        estimate = (queued + self.running) * self.latency_per_cost / max(self.max_cost, 1)
+        return int(min(ADMISSION_MAX_RETRY_AFTER, max(1, math.ceil(estimate))))
+
+    def drop_client(self, client: str, cost: float):
+        """Removes cost from a client's total. Caller holds self.lock."""
+        remaining = self.clients.get(client, 0.0) - cost
+        if remaining > 1e-9:
+            self.clients[client] = remaining
+        else:
+            self.clients.pop(client, None)
+
+    async def acquire(self, client: str, cost: float):
+        """
+        Admits a request, waiting in the queue if the server is at capacity.
+
+        Raises:
+            Rejected: 429 if the client is over its own limit, 503 if the request is shed.
+        """
+        now = time.monotonic()
+        with self.lock:
+            current = self.clients.get(client, 0.0)
+            if current > 0 and current + cost > self.client_max_cost:
+                self.stats["client_limited"] += 1
+                raise Rejected(status.HTTP_429_TOO_MANY_REQUESTS, "Too many concurrent requests from this client", 1)
+            if not self.queue and (self.running + cost <= self.max_cost or self.running == 0):
+                self.running += cost
+                self.clients[client] = current + cost
+                self.last_empty = now
+                self.stats["admitted"] += 1
+                return
+            if not self.queue:
+                self.last_empty = now
+            if self.overloaded(now) or len(self.queue) >= ADMISSION_QUEUE_MAX:
+                self.stats["shed"] += 1
+                raise Rejected(status.HTTP_503_SERVICE_UNAVAILABLE, "Server overloaded", self.retry_after())
+            future = asyncio.get_running_loop().create_future()
+            self.queue.append((cost, future, now, client))
+            self.clients[client] = current + cost
+            self.stats["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), ADMISSION_QUEUE_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self.lock:
+                granted = future.done() and not future.cancelled() and future.exception() is None
+                if not future.done():
+                    future.cancel()  #   Skipped (and its cost dropped) when it reaches the head
+            if granted:
+                self.release(client, cost, 0.0)  #   Granted just as the wait ended
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            self.stats["timeouts"] += 1
+            raise Rejected(status.HTTP_503_SERVICE_UNAVAILABLE, "Server overloaded", self.retry_after())
+
+    def release(self, client: str, cost: float, latency: float):
+        """Ends a request and admits (or, when overloaded, drops) queued requests."""
+        now = time.monotonic()
+        with self.lock:
+            self.running -= cost
+            self.drop_client(client, cost)
+            if latency > 0 and cost > 0:
+                self.latency_per_cost += 0.1 * (latency / cost - self.latency_per_cost)
+            while self.queue:
+                next_cost, future, enqueued, next_client = self.queue[0]
+                if future.done():  #   Timed out or cancelled while waiting
+                    self.queue.popleft()
+                    self.drop_client(next_client, next_cost)
+                    continue
+                if self.overloaded(now) and now - enqueued > ADMISSION_TARGET_DELAY:
+                    self.queue.popleft()
+                    self.drop_client(next_client, next_cost)
+                    self.stats["dropped"] += 1
+                    future.get_loop().call_soon_threadsafe(
+                        reject, future, Rejected(status.HTTP_503_SERVICE_UNAVAILABLE, "Server overloaded", self.retry_after())
+                    )
+                    continue
+                if self.running + next_cost > self.max_cost and self.running > 0:
+                    break
+                self.queue.popleft()
+                self.running += next_cost
+                self.stats["admitted"] += 1
+                future.get_loop().call_soon_threadsafe(grant, future)
+            if not self.queue:
+                self.last_empty = now
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(
+                self.stats, running_cost=self.running, max_cost=self.max_cost, queue_length=len(self.queue),
+                shedding=self.overloaded(time.monotonic()), clients=len(self.clients),
+                latency_per_cost_ms=round(self.latency_per_cost * 1000, 3),
+            )
+
+class TransferLimiter:
+    """
+    Caps streaming uploads in total and per client. A transfer is rejected at once
+    when no slot is free: queueing would only hold the client's connection open.
+    """
+
+    def __init__(self, max_transfers: int = ADMISSION_MAX_TRANSFERS, client_max_transfers: int = ADMISSION_CLIENT_MAX_TRANSFERS):
+        self.max_transfers = max_transfers
+        self.client_max_transfers = client_max_transfers
+        self.running = 0
+        self.clients: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.stats = {"transfers": 0, "transfers_client_limited": 0, "transfers_shed": 0}
+
+    def acquire(self, client: str):
+        """
+        Raises:
+            Rejected: 429 if the client has ADMISSION_CLIENT_MAX_TRANSFERS running, 503 if all slots are taken.
+        """
+        with self.lock:
+            current = self.clients.get(client, 0)
+            if current >= self.client_max_transfers:
+                self.stats["transfers_client_limited"] += 1
+                raise Rejected(status.HTTP_429_TOO_MANY_REQUESTS, "Too many concurrent uploads from this client", 1)
+            if self.running >= self.max_transfers:
+                self.stats["transfers_shed"] += 1
+                raise Rejected(status.HTTP_503_SERVICE_UNAVAILABLE, "Too many concurrent uploads", 1)
+            self.running += 1
+            self.clients[client] = current + 1
+            self.stats["transfers"] += 1
+
+    def release(self, client: str):
+        with self.lock:
+            self.running -= 1
+            remaining = self.clients.get(client, 0) - 1
+            if remaining > 0:
+                self.clients[client] = remaining
+            else:
+                self.clients.pop(client, None)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats, running_transfers=self.running, max_transfers=self.max_transfers)
+
+def grant(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+def reject(future: asyncio.Future, error: Rejected):
+    if not future.done():
+        future.set_exception(error)
+
+ADMISSION = AdmissionController()
+TRANSFERS = TransferLimiter()
+
+def client_key(scope: Dict[str, Any]) -> str:
+    """Identifies the client of a request (peer address, or ADMISSION_CLIENT_HEADER)."""
+    if ADMISSION_CLIENT_HEADER:
+        wanted = ADMISSION_CLIENT_HEADER.lower().encode("latin-1")
+        for name, value in scope.get("headers", []):
+            if name == wanted:
+                return value.decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+async def admit(client: str, cost: float) -> bool:
+    """
+    Applies the rate limit and admission control to one request or session operation.
+
+    Returns:
+        True if cost was admitted and must be returned with ADMISSION.release(), False
+        if admission is disabled or the request is free.
 
     Raises:
-        HTTPException: 429 Too Many Requests if the limit is exceeded.
+        HTTPException: 429 if the client's rate limit is exhausted.
+        Rejected: 429 if the client is over its concurrency limit, 503 if the request is shed.
+    """
+    if not ADMISSION_ENABLED or cost <= 0:
+        return False
+    if RATE_LIMIT_ENABLED:
+        check_rate_limit(client, cost)
+    await ADMISSION.acquire(client, cost)
+    return True
+
+class AdmissionMiddleware:
     """
+    ASGI middleware applying the rate limit and admission control to HTTP requests.
+    A request holds its cost until its response starts: sending the body (a download
+    to a slow client) is not charged, nor is receiving one for TRANSFER_ENDPOINTS,
+    which take a TransferLimiter slot instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":  #   WebSocket sessions admit each operation (SessionModule)
+            await self.app(scope, receive, send)
+            return
+        client = client_key(scope)
+        transfer = ADMISSION_ENABLED and is_transfer(scope["method"], scope["path"])
+        cost = 0.0 if transfer else endpoint_cost(scope["method"], scope["path"], scope.get("query_string", b""))
+        try:
+            if transfer:
+                if RATE_LIMIT_ENABLED:
+                    check_rate_limit(client, DEFAULT_COST)
+                TRANSFERS.acquire(client)
+                admitted = False
+            else:
+                admitted = await admit(client, cost)
+        except HTTPException as e:
+            await JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)(scope, receive, send)
+            return
+        except Rejected as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+        if transfer:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                TRANSFERS.release(client)
+            return
+        if not admitted:
+            await self.app(scope, receive, send)
+            return
+        started = time.monotonic()
+        held = True
+
+        def release():
+            nonlocal held
+            if held:
+                held = False
+                ADMISSION.release(client, cost, time.monotonic() - started)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                release()  #   The handler's work is done; the body may stream for a long time
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
+
+def setup_rate_limiting(app: FastAPI):
+    """
+    Sets up cost-weighted rate limiting and admission control, and the
+    /metrics/admission/ endpoint. Call it after all other middleware is
+    registered so that it runs first.
+
+    Args:
+        app: The FastAPI application instance.
+    """
+    app.add_middleware(AdmissionMiddleware)
+
+    @app.get("/metrics/admission/")
+    async def get_admission_metrics(request: Request):
+        """
+        Returns admission counters (admitted, queued, shed, client-limited, timed out),
+        the running cost, the queue length, whether load is being shed, and the
+        running and rejected streaming uploads.
+        """
+        verify_api_token(request)
+        return JSONResponse(dict(ADMISSION.metrics(), **TRANSFERS.metrics(), rate_limit_enabled=RATE_LIMIT_ENABLED))
+
+#   --- Benchmark ---
+if __name__ == "__main__":
+    import random
+
+    async def simulate(admission: bool, arrivals_per_second: float, seconds: float = 5.0):
+        """
+        Open-loop load (more work arrives than the server can do) against a server
+        with 16 cost units of capacity shared by all running requests: a request of
+        cost c occupies c units for 20 ms when the server is not overloaded and
+        proportionally longer when it is. Without admission control everything slows down; with it,
+        the excess is shed and admitted requests keep their normal latency.
+        """
+        capacity = 16
+        controller = AdmissionController(max_cost=capacity, client_max_cost=1000)
+        load = 0.0
+        latencies, shed = [], 0
 
-    now = time.time()
-    if client_ip not in REQUEST_HISTORY:
-        REQUEST_HISTORY[client_ip] = []
+        async def request(cost: float):
+            nonlocal load, shed
+            client = f"client-{random.randrange(20)}"
+            started = time.monotonic()
+            if admission:
+                try:
+                    await controller.acquire(client, cost)
+                except Rejected:
+                    shed += 1
+                    return
+            served = time.monotonic()
+            load += cost
+            try:
+                work = 0.02
+                while work > 0:
+                    await asyncio.sleep(0.005)
+                    work -= 0.005 / max(1.0, load / capacity)  #   Processor sharing
+            finally:
+                load -= cost
+                if admission:
+                    controller.release(client, cost, time.monotonic() - served)
+            latencies.append(time.monotonic() - started)
 
-    #   Keep only requests within the time window
-    REQUEST_HISTORY[client_ip] = [
-        ts for ts in REQUEST_HISTORY[client_ip] if ts > now - RATE_WINDOW
-    ]
+        tasks = []
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            tasks.append(asyncio.create_task(request(random.choice((1, 1, 1, 10)))))
+            await asyncio.sleep(random.expovariate(arrivals_per_second))
+        await asyncio.gather(*tasks)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[int(len(latencies) * 0.99)] * 1000
+        print(f"{arrivals_per_second:4.0f} req/s admission={'on ' if admission else 'off'} served={len(latencies):5d} "
+              f"shed={shed:5d} p50={p50:8.1f} ms p99={p99:8.1f} ms")
 
-    if len(REQUEST_HISTORY[client_ip]) >= RATE_MAX_REQUESTS:
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit exceeded"
-        )
+    async def main():
+        #   Capacity is 16 units / 20 ms = 800 units/s; the mix averages 3.25 units per request (~250 req/s)
+        for rate in (150, 400):
+            for admission in (False, True):
+                await simulate(admission, arrivals_per_second=rate)
 
-    REQUEST_HISTORY[client_ip].append(now)
+    asyncio.run(main())
@@ -56,4 +56,37 @@ def safe_path(base_dir: str, sub_path: str) -> str:
 
     Args:
         base_dir: The base directory to restrict access to.
-        sub_path
+        sub_path: The sub-path to append to base_dir.
+
+    Returns:
+        The safe absolute path.
+
+    Raises:
+        HTTPException: 403 Forbidden if the path is unsafe.
+        HTTPException: 400 Bad Request if the path is invalid.
+    """
+    if not sub_path:
+        return os.path.abspath(base_dir)
+    try:
+        decoded_path = unquote(sub_path)  #   Decode URL-encoded paths
+        normalized_path = os.path.normpath(decoded_path)
+        base_path = os.path.abspath(base_dir)
+        full_path = os.path.abspath(os.path.join(base_path, normalized_path))
+        if full_path != base_path and not full_path.startswith(base_path + os.sep):
+            logging.warning(f"Unsafe path access attempted: {full_path}")
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
+        return full_path
+    except HTTPException:
+        raise
+    except ValueError as ve:
+        logging.error(f"Invalid path: {sub_path} - {ve}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid path: {ve}"
+        )
+    except Exception as e:
+        logging.error(f"Error processing path: {sub_path} - {e}")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid path"
+        )
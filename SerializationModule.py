@@ -0,0 +1,203 @@
+#   SerializationModule.py
+#   Pluggable response encoders with Accept negotiation for the AION RWX API
+
+import json
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#   --- Optional Encoders ---
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+#   --- Configuration ---
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+CBOR_MEDIA_TYPE = "application/cbor"
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK_MEDIA_TYPE, "application/vnd.msgpack": MSGPACK_MEDIA_TYPE}
+
+#   --- NumPy Support ---
+def pack_ndarray(array) -> Dict[str, Any]:
+    """
+    Represents a NumPy array for the binary encoders without per-element conversion:
+    the raw (C-order) buffer plus dtype and shape.
+
+        {"__ndarray__": True, "dtype": "<f8", "shape": [1000, 4], "data": b"..."}
+    """
+    array = np.ascontiguousarray(array)
+    return {"__ndarray__": True, "dtype": array.dtype.str, "shape": list(array.shape), "data": array.tobytes()}
+
+def unpack_ndarray(value: Dict[str, Any]):
+    """Restores an array packed with pack_ndarray (for Python clients and tests)."""
+    return np.frombuffer(value["data"], dtype=np.dtype(value["dtype"])).reshape(value["shape"])
+
+def binary_default(obj: Any) -> Any:
+    """Fallback for msgpack/CBOR: packs arrays, unwraps NumPy scalars."""
+    if np is not None:
+        if isinstance(obj, np.ndarray):
+            return pack_ndarray(obj)
+        if isinstance(obj, np.generic):
+            return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+def json_default(obj: Any) -> Any:
+    """
+    Fallback for the JSON encoders. orjson serializes contiguous arrays natively, so
+    this only sees non-contiguous arrays (made contiguous) and, with the stdlib
+    encoder, arrays and scalars that must be converted to lists and numbers.
+    """
+    if np is not None:
+        if isinstance(obj, np.ndarray):
+            return np.ascontiguousarray(obj) if orjson is not None else obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+#   --- Encoders ---
+def encode_json(content: Any) -> bytes:
+    """Encodes content as JSON, with orjson (and native NumPy support) when installed."""
+    if orjson is not None:
+        return orjson.dumps(content, default=json_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=json_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def encode_msgpack(content: Any) -> bytes:
+    return msgpack.packb(content, default=binary_default, use_bin_type=True)
+
+def encode_cbor(content: Any) -> bytes:
+    return cbor2.dumps(content, default=lambda encoder, obj: encoder.encode(binary_default(obj)))
+
+#   media type -> encoder, in server preference order for "*/*"
+ENCODERS: Dict[str, Callable[[Any], bytes]] = {JSON_MEDIA_TYPE: encode_json}
+if msgpack is not None:
+    ENCODERS[MSGPACK_MEDIA_TYPE] = encode_msgpack
+if cbor2 is not None:
+    ENCODERS[CBOR_MEDIA_TYPE] = encode_cbor
+
+def register_encoder(media_type: str, encoder: Callable[[Any], bytes]):
+    """
+    Adds (or replaces) the encoder used for a media type.
+
+    Args:
+        media_type: The media type clients request via Accept.
+        encoder: A function turning response content into bytes.
+    """
+    ENCODERS[media_type] = encoder
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """
+    Picks the response media type from an Accept header. JSON is the default,
+    and is also used when nothing acceptable is available (rather than a 406).
+
+    Args:
+        accept: The Accept header value (may be None).
+
+    Returns:
+        A media type present in ENCODERS.
+    """
+    if not accept:
+        return JSON_MEDIA_TYPE
+    best, best_weight = JSON_MEDIA_TYPE, 0.0
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        media_type = MEDIA_TYPE_ALIASES.get(media_type.lower(), media_type.lower())
+        weight = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        if media_type in ("*/*", "application/*"):
+            media_type = JSON_MEDIA_TYPE
+        if media_type in ENCODERS and weight > best_weight:
+            best, best_weight = media_type, weight
+    return best
+
+def render_content(request: Optional[Request], content: Any) -> Tuple[bytes, str]:
+    """
+    Encodes response content in the format negotiated for a request.
+
+    Args:
+        request: The incoming request (None for JSON).
+        content: The response content; may contain NumPy arrays and scalars.
+
+    Returns:
+        The encoded body and its media type.
+    """
+    media_type = negotiate_media_type(request.headers.get("accept") if request is not None else None)
+    return ENCODERS[media_type](content), media_type
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with encode_json (orjson and NumPy arrays when available)."""
+
+    def render(self, content: Any) -> bytes:
+        return encode_json(content)
+
+def encoded_response(request: Request, content: Any, status_code: int = 200) -> Response:
+    """
+    Builds a response in the format requested by the client's Accept header
+    (JSON by default, MessagePack or CBOR when installed and requested).
+
+    Args:
+        request: The incoming request.
+        content: The response content.
+        status_code: The HTTP status code.
+
+    Returns:
+        The encoded Response, with Vary: Accept.
+    """
+    body, media_type = render_content(request, content)
+    return Response(body, status_code=status_code, media_type=media_type, headers={"Vary": "Accept"})
+
+#   --- Benchmark ---
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    rng = np.random.default_rng(0)
+    predictions = rng.random((20000, 4), dtype=np.float32)
+    anomaly_scores = rng.random(20000)
+    payloads = {
+        "listing (50k names)": {"files": [f"file_{index:06d}.txt" for index in range(50000)]},
+        "file content (8 MB)": {"content": "2025-01-01 00:00:00 - INFO - request served\n" * 190000},
+        "threat analysis (20k x 4)": {
+            "cnn_predictions": predictions,
+            "anomaly_scores": anomaly_scores,
+            "risk_scores": predictions.max(axis=1) * anomaly_scores,
+        },
+    }
+
+    def stdlib_json(content: Any) -> bytes:
+        #   The previous path: .tolist() on every array, then json.dumps
+        converted = {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in content.items()}
+        return json.dumps(converted).encode("utf-8")
+
+    candidates = {"json (stdlib, .tolist())": stdlib_json, "json (encode_json)": encode_json}
+    if msgpack is not None:
+        candidates["msgpack"] = encode_msgpack
+    if cbor2 is not None:
+        candidates["cbor"] = encode_cbor
+    for payload_name, payload in payloads.items():
+        print(payload_name)
+        for encoder_name, encoder in candidates.items():
+            runs = 5
+            started = time.perf_counter()
+            for _ in range(runs):
+                body = encoder(payload)
+            elapsed = (time.perf_counter() - started) / runs
+            print(f"    {encoder_name:28s} {elapsed * 1000:8.2f} ms  {len(body) / 1e6:7.2f} MB")
@@ -0,0 +1,292 @@
+#   SessionModule.py
+#   Persistent multiplexed WebSocket sessions for agent tool calls in the AION RWX API
+#
+#   A client authenticates once, then sends id-tagged operations as JSON text frames:
+#       {"id": 1, "op": "read", "args": {"file_path": "notes.txt"}}
+#   Operations run concurrently (up to SESSION_MAX_IN_FLIGHT per session) and each
+#   response carries the id of its request, so responses may arrive out of order:
+#       {"id": 1, "ok": true, "result": {...}}
+#       {"id": 2, "ok": false, "status": 404, "error": "File not found"}
+
+import time
+import asyncio
+import logging
+import secrets
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request, status
+from fastapi.responses import JSONResponse
+from config import API_TOKEN
+from SecurityModule import verify_api_token
+from SerializationModule import encode_json
+from CommandCacheModule import note_fs_change
+from RateLimitModule import ADMISSION, DEFAULT_COST, Rejected, admit, client_key, endpoint_cost
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+#   --- Configuration ---
+SESSION_MAX_SESSIONS = 64  #   Concurrent sessions across all clients
+SESSION_MAX_IN_FLIGHT = 16  #   Operations running at once per session; further frames are not read (backpressure)
+SESSION_SEND_QUEUE = 64  #   Responses buffered per session before operations wait for the client to read
+SESSION_MAX_MESSAGE_BYTES = 1024 * 1024  #   Larger request frames close the session (1009)
+SESSION_AUTH_TIMEOUT = 10  #   Seconds to send {"op": "auth"} when the token is not in the handshake headers
+SESSION_IDLE_TIMEOUT = 600  #   Seconds without frames before the session is closed
+#   op -> (method, path) of the equivalent HTTP endpoint, whose ENDPOINT_COSTS entry the op is
+#   charged in admission control (RateLimitModule); other ops cost DEFAULT_COST
+SESSION_OP_ENDPOINTS: Dict[str, Tuple[str, str]] = {
+    "list": ("GET", "/list/"),
+    "read": ("GET", "/read/"),
+    "execute": ("POST", "/execute/"),
+}
+
+#   handler(args, state) -> result; handlers raise HTTPException like endpoints do
+Operation = Callable[[Dict[str, Any], SimpleNamespace], Awaitable[Any]]
+SESSION_STATS = {"sessions_opened": 0, "sessions_active": 0, "operations": 0, "errors": 0, "cancelled": 0, "rejected": 0}
+
+def error_frame(op_id: Any, status_code: int, detail: Any) -> Dict[str, Any]:
+    return {"id": op_id, "ok": False, "status": status_code, "error": detail}
+
+def is_valid_id(value: Any) -> bool:
+    """Operation ids key the in-flight table, so only strings and integers are accepted."""
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+class Session:
+    """One authenticated WebSocket connection with its in-flight operations."""
+
+    def __init__(self, websocket: WebSocket, operations: Dict[str, Tuple[Operation, bool]]):
+        self.websocket = websocket
+        self.operations = operations
+        self.client = client_key(websocket.scope)
+        self.slots = asyncio.Semaphore(SESSION_MAX_IN_FLIGHT)
+        self.outgoing: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=SESSION_SEND_QUEUE)
+        self.tasks: Dict[Any, asyncio.Task] = {}
+
+    async def sender(self):
+        """Writes queued responses to the socket in completion order."""
+        while True:
+            frame = await self.outgoing.get()
+            if frame is None:
+                return
+            await self.websocket.send_text(encode_json(frame).decode("utf-8"))
+
+    async def run_operation(self, op_id: Any, name: str, args: Dict[str, Any]):
+        """
+        Runs one operation under the same admission control as HTTP requests, frees its
+        slot and queues its response.
+        """
+        handler, read_only = self.operations[name]
+        state = SimpleNamespace(read_only=read_only)
+        cost = endpoint_cost(*SESSION_OP_ENDPOINTS[name]) if name in SESSION_OP_ENDPOINTS else DEFAULT_COST
+        try:
+            admitted = await admit(self.client, cost)
+        except (HTTPException, Rejected) as e:
+            SESSION_STATS["rejected"] += 1
+            frame = error_frame(op_id, e.status_code, e.detail)
+            retry_after = e.retry_after if isinstance(e, Rejected) else (e.headers or {}).get("Retry-After")
+            if retry_after is not None:
+                frame["retry_after"] = int(retry_after)
+            self.release(op_id)
+            await self.outgoing.put(frame)
+            return
+        started = time.monotonic()
+        try:
+            result = await handler(args, state)
+            frame = {"id": op_id, "ok": True, "result": result}
+        except HTTPException as e:
+            SESSION_STATS["errors"] += 1
+            frame = error_frame(op_id, e.status_code, e.detail)
+        except (KeyError, TypeError, ValueError) as e:
+            SESSION_STATS["errors"] += 1
+            frame = error_frame(op_id, status.HTTP_400_BAD_REQUEST, f"Invalid arguments: {e}")
+        except Exception as e:
+            SESSION_STATS["errors"] += 1
+            logging.error(f"Session operation {name} failed: {e}")
+            frame = error_frame(op_id, status.HTTP_500_INTERNAL_SERVER_ERROR, f"Internal server error: {e}")
+        finally:
+            if admitted:
+                ADMISSION.release(self.client, cost, time.monotonic() - started)
+            if not state.read_only:
+                note_fs_change()  #   Same rule as the HTTP middleware in CommandCacheModule
+        SESSION_STATS["operations"] += 1
+        self.release(op_id)  #   Free the slot before waiting on the client
+        await self.outgoing.put(frame)  #   Waits while the client is not reading (backpressure)
+
+    def release(self, op_id: Any):
+        """Frees the slot of an operation (once, whether it finished or was cancelled)."""
+        if self.tasks.pop(op_id, None) is not None:
+            self.slots.release()
+
+    def finished(self, op_id: Any, task: asyncio.Task):
+        if task.cancelled():
+            SESSION_STATS["cancelled"] += 1
+            self.release(op_id)
+            try:
+                self.outgoing.put_nowait(error_frame(op_id, 499, "Cancelled"))
+            except asyncio.QueueFull:
+                pass
+
+    async def dispatch(self, message: Dict[str, Any]):
+        """Validates a request frame and starts its operation once a slot is free."""
+        op_id = message.get("id")
+        name = message.get("op")
+        if op_id is not None and not is_valid_id(op_id):
+            await self.outgoing.put(error_frame(None, status.HTTP_400_BAD_REQUEST, "id must be a string or an integer"))
+            return
+        if name == "cancel":
+            target = message.get("target")
+            if not is_valid_id(target):
+                await self.outgoing.put(error_frame(op_id, status.HTTP_400_BAD_REQUEST, "target must be a string or an integer"))
+                return
+            task = self.tasks.get(target)
+            if task is not None:
+                task.cancel()
+            await self.outgoing.put({"id": op_id, "ok": True, "result": {"cancelled": task is not None}})
+            return
+        if name == "ping":
+            await self.outgoing.put({"id": op_id, "ok": True, "result": {"time": time.time()}})
+            return
+        if op_id is None or op_id in self.tasks:
+            await self.outgoing.put(error_frame(op_id, status.HTTP_400_BAD_REQUEST, "Missing or duplicate id"))
+            return
+        if name not in self.operations:
+            await self.outgoing.put(error_frame(op_id, status.HTTP_404_NOT_FOUND, f"Unknown op: {name}"))
+            return
+        args = message.get("args") or {}
+        if not isinstance(args, dict):
+            await self.outgoing.put(error_frame(op_id, status.HTTP_400_BAD_REQUEST, "args must be an object"))
+            return
+        await self.slots.acquire()  #   Stop reading frames while SESSION_MAX_IN_FLIGHT operations run
+        task = asyncio.create_task(self.run_operation(op_id, name, args))
+        self.tasks[op_id] = task
+        task.add_done_callback(lambda done: self.finished(op_id, done))
+
+    async def close(self):
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def authenticate(websocket: WebSocket) -> bool:
+    """
+    Accepts the handshake token (action-api-key header) or a first {"op": "auth",
+    "token": ...} frame for clients that cannot set headers.
+    """
+    token = websocket.headers.get("action-api-key")
+    if token is None:
+        try:
+            message = await asyncio.wait_for(websocket.receive_json(), SESSION_AUTH_TIMEOUT)
+        except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+            return False
+        if isinstance(message, dict) and message.get("op") == "auth":
+            token = message.get("token")
+    if not token or not API_TOKEN or not secrets.compare_digest(str(token), API_TOKEN):
+        logging.warning("Unauthorized session attempt.")
+        return False
+    return True
+
+def setup_session_endpoint(app: FastAPI, operations: Dict[str, Tuple[Operation, bool]]):
+    """
+    Registers the /session/ WebSocket endpoint and its metrics endpoint.
+
+    Args:
+        app: The FastAPI application instance.
+        operations: op name -> (async handler(args, state), read_only). Handlers receive
+                    the op's args dict and a state object (like request.state) and raise
+                    HTTPException on errors. Non-read-only ops bump the filesystem generation
+                    unless the handler sets state.read_only.
+    """
+
+    @app.websocket("/session/")
+    async def session_endpoint(websocket: WebSocket):
+        await websocket.accept()
+        if SESSION_STATS["sessions_active"] >= SESSION_MAX_SESSIONS:
+            await websocket.close(code=1013, reason="Too many sessions")
+            return
+        SESSION_STATS["sessions_active"] += 1  #   Reserved before authenticating, so waiting handshakes count towards the limit
+        try:
+            authenticated = await authenticate(websocket)
+        except BaseException:
+            SESSION_STATS["sessions_active"] -= 1
+            raise
+        if not authenticated:
+            SESSION_STATS["sessions_active"] -= 1
+            await websocket.close(code=1008, reason="Invalid API key")
+            return
+        SESSION_STATS["sessions_opened"] += 1
+        session = Session(websocket, operations)
+        sender = asyncio.create_task(session.sender())
+        try:
+            await websocket.send_text(encode_json({"id": None, "ok": True, "result": {"session": "ready", "ops": sorted(operations)}}).decode("utf-8"))
+            while True:
+                frame = await asyncio.wait_for(websocket.receive(), SESSION_IDLE_TIMEOUT)
+                if frame["type"] == "websocket.disconnect":
+                    break
+                text = frame.get("text")
+                if text is None:
+                    await websocket.close(code=1003, reason="Only JSON text frames are supported")
+                    break
+                if len(text) > SESSION_MAX_MESSAGE_BYTES:
+                    await websocket.close(code=1009, reason="Message too large")
+                    break
+                try:
+                    message = json_loads(text)
+                except ValueError:
+                    await session.outgoing.put(error_frame(None, status.HTTP_400_BAD_REQUEST, "Invalid JSON"))
+                    continue
+                if not isinstance(message, dict):
+                    await session.outgoing.put(error_frame(None, status.HTTP_400_BAD_REQUEST, "Frames must be JSON objects"))
+                    continue
+                await session.dispatch(message)
+        except (WebSocketDisconnect, asyncio.TimeoutError):
+            pass
+        finally:
+            await session.close()
+            sender.cancel()
+            SESSION_STATS["sessions_active"] -= 1
+
+    @app.get("/metrics/session/")
+    async def get_session_metrics(request: Request):
+        """
+        Returns WebSocket session counters.
+        """
+        verify_api_token(request)
+        return JSONResponse(dict(SESSION_STATS, max_sessions=SESSION_MAX_SESSIONS, max_in_flight=SESSION_MAX_IN_FLIGHT))
+
+#   --- Benchmark ---
+if __name__ == "__main__":
+    import os
+    import sys
+    import json
+    from fastapi.testclient import TestClient
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import aion
+    client = TestClient(aion.app)
+    headers = {"action-api-key": API_TOKEN}
+    sample = "aion_session_benchmark.txt"
+    with open(os.path.join(aion.BASE_DIRECTORY, sample), "w") as file:
+        file.write("benchmark\n" * 100)
+    runs = 500
+    try:
+        started = time.perf_counter()
+        for _ in range(runs):
+            client.get("/read/", params={"file_path": sample}, headers=headers).raise_for_status()
+        http = (time.perf_counter() - started) / runs
+        with client.websocket_connect("/session/", headers=headers) as websocket:
+            websocket.receive_json()
+            started = time.perf_counter()
+            for index in range(runs):
+                websocket.send_text(json.dumps({"id": index, "op": "read", "args": {"file_path": sample}}))
+                websocket.receive_json()
+            sequential = (time.perf_counter() - started) / runs
+            started = time.perf_counter()
+            for index in range(runs):
+                websocket.send_text(json.dumps({"id": index, "op": "read", "args": {"file_path": sample}}))
+            for _ in range(runs):
+                websocket.receive_json()
+            pipelined = (time.perf_counter() - started) / runs
+    finally:
+        os.remove(os.path.join(aion.BASE_DIRECTORY, sample))
+    print(f"HTTP /read/: {http * 1000:.3f} ms/op, session sequential: {sequential * 1000:.3f} ms/op, session pipelined: {pipelined * 1000:.3f} ms/op")
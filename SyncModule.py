@@ -0,0 +1,538 @@
+#   SyncModule.py
+#   Content hashing and rsync-style block delta sync for the AION RWX API
+
+import os
+import mmap
+import stat
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, status, Query, Body, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, validator
+from SecurityModule import verify_api_token
+from PathModule import get_path_resolver, PathResolver, split_path
+from IOModule import run_io
+from CompressionModule import compressed_response
+from PatchModule import PreconditionFailed, PatchConflict, file_etag, check_if_match, open_locked, rewrite_file, copy_range
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+#   --- Optional Hashes ---
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+#   --- Configuration ---
+HASH_CACHE_SIZE = 100000  #   Cached file digests (one per file version and algorithm)
+HASH_READ_SIZE = 1024 * 1024  #   Bytes per read while hashing
+SYNC_MAX_TREE_FILES = 20000  #   Files hashed per /checksum/ subtree request
+SYNC_DEFAULT_BLOCK_SIZE = 8192
+SYNC_MIN_BLOCK_SIZE = 512
+SYNC_MAX_BLOCK_SIZE = 1024 * 1024
+SYNC_WINDOW = 4 * 1024 * 1024  #   Bytes scanned per vectorized rolling-checksum pass
+WEAK_FILTER_MASK = (1 << 22) - 1  #   Size of the weak checksum prefilter bitmap
+
+#   Fast non-cryptographic hashes first; hashlib algorithms are always available
+HASH_ALGORITHMS = tuple(
+    [name for name, module in (("xxh3_128", xxhash), ("xxh64", xxhash), ("blake3", blake3)) if module is not None]
+    + ["blake2b", "sha256", "sha1", "md5"]
+)
+DEFAULT_HASH_ALGORITHM = HASH_ALGORITHMS[0]
+
+def new_hasher(algorithm: str):
+    """
+    Returns a new hash object for an algorithm in HASH_ALGORITHMS.
+
+    Raises:
+        ValueError: If the algorithm is not available.
+    """
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm} (available: {', '.join(HASH_ALGORITHMS)})")
+    if algorithm == "xxh3_128":
+        return xxhash.xxh3_128()
+    if algorithm == "xxh64":
+        return xxhash.xxh64()
+    if algorithm == "blake3":
+        return blake3.blake3()
+    if algorithm == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    return hashlib.new(algorithm)
+
+def block_digest(data, algorithm: str) -> str:
+    hasher = new_hasher(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest()
+
+#   --- File Digests ---
+class HashCache:
+    """
+    LRU cache of file digests keyed by file version (device, inode, size, mtime and
+    ctime) and algorithm, so unchanged files are never read again.
+    """
+
+    def __init__(self, max_entries: int = HASH_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[Any, ...], str]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bytes_hashed": 0}
+
+    @staticmethod
+    def key(st: os.stat_result, algorithm: str) -> Tuple[Any, ...]:
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns, algorithm)
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[str]:
+        with self.lock:
+            digest = self.entries.get(key)
+            if digest is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return digest
+
+    def put(self, key: Tuple[Any, ...], digest: str):
+        with self.lock:
+            self.entries[key] = digest
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), max_entries=self.max_entries)
+
+HASH_CACHE = HashCache()
+
+def hash_fd(fd: int, algorithm: str) -> Tuple[str, os.stat_result]:
+    """
+    Returns the digest and stat result of an open regular file, from the cache if the
+    file is unchanged. A digest is only cached if the file did not change while it
+    was being read.
+    """
+    before = os.fstat(fd)
+    key = HashCache.key(before, algorithm)
+    digest = HASH_CACHE.get(key)
+    if digest is not None:
+        return digest, before
+    hasher = new_hasher(algorithm)
+    offset = 0
+    while True:
+        chunk = os.pread(fd, HASH_READ_SIZE, offset)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        offset += len(chunk)
+    digest = hasher.hexdigest()
+    with HASH_CACHE.lock:
+        HASH_CACHE.stats["bytes_hashed"] += offset
+    if HashCache.key(os.fstat(fd), algorithm) == key:
+        HASH_CACHE.put(key, digest)
+    return digest, before
+
+def checksum_path(paths: PathResolver, sub_path: Optional[str], algorithm: str) -> Dict[str, Any]:
+    """
+    Hashes a file, or every regular file below a directory (blocking; run through run_io).
+    Symbolic links are skipped, never followed.
+
+    Returns:
+        For a file: {"type": "file", "hash", "size", "etag"}.
+        For a directory: {"type": "directory", "hash", "files": {relative path: {...}}, "truncated"},
+        where the directory hash covers the sorted (path, file hash) pairs.
+    """
+    parts = split_path(paths.base_dir, sub_path)
+    st = paths.lstat(sub_path)
+    if stat.S_ISREG(st.st_mode):
+        fd = paths.open(sub_path, os.O_RDONLY | os.O_NONBLOCK)
+        try:
+            digest, st = hash_fd(fd, algorithm)
+        finally:
+            os.close(fd)
+        return {"type": "file", "algorithm": algorithm, "hash": digest, "size": st.st_size, "etag": file_etag(st)}
+    if not stat.S_ISDIR(st.st_mode):
+        raise IsADirectoryError(f"Not a regular file or directory: {sub_path}")
+
+    handle = paths.acquire_dir(parts)
+    files: Dict[str, Dict[str, Any]] = {}
+    truncated = False
+    try:
+        for dir_path, _, file_names, dir_fd in os.fwalk(os.curdir, dir_fd=handle.fd):  #   fd-based, never follows symlinks
+            for name in file_names:
+                if len(files) >= SYNC_MAX_TREE_FILES:
+                    truncated = True
+                    break
+                try:
+                    fd = os.open(name, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK, dir_fd=dir_fd)
+                except OSError:
+                    continue  #   Symlink, FIFO without writer, or removed meanwhile
+                try:
+                    if not stat.S_ISREG(os.fstat(fd).st_mode):
+                        continue
+                    digest, file_stat = hash_fd(fd, algorithm)
+                finally:
+                    os.close(fd)
+                relative = os.path.normpath(os.path.join(dir_path, name))
+                files[relative] = {"hash": digest, "size": file_stat.st_size, "mtime": file_stat.st_mtime}
+            if truncated:
+                break
+    finally:
+        paths.release(handle)
+    tree_hasher = new_hasher(algorithm)
+    for relative in sorted(files):
+        tree_hasher.update(f"{relative}\0{files[relative]['hash']}\n".encode("utf-8"))
+    return {"type": "directory", "algorithm": algorithm, "hash": tree_hasher.hexdigest(), "files": files, "truncated": truncated}
+
+#   --- Rolling Checksums ---
+#   The weak checksum of a block x[0..L-1] is the rsync-style pair
+#       a = sum(x[i]) mod 2^16,  b = sum((L - i) * x[i]) mod 2^16,  weak = a + (b << 16)
+#   Clients computing signatures or deltas themselves must use the same definition.
+def weak_checksums(buffer, block_size: int, step: int = 1):
+    """
+    Returns the weak checksums of every block_size window of buffer starting at
+    multiples of step, computed with prefix sums (no per-byte Python loop).
+    The sums are kept in uint32: only their values mod 2^16 matter, and 2^16
+    divides 2^32, so wrap-around does not change the result.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    if len(data) < block_size:
+        return np.zeros(0, dtype=np.uint32)
+    index = np.arange(len(data), dtype=np.uint32)
+    s1 = np.zeros(len(data) + 1, dtype=np.uint32)
+    s2 = np.zeros(len(data) + 1, dtype=np.uint32)
+    np.cumsum(data, dtype=np.uint32, out=s1[1:])
+    np.cumsum(data * index, dtype=np.uint32, out=s2[1:])
+    starts = index[:len(data) - block_size + 1:step]
+    window_sum = s1[starts + block_size] - s1[starts]
+    weighted = s2[starts + block_size] - s2[starts]
+    a = window_sum & 0xFFFF
+    b = ((starts + block_size) * window_sum - weighted) & 0xFFFF
+    return a | (b << 16)
+
+def block_signature(buffer, block_size: int, algorithm: str) -> List[List[Any]]:
+    """
+    Returns [weak, strong] for every full block of buffer. A trailing partial block
+    is not included; deltas always send it as literal data.
+    """
+    full_size = len(buffer) // block_size * block_size
+    span = max(block_size, SYNC_WINDOW - SYNC_WINDOW % block_size)  #   Whole blocks per pass
+    signature: List[List[Any]] = []
+    for start in range(0, full_size, span):
+        end = min(start + span, full_size)
+        view = memoryview(buffer)[start:end]
+        weak = weak_checksums(view, block_size, block_size)
+        for number, value in enumerate(weak.tolist()):
+            offset = number * block_size
+            signature.append([value, block_digest(view[offset:offset + block_size], algorithm)])
+    return signature
+
+def compute_delta(buffer, block_size: int, blocks: List[List[Any]], algorithm: str) -> List[Dict[str, Any]]:
+    """
+    Computes the operations that turn a file with the given block signature into buffer.
+
+    Returns:
+        A list of {"copy": block index, "count": n} (n consecutive blocks of the basis file)
+        and {"data": base64 literal} operations.
+    """
+    ops: List[Dict[str, Any]] = []
+
+    def emit_literal(start: int, end: int):
+        if end > start:
+            ops.append({"data": base64.b64encode(bytes(memoryview(buffer)[start:end])).decode("ascii")})
+
+    def emit_copy(index: int):
+        if ops and "copy" in ops[-1] and ops[-1]["copy"] + ops[-1]["count"] == index:
+            ops[-1]["count"] += 1
+        else:
+            ops.append({"copy": index, "count": 1})
+
+    strong_by_weak: Dict[int, Dict[str, int]] = {}
+    for index, (weak, strong) in enumerate(blocks):
+        strong_by_weak.setdefault(int(weak), {}).setdefault(strong, index)
+    #   Bitmap prefilter on the low bits of the weak checksum; exact matches are
+    #   checked against strong_by_weak (much cheaper than np.isin on every offset)
+    weak_filter = np.zeros(WEAK_FILTER_MASK + 1, dtype=bool)
+    weak_filter[np.fromiter(strong_by_weak.keys(), dtype=np.int64, count=len(strong_by_weak)) & WEAK_FILTER_MASK] = True
+    size = len(buffer)
+    literal_start = position = 0
+    window_start = 0
+    while window_start <= size - block_size and strong_by_weak:
+        window_end = min(size, window_start + SYNC_WINDOW + block_size - 1)
+        weak = weak_checksums(memoryview(buffer)[window_start:window_end], block_size)
+        candidates = np.nonzero(weak_filter[weak & WEAK_FILTER_MASK])[0] + window_start
+        cursor = 0
+        while cursor < len(candidates):
+            offset = int(candidates[cursor])
+            if offset < position:
+                cursor = int(np.searchsorted(candidates, position))
+                continue
+            candidates_by_strong = strong_by_weak.get(int(weak[offset - window_start]))
+            index = None
+            if candidates_by_strong is not None:
+                index = candidates_by_strong.get(block_digest(memoryview(buffer)[offset:offset + block_size], algorithm))
+            if index is None:
+                cursor += 1
+                continue
+            emit_literal(literal_start, offset)
+            emit_copy(index)
+            position = literal_start = offset + block_size
+            cursor += 1
+        window_start += SYNC_WINDOW
+    emit_literal(literal_start, size)
+    return ops
+
+def map_file(fd: int):
+    """Maps a file read-only (b"" for an empty file)."""
+    size = os.fstat(fd).st_size
+    return mmap.mmap(fd, size, prot=mmap.PROT_READ) if size else b""
+
+#   --- Request Models ---
+def check_block_size(value: int) -> int:
+    if not SYNC_MIN_BLOCK_SIZE <= value <= SYNC_MAX_BLOCK_SIZE:
+        raise ValueError(f"block_size must be between {SYNC_MIN_BLOCK_SIZE} and {SYNC_MAX_BLOCK_SIZE}")
+    return value
+
+class DeltaRequest(BaseModel):
+    block_size: int = SYNC_DEFAULT_BLOCK_SIZE
+    algorithm: str = DEFAULT_HASH_ALGORITHM
+    blocks: List[List[Any]]  #   [weak, strong] per block of the client's copy
+    #   Request model for /sync/delta/ endpoint
+
+    _check_block_size = validator("block_size", allow_reuse=True)(check_block_size)
+
+class ApplyDeltaRequest(BaseModel):
+    block_size: int = SYNC_DEFAULT_BLOCK_SIZE
+    algorithm: str = DEFAULT_HASH_ALGORITHM
+    ops: List[Dict[str, Any]]  #   {"copy": index, "count": n} or {"data": base64}
+    hash: Optional[str] = None  #   Expected digest of the result (verified before it replaces the file)
+    #   Request model for /sync/apply/ endpoint
+
+    _check_block_size = validator("block_size", allow_reuse=True)(check_block_size)
+
+def file_signature(paths: PathResolver, file_path: str, block_size: int, algorithm: str) -> Dict[str, Any]:
+    """Computes the block signature of a file (blocking; run through run_io)."""
+    fd = paths.open(file_path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            raise IsADirectoryError(f"Not a regular file: {file_path}")
+        buffer = map_file(fd)
+        try:
+            blocks = block_signature(buffer, block_size, algorithm)
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+    finally:
+        os.close(fd)
+    return {"block_size": block_size, "algorithm": algorithm, "size": st.st_size, "etag": file_etag(st), "blocks": blocks}
+
+def file_delta(paths: PathResolver, file_path: str, request: DeltaRequest) -> Dict[str, Any]:
+    """Computes the delta from a client's copy (given by its signature) to the server file."""
+    new_hasher(request.algorithm)  #   Validates the algorithm
+    fd = paths.open(file_path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            raise IsADirectoryError(f"Not a regular file: {file_path}")
+        buffer = map_file(fd)
+        try:
+            ops = compute_delta(buffer, request.block_size, request.blocks, request.algorithm)
+            digest, _ = hash_fd(fd, request.algorithm)  #   Lets the client verify the rebuilt file
+        finally:
+            if isinstance(buffer, mmap.mmap):
+                buffer.close()
+    finally:
+        os.close(fd)
+    return {"size": st.st_size, "etag": file_etag(st), "algorithm": request.algorithm, "hash": digest, "ops": ops}
+
+def apply_delta(paths: PathResolver, file_path: str, request: ApplyDeltaRequest, if_match: Optional[str]) -> os.stat_result:
+    """
+    Rebuilds a file from its own blocks plus literal data sent by the client, and
+    atomically replaces it (blocking; run through run_io). Copied blocks are moved
+    with copy_file_range; the result is verified against request.hash if given.
+    """
+    new_hasher(request.algorithm)
+    handle, name = paths.parent(file_path)
+    try:
+        fd = open_locked(paths, handle.fd, name)
+        try:
+            st = os.fstat(fd)
+            check_if_match(if_match, st)
+            block_size = request.block_size
+            for op in request.ops:
+                if "copy" in op:
+                    start, count = int(op["copy"]), int(op.get("count", 1))
+                    if start < 0 or count < 1 or (start + count) * block_size > st.st_size:
+                        raise ValueError(f"copy of blocks {start}..{start + count - 1} is outside the file")
+                elif "data" not in op:
+                    raise ValueError("each op needs copy or data")
+
+            def write_body(temp_fd: int):
+                for op in request.ops:
+                    if "copy" in op:
+                        start = int(op["copy"]) * block_size
+                        copy_range(fd, temp_fd, start, start + int(op.get("count", 1)) * block_size)
+                    else:
+                        data = base64.b64decode(op["data"], validate=True)
+                        written = 0
+                        while written < len(data):
+                            written += os.write(temp_fd, data[written:])
+                if request.hash is not None:
+                    hasher = new_hasher(request.algorithm)
+                    offset = 0
+                    while True:
+                        chunk = os.pread(temp_fd, HASH_READ_SIZE, offset)
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                        offset += len(chunk)
+                    if hasher.hexdigest() != request.hash:
+                        raise PatchConflict("Result does not match the expected hash")
+
+            return rewrite_file(handle.fd, name, fd, write_body)
+        finally:
+            os.close(fd)
+    finally:
+        paths.release(handle)
+
+def setup_sync_endpoints(app: FastAPI, base_dir: str):
+    """
+    Sets up the checksum and delta sync endpoints.
+
+    Args:
+        app: The FastAPI application instance.
+        base_dir: The base directory for file operations.
+    """
+    paths = get_path_resolver(base_dir)
+
+    def raise_for(e: Exception, path: Optional[str], action: str):
+        """Maps errors of the blocking sync functions to HTTP errors."""
+        if isinstance(e, PreconditionFailed):
+            raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(e))
+        if isinstance(e, PatchConflict):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        if isinstance(e, (FileNotFoundError, NotADirectoryError, IsADirectoryError)):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+        if isinstance(e, PermissionError):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden")
+        if isinstance(e, (ValueError, TypeError)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        logging.error(f"Error during {action} of {path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to {action}: {e}",
+        )
+
+    def require_numpy():
+        if np is None:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="Delta sync requires numpy"
+            )
+
+    @app.get("/checksum/")
+    async def get_checksum(
+        request: Request,
+        path: Optional[str] = Query(None, description="File or directory to hash (optional)"),
+        algorithm: str = Query(DEFAULT_HASH_ALGORITHM, description="Hash algorithm"),
+    ):
+        """
+        Returns the digest of a file, or of every file below a directory.
+
+        Digests are cached per file version (inode, size, mtime), so unchanged
+        files are not read again.
+        """
+        verify_api_token(request)
+        try:
+            new_hasher(algorithm)
+            parts = split_path(paths.base_dir, path)
+            op_class = "read" if parts and stat.S_ISREG((await run_io("stat", paths.lstat, path)).st_mode) else "bulk"
+            result = await run_io(op_class, checksum_path, paths, path, algorithm)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise_for(e, path, "compute checksum")
+        return await compressed_response(request, result)
+
+    @app.get("/sync/signature/")
+    async def get_signature(
+        request: Request,
+        file_path: str = Query(..., description="Path of the file"),
+        block_size: int = Query(SYNC_DEFAULT_BLOCK_SIZE, ge=SYNC_MIN_BLOCK_SIZE, le=SYNC_MAX_BLOCK_SIZE),
+        algorithm: str = Query(DEFAULT_HASH_ALGORITHM, description="Strong block hash algorithm"),
+    ):
+        """
+        Returns the block signature of a server file, for a client that wants to
+        push its local changes with /sync/apply/.
+        """
+        verify_api_token(request)
+        require_numpy()
+        try:
+            new_hasher(algorithm)
+            result = await run_io("read", file_signature, paths, file_path, block_size, algorithm)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise_for(e, file_path, "compute signature")
+        return await compressed_response(request, result)
+
+    @app.post("/sync/delta/")
+    async def get_delta(
+        request: Request,
+        file_path: str = Query(..., description="Path of the file"),
+        delta_request: DeltaRequest = Body(...),
+    ):
+        """
+        Returns the operations that turn the client's copy (described by its block
+        signature) into the server file, so the client only downloads changed blocks.
+        """
+        verify_api_token(request)
+        require_numpy()
+        try:
+            result = await run_io("read", file_delta, paths, file_path, delta_request)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise_for(e, file_path, "compute delta")
+        return await compressed_response(request, result)
+
+    @app.post("/sync/apply/")
+    async def post_apply(
+        request: Request,
+        file_path: str = Query(..., description="Path of the file"),
+        apply_request: ApplyDeltaRequest = Body(...),
+    ):
+        """
+        Rebuilds a server file from its own blocks and the client's literal data
+        (computed against /sync/signature/) and atomically replaces it. Honours If-Match.
+        """
+        verify_api_token(request)
+        try:
+            new_stat = await run_io("write", apply_delta, paths, file_path, apply_request, request.headers.get("if-match"))
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise_for(e, file_path, "apply delta")
+        etag = file_etag(new_stat)
+        logging.info(f"Delta applied: {file_path} ({len(apply_request.ops)} ops, size={new_stat.st_size})")
+        return JSONResponse(
+            {"status": "success", "message": "Delta applied", "etag": etag, "size": new_stat.st_size},
+            headers={"ETag": etag},
+        )
+
+    @app.get("/metrics/checksum/")
+    async def get_checksum_metrics(request: Request):
+        """
+        Returns digest cache counters and the available hash algorithms.
+        """
+        verify_api_token(request)
+        return JSONResponse(dict(HASH_CACHE.metrics(), algorithms=list(HASH_ALGORITHMS)))
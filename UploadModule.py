@@ -0,0 +1,449 @@
+#   UploadModule.py
+#   Streaming (chunked) file uploads for the AION RWX API
+
+import os
+import stat
+import uuid
+import asyncio
+import logging
+from typing import Optional, Tuple
+from fastapi import FastAPI, HTTPException, status, Query, Request
+from fastapi.responses import JSONResponse
+from SecurityModule import verify_api_token  #   Import security functions
+from PathModule import get_path_resolver, PathResolver, DirHandle
+from PatchModule import open_locked
+from IOModule import run_io, write_all  #   Blocking calls run on the shared I/O pool
+
+#   --- Configuration ---
+UPLOAD_MAX_BYTES = 0  #   Maximum bytes accepted per request (0 = unlimited)
+UPLOAD_PART_SUFFIX = ".part"  #   Suffix of partial files kept for resumable uploads
+UPLOAD_MODES = ("create", "overwrite", "append")
+
+def partial_upload_name(name: str) -> str:
+    """
+    Returns the name of the partial file used for resumable uploads of a file.
+    The partial file lives next to the target so the final rename stays on one filesystem.
+
+    Args:
+        name: The file name of the upload target.
+
+    Returns:
+        The name of the hidden partial file.
+    """
+    return f".{name}{UPLOAD_PART_SUFFIX}"
+
+async def write_request_body(request: Request, fd: int) -> int:
+    """
+    Streams the request body to an open file descriptor chunk by chunk.
+    Only one chunk is held in memory at a time, independent of the upload size.
+
+    Args:
+        request: The incoming request.
+        fd: A file descriptor opened for writing at the desired position.
+
+    Returns:
+        The number of bytes written.
+
+    Raises:
+        HTTPException: 413 Request Entity Too Large if UPLOAD_MAX_BYTES is exceeded.
+    """
+    written = 0
+    async for chunk in request.stream():
+        if not chunk:
+            continue
+        written += len(chunk)
+        if UPLOAD_MAX_BYTES and written > UPLOAD_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Upload too large"
+            )
+        await run_io("write", write_all, fd, chunk)
+    return written
+
+def commit_upload(dir_fd: int, source_name: str, target_name: str, mode: str):
+    """
+    Atomically moves a fully written upload into place within its directory.
+
+    Args:
+        dir_fd: Descriptor of the directory holding both files.
+        source_name: The temporary or partial file holding the uploaded data.
+        target_name: The final name of the file.
+        mode: "create" refuses to replace an existing file, "overwrite" replaces it.
+
+    Raises:
+        HTTPException: 409 Conflict if mode is "create" and the target already exists.
+    """
+    if mode == "create":
+        try:
+            #   Fails atomically if the target exists
+            os.link(source_name, target_name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd, follow_symlinks=False)
+        except FileExistsError:
+            os.unlink(source_name, dir_fd=dir_fd)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail="File already exists"
+            )
+        os.unlink(source_name, dir_fd=dir_fd)
+    else:
+        os.replace(source_name, target_name, src_dir_fd=dir_fd, dst_dir_fd=dir_fd)
+
+def check_target(dir_fd: int, name: str, mode: str):
+    """
+    Validates the upload target inside its (already resolved) directory.
+
+    Raises:
+        HTTPException: 400 Bad Request if the target is a directory or a symlink.
+        HTTPException: 409 Conflict if the target exists in create mode.
+    """
+    try:
+        target_mode = os.stat(name, dir_fd=dir_fd, follow_symlinks=False).st_mode
+    except FileNotFoundError:
+        return
+    if stat.S_ISDIR(target_mode):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Path is a directory"
+        )
+    if stat.S_ISLNK(target_mode):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
+    if mode == "create":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="File already exists"
+        )
+
+async def resolve_parent(paths: PathResolver, file_path: str) -> Tuple[DirHandle, str]:
+    """
+    Resolves the directory of an upload target. The caller must release the handle.
+
+    Raises:
+        HTTPException: 404 Not Found if the directory does not exist.
+        HTTPException: 403 Forbidden if the path crosses a symlink or is the base directory.
+    """
+    try:
+        return await run_io("stat", paths.parent, file_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found"
+        )
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
+
+def setup_upload_endpoints(app: FastAPI, base_dir: str):
+    """
+    Sets up streaming upload endpoints (upload, resumable upload status, abort).
+
+    Args:
+        app: The FastAPI application instance.
+        base_dir: The base directory for file operations.
+    """
+    paths = get_path_resolver(base_dir)
+
+    @app.put("/upload/")
+    async def upload_file(
+        request: Request,
+        file_path: str = Query(..., description="Path of the file to write"),
+        mode: str = Query("create", description="create, overwrite or append"),
+        offset: Optional[int] = Query(None, ge=0, description="Byte offset of this chunk (resumable uploads)"),
+        length: Optional[int] = Query(None, ge=0, description="Expected number of bytes in this request"),
+        final: bool = Query(True, description="Move the resumable upload into place after this chunk"),
+    ):
+        """
+        Streams the raw request body (binary or text) into a file.
+
+        Without an offset the body is written to a temporary file in the target
+        directory and renamed into place once complete. With an offset the body is
+        written into a partial file at that position, so an interrupted upload can be
+        resumed from the offset reported by /upload/status/. Append mode writes to
+        the end of the existing file and rolls back to its original size on failure.
+
+        Args:
+            request: The incoming request.
+            file_path: The path of the file to write.
+            mode: "create" (fail if the file exists), "overwrite" or "append".
+            offset: Byte offset of this chunk within a resumable upload.
+            length: Expected number of bytes in the body (verified after the write).
+            final: Whether this chunk completes a resumable upload.
+
+        Returns:
+            A JSON response with the number of bytes received and the next offset.
+
+        Raises:
+            HTTPException: 400 Bad Request for invalid parameters or a length mismatch.
+            HTTPException: 404 Not Found if the target directory (or append target) does not exist.
+            HTTPException: 409 Conflict if the file exists in create mode, or the offset is ahead of the partial upload.
+            HTTPException: 413 Request Entity Too Large if UPLOAD_MAX_BYTES is exceeded.
+            HTTPException: 500 Internal Server Error if an error occurs while writing.
+        """
+        verify_api_token(request)
+        if mode not in UPLOAD_MODES:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid mode: {mode}"
+            )
+        if mode == "append" and offset is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Append mode does not support offset"
+            )
+        handle, name = await resolve_parent(paths, file_path)
+        try:
+            await run_io("stat", check_target, handle.fd, name, mode)
+            if mode == "append":
+                return await append_upload(request, paths, handle.fd, name, file_path, length)
+            if offset is None:
+                return await atomic_upload(request, handle.fd, name, file_path, mode, length)
+            return await resumable_upload(request, paths, handle.fd, name, file_path, mode, offset, length, final)
+        finally:
+            paths.release(handle)
+
+    @app.get("/upload/status/")
+    async def upload_status(
+        request: Request,
+        file_path: str = Query(..., description="Path of the file being uploaded"),
+    ):
+        """
+        Reports how many bytes of a resumable upload have been received.
+
+        Args:
+            request: The incoming request.
+            file_path: The path of the file being uploaded.
+
+        Returns:
+            A JSON response with the offset at which the upload should resume.
+        """
+        verify_api_token(request)
+        part_path = os.path.join(os.path.dirname(file_path), partial_upload_name(os.path.basename(file_path)))
+        try:
+            received = (await run_io("stat", paths.lstat, part_path)).st_size
+        except (FileNotFoundError, NotADirectoryError):
+            received = 0
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
+        return JSONResponse({"file_path": file_path, "offset": received})
+
+    @app.delete("/upload/")
+    async def abort_upload(
+        request: Request,
+        file_path: str = Query(..., description="Path of the file being uploaded"),
+    ):
+        """
+        Discards the partial data of a resumable upload.
+
+        Args:
+            request: The incoming request.
+            file_path: The path of the file being uploaded.
+
+        Returns:
+            A JSON response indicating the success or failure of the operation.
+
+        Raises:
+            HTTPException: 404 Not Found if there is no upload in progress.
+        """
+        verify_api_token(request)
+        part_path = os.path.join(os.path.dirname(file_path), partial_upload_name(os.path.basename(file_path)))
+        try:
+            await run_io("delete", paths.remove, part_path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="No upload in progress"
+            )
+        except PermissionError:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+            )
+        logging.info(f"Upload aborted: {part_path}")
+        return JSONResponse({"status": "success", "message": "Upload aborted"})
+
+async def atomic_upload(request: Request, dir_fd: int, name: str, file_path: str, mode: str, length: Optional[int]):
+    """
+    Streams the body to a temporary file next to the target and renames it into place.
+    """
+    temp_name = f".upload-{uuid.uuid4().hex}"
+    try:
+        fd = await run_io("write", os.open, temp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_CLOEXEC, 0o644, dir_fd=dir_fd)
+    except OSError as e:
+        logging.error(f"Error creating temporary file for {file_path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {e}",
+        )
+    try:
+        try:
+            written = await write_request_body(request, fd)
+            if length is not None and written != length:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Expected {length} bytes, received {written}",
+                )
+        finally:
+            await run_io("write", close_fd, fd, sync=True)
+        await run_io("write", commit_upload, dir_fd, temp_name, name, mode)
+    except OSError as e:
+        await run_io("delete", remove_quietly, dir_fd, temp_name)
+        logging.error(f"Error uploading file {file_path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {e}",
+        )
+    except Exception:
+        await run_io("delete", remove_quietly, dir_fd, temp_name)  #   Length mismatch, size limit or client disconnect
+        raise
+    logging.info(f"File uploaded: {file_path} ({written} bytes, mode={mode})")
+    return JSONResponse({"status": "success", "message": "File uploaded", "bytes": written, "offset": written})
+
+async def resumable_upload(request: Request, paths: PathResolver, dir_fd: int, name: str, file_path: str, mode: str, offset: int, length: Optional[int], final: bool):
+    """
+    Writes one chunk of a resumable upload into the partial file at the given offset.
+    Re-sending an already received range is allowed; skipping ahead is not.
+    """
+    part_name = partial_upload_name(name)
+    try:
+        fd, received = await run_io("write", open_partial, paths, dir_fd, part_name, offset)
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
+    except OSError as e:
+        logging.error(f"Error opening partial upload for {file_path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {e}",
+        )
+    try:
+        if offset > received:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Offset {offset} is ahead of the received data; resume at {received}",
+            )
+        try:
+            written = await write_request_body(request, fd)
+            if length is not None and written != length:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Expected {length} bytes, received {written}",
+                )
+        except BaseException:
+            #   Length mismatch, size limit, write error or client disconnect: drop the
+            #   partial chunk so /upload/status/ reports the offset to resume from
+            await asyncio.shield(run_io("write", truncate_quietly, fd, offset))
+            raise
+    except OSError as e:
+        logging.error(f"Error writing partial upload for {file_path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {e}",
+        )
+    finally:
+        await run_io("write", close_fd, fd, sync=final)
+
+    next_offset = offset + written
+    if not final:
+        return JSONResponse({"status": "success", "message": "Chunk received", "bytes": written, "offset": next_offset})
+    try:
+        await run_io("write", commit_upload, dir_fd, part_name, name, mode)
+    except OSError as e:
+        logging.error(f"Error completing upload {file_path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {e}",
+        )
+    logging.info(f"File uploaded: {file_path} ({next_offset} bytes, resumable, mode={mode})")
+    return JSONResponse({"status": "success", "message": "File uploaded", "bytes": written, "offset": next_offset})
+
+async def append_upload(request: Request, paths: PathResolver, dir_fd: int, name: str, file_path: str, length: Optional[int]):
+    """
+    Appends the body to an existing file, truncating back to the original size on failure.
+    The file is held under the exclusive flock patches use, so the rollback cannot cut
+    off data another writer appended meanwhile; a file already locked is a 409.
+    """
+    try:
+        fd, original_size = await run_io("write", open_append, paths, dir_fd, name)
+    except BlockingIOError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail="File is being modified by another request"
+        )
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
+    except OSError as e:
+        logging.error(f"Error opening {file_path} for append: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {e}",
+        )
+    try:
+        written = await write_request_body(request, fd)
+        if length is not None and written != length:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Expected {length} bytes, received {written}",
+            )
+        await run_io("write", os.fsync, fd)
+    except OSError as e:
+        await run_io("write", truncate_quietly, fd, original_size)
+        logging.error(f"Error appending to file {file_path}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to upload file: {e}",
+        )
+    except BaseException:
+        await asyncio.shield(run_io("write", truncate_quietly, fd, original_size))  #   Length mismatch, size limit or client disconnect
+        raise
+    finally:
+        await run_io("write", os.close, fd)  #   Releases the flock
+    logging.info(f"File appended: {file_path} ({written} bytes)")
+    return JSONResponse({"status": "success", "message": "File appended", "bytes": written, "offset": original_size + written})
+
+def remove_quietly(dir_fd: int, name: str):
+    """Removes a file, ignoring errors (used to clean up temporary uploads)."""
+    try:
+        os.unlink(name, dir_fd=dir_fd)
+    except OSError:
+        pass
+
+def open_partial(paths: PathResolver, dir_fd: int, part_name: str, offset: int) -> Tuple[int, int]:
+    """
+    Opens (creating if needed) the partial file of a resumable upload.
+    If offset is within the received data, the file is truncated and positioned there.
+
+    Returns:
+        The open file descriptor and the number of bytes received before this call.
+    """
+    fd = paths.open_component(dir_fd, part_name, os.O_WRONLY | os.O_CREAT)
+    received = os.fstat(fd).st_size
+    if offset <= received:
+        os.ftruncate(fd, offset)  #   Drop any data past the offset being resent
+        os.lseek(fd, offset, os.SEEK_SET)
+    return fd, received
+
+def open_append(paths: PathResolver, dir_fd: int, name: str) -> Tuple[int, int]:
+    """
+    Opens an existing file for appending under an exclusive flock and returns the
+    descriptor and its size once locked.
+
+    Raises:
+        BlockingIOError: If another request holds the lock.
+    """
+    fd = open_locked(paths, dir_fd, name, os.O_WRONLY | os.O_APPEND, blocking=False)
+    return fd, os.fstat(fd).st_size
+
+def truncate_quietly(fd: int, size: int):
+    """Truncates a file back to size, logging (not raising) errors so the original error is reported."""
+    try:
+        os.ftruncate(fd, size)
+    except OSError as e:
+        logging.error(f"Error rolling back upload to {size} bytes: {e}")
+
+def close_fd(fd: int, sync: bool = False):
+    """Closes a file descriptor, optionally flushing it to disk first."""
+    try:
+        if sync:
+            os.fsync(fd)
+    finally:
+        os.close(fd)
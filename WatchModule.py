@@ -0,0 +1,796 @@
+#   WatchModule.py
+#   File change notifications (SSE and long-poll) for the AION RWX API
+#
+#   One inotify instance serves every subscriber. Directories are watched once,
+#   however many clients subscribe to them (watches are reference-counted), and a
+#   single reader thread translates kernel events into
+#       {"type": "create" | "modify" | "delete" | "rename", "path": ..., "is_dir": ...}
+#   and hands them to the subscribers whose path or subtree they fall under.
+#   Each subscriber coalesces bursts (many modify events on a file being written
+#   become one) before they are sent, and in tail mode reads the bytes appended to
+#   a growing file instead of reporting modify events.
+
+import os
+import time
+import uuid
+import errno
+import codecs
+import base64
+import select
+import stat
+import struct
+import asyncio
+import ctypes
+import ctypes.util
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from fastapi import FastAPI, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from SecurityModule import verify_api_token
+from IOModule import run_io
+from PathModule import PathResolver, get_path_resolver, split_path
+from SerializationModule import encode_json
+
+#   --- Configuration ---
+WATCH_COALESCE_SECONDS = 0.05  #   Events arriving within this window after the first are merged into one batch
+WATCH_HEARTBEAT_SECONDS = 15  #   SSE comment sent when idle, so proxies keep the stream open
+WATCH_MAX_SUBSCRIBERS = 256  #   Concurrent SSE streams and long-poll cursors
+WATCH_MAX_DIRECTORIES = 4096  #   Directories a single recursive subscription may watch
+WATCH_MAX_PENDING = 4096  #   Undelivered events per subscriber before it gets an "overflow" event
+WATCH_TAIL_CHUNK = 64 * 1024  #   Maximum data per "append" event
+WATCH_TAIL_MAX_BYTES = 1024 * 1024  #   Data read per batch in tail mode; the rest follows in the next batch
+WATCH_POLL_TIMEOUT = 25  #   Default long-poll wait in seconds
+WATCH_POLL_MAX_TIMEOUT = 60
+WATCH_POLL_LEASE = 60  #   Seconds a long-poll cursor survives without being polled
+WATCH_MAX_CURSORS = 128  #   Open long-poll cursors (part of WATCH_MAX_SUBSCRIBERS, leaving room for SSE streams)
+WATCH_REAP_INTERVAL = 15  #   Seconds between sweeps for expired cursors
+
+#   --- inotify (Linux) ---
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+WATCH_MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR | IN_EXCL_UNLINK
+EVENT_HEADER = struct.Struct("iIII")  #   wd, mask, cookie, len (struct inotify_event)
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+    _inotify_init1 = _libc.inotify_init1
+    _inotify_add_watch = _libc.inotify_add_watch
+    _inotify_rm_watch = _libc.inotify_rm_watch
+    _inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    INOTIFY_AVAILABLE = os.path.isdir("/proc/self/fd")  #   Watches are added through /proc/self/fd/<dirfd>
+except (OSError, AttributeError):
+    INOTIFY_AVAILABLE = False
+
+class WatchLimitError(Exception):
+    """Raised when a subscription would exceed WATCH_MAX_DIRECTORIES or the kernel watch limit."""
+
+def join_parts(parts: Tuple[str, ...]) -> str:
+    return "/".join(parts)
+
+class Tail:
+    """
+    Follows the content of one file for a tail-mode subscriber. The file is
+    re-opened when it is replaced (new inode) and read from the start after a
+    truncation. Methods are blocking; run them through run_io.
+    """
+
+    def __init__(self, paths: PathResolver, sub_path: str, offset: Optional[int], encoding: str):
+        self.paths = paths
+        self.sub_path = sub_path
+        self.offset = offset  #   None: start at the current end of the file
+        self.encoding = encoding
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.fd: Optional[int] = None
+        self.ino: Optional[int] = None
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def reopen(self) -> bool:
+        """Makes self.fd refer to the file currently at sub_path. Returns False if there is none."""
+        try:
+            st = self.paths.lstat(self.sub_path)
+        except FileNotFoundError:
+            self.close()
+            if self.offset is None:
+                self.offset = 0  #   Not created yet: follow it from its first byte
+            return False
+        if not stat.S_ISREG(st.st_mode):
+            self.close()
+            return False
+        if self.fd is not None and st.st_ino == self.ino:
+            return True
+        replaced = self.ino is not None
+        self.close()
+        self.fd = self.paths.open(self.sub_path, os.O_RDONLY)
+        self.ino = os.fstat(self.fd).st_ino
+        if self.offset is None:
+            self.offset = os.fstat(self.fd).st_size
+        elif replaced:
+            self.offset = 0  #   A new file (rotation, atomic rewrite) is followed from its start
+            self.decoder.reset()
+        return True
+
+    def read(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Returns the "append" (and "truncate") events for data written since the last
+        call, and whether more data than WATCH_TAIL_MAX_BYTES is waiting.
+        """
+        if not self.reopen():
+            return [], False
+        events: List[Dict[str, Any]] = []
+        size = os.fstat(self.fd).st_size
+        if size < self.offset:
+            events.append({"type": "truncate", "path": self.sub_path, "size": size})
+            self.offset = 0
+            self.decoder.reset()
+        budget = WATCH_TAIL_MAX_BYTES
+        while self.offset < size and budget > 0:
+            data = os.pread(self.fd, min(WATCH_TAIL_CHUNK, size - self.offset, budget), self.offset)
+            if not data:
+                break
+            if self.encoding == "base64":
+                text = base64.b64encode(data).decode("ascii")
+            else:
+                text = self.decoder.decode(data)  #   Keeps a multi-byte character split across reads intact
+            events.append({"type": "append", "path": self.sub_path, "offset": self.offset, "data": text})
+            self.offset += len(data)
+            budget -= len(data)
+        return events, self.offset < size
+
+class Subscriber:
+    """
+    One client subscription: a path (file or directory), whether the subtree is
+    included, and the coalesced events waiting to be sent. The watcher thread calls
+    deliver(); the client's request awaits next_batch().
+    """
+
+    def __init__(self, root: Tuple[str, ...], is_file: bool, recursive: bool, loop: asyncio.AbstractEventLoop, tail: Optional[Tail] = None):
+        self.root = root
+        self.is_file = is_file
+        self.recursive = recursive and not is_file
+        self.loop = loop
+        self.tail = tail
+        self.tail_pending = False
+        self.wds: Set[int] = set()
+        self.pending: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self.ready = asyncio.Event()
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.received = 0  #   Events delivered since the last batch, before coalescing
+
+    def covers(self, path: Tuple[str, ...]) -> bool:
+        if self.is_file:
+            return path == self.root
+        if path[:len(self.root)] != self.root:
+            return False
+        return self.recursive or len(path) <= len(self.root) + 1
+
+    def deliver(self, events: List[Dict[str, Any]]):
+        """Queues events (called by the watcher thread) and wakes the subscriber's loop."""
+        with self.lock:
+            self.received += len(events)
+            for event in events:
+                self.push(event)
+        try:
+            self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError:
+            pass  #   Loop closed; next_batch rebinds to the loop of the next poll
+
+    def push(self, event: Dict[str, Any]):
+        """Adds an event, merging it with a pending event for the same path. Caller holds self.lock."""
+        kind = event["type"]
+        if kind == "overflow":
+            self.pending.clear()
+            self.pending[("overflow",)] = event
+            return
+        if kind == "rename":
+            self.pending[("rename", len(self.pending), event["path"])] = event
+        else:
+            key = event["path"]
+            previous = self.pending.get(key)
+            if previous is None:
+                self.pending[key] = event
+            elif previous["type"] == "create" and kind == "delete":
+                del self.pending[key]  #   Came and went between two batches
+            elif previous["type"] == "create" and kind == "modify":
+                pass  #   Still a new file
+            elif previous["type"] == "delete" and kind == "create":
+                self.pending[key] = dict(event, type="modify")  #   Replaced in place
+            else:
+                self.pending[key] = event
+        if len(self.pending) > WATCH_MAX_PENDING:
+            WATCH_STATS["overflows"] += 1
+            self.pending.clear()
+            self.pending[("overflow",)] = {"type": "overflow"}
+
+    async def next_batch(self, timeout: float) -> List[Dict[str, Any]]:
+        """
+        Waits up to timeout seconds for events, then lets a burst settle for
+        WATCH_COALESCE_SECONDS and returns it. In tail mode, events for the file
+        trigger a read and modify events are replaced by "append" events.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self.loop:
+            #   Long-poll requests of one cursor may be served by different loops
+            self.loop, self.ready = loop, asyncio.Event()
+            if self.pending:
+                self.ready.set()
+        if not self.tail_pending:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+            await asyncio.sleep(WATCH_COALESCE_SECONDS)
+        self.ready.clear()
+        with self.lock:
+            events = list(self.pending.values())
+            self.pending.clear()
+            WATCH_STATS["coalesced"] += max(0, self.received - len(events))
+            self.received = 0
+        if self.tail is not None:
+            events = [event for event in events if event["type"] != "modify"]
+            appended, self.tail_pending = await run_io("read", self.tail.read)
+            events.extend(appended)
+        for event in events:
+            self.seq += 1
+            event["id"] = self.seq
+        WATCH_STATS["delivered"] += len(events)
+        return events
+
+class Watcher:
+    """
+    The shared inotify instance: reference-counted directory watches, the reader
+    thread and the subscriber registry.
+    """
+
+    def __init__(self, paths: PathResolver):
+        self.paths = paths
+        self.fd: Optional[int] = None
+        self.lock = threading.RLock()
+        self.wd_parts: Dict[int, Tuple[str, ...]] = {}
+        self.wd_refs: Dict[int, int] = {}
+        self.subscribers: Set[Subscriber] = set()
+        self.thread: Optional[threading.Thread] = None
+        self.wake_r: Optional[int] = None
+        self.wake_w: Optional[int] = None
+
+    def start(self):
+        """Creates the inotify instance and the reader thread (on first use)."""
+        with self.lock:
+            if self.fd is not None:
+                return
+            fd = _inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error))
+            self.fd = fd
+            self.wake_r, self.wake_w = os.pipe()
+            self.thread = threading.Thread(target=self.run, name="aion-watch", daemon=True)
+            self.thread.start()
+            logging.info("File watcher started.")
+
+    def stop(self):
+        with self.lock:
+            if self.fd is None:
+                return
+            os.write(self.wake_w, b"x")
+        self.thread.join(timeout=5)
+        with self.lock:
+            for fd in (self.fd, self.wake_r, self.wake_w):
+                os.close(fd)
+            self.fd = self.wake_r = self.wake_w = None
+            self.wd_parts.clear()
+            self.wd_refs.clear()
+            self.subscribers.clear()
+
+    #   --- Watches ---
+    def add_watch(self, dir_fd: int, parts: Tuple[str, ...]) -> int:
+        """Watches the directory behind dir_fd (an O_PATH descriptor from the resolver)."""
+        wd = _inotify_add_watch(self.fd, f"/proc/self/fd/{dir_fd}".encode(), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise WatchLimitError("The inotify watch limit is reached (fs.inotify.max_user_watches)")
+            raise OSError(error, os.strerror(error))
+        self.wd_parts[wd] = parts
+        return wd
+
+    def watch_tree(self, parts: Tuple[str, ...], recursive: bool) -> Tuple[List[int], List[Tuple[Tuple[str, ...], bool]]]:
+        """
+        Watches a directory (and with recursive=True every directory below it,
+        without following symlinks). Caller holds self.lock.
+
+        Returns:
+            The watch descriptors and the (path, is_dir) entries found below the directory.
+        """
+        handle = self.paths.acquire_dir(parts)
+        try:
+            if not recursive:
+                return [self.add_watch(handle.fd, parts)], []
+            wds: List[int] = []
+            found: List[Tuple[Tuple[str, ...], bool]] = []
+            try:
+                for dir_path, dir_names, file_names, dir_fd in os.fwalk(os.curdir, dir_fd=handle.fd):
+                    relative = os.path.relpath(dir_path, os.curdir)
+                    dir_parts = parts if relative == os.curdir else parts + tuple(relative.split(os.sep))
+                    if len(wds) >= WATCH_MAX_DIRECTORIES:
+                        raise WatchLimitError(f"More than {WATCH_MAX_DIRECTORIES} directories below {join_parts(parts) or '.'}")
+                    wds.append(self.add_watch(dir_fd, dir_parts))
+                    found.extend((dir_parts + (name,), True) for name in dir_names)
+                    found.extend((dir_parts + (name,), False) for name in file_names)
+            except BaseException:
+                for wd in wds:
+                    if wd not in self.wd_refs:
+                        self.drop(wd)  #   Added by this walk and not used by anyone else
+                raise
+            return wds, found
+        finally:
+            self.paths.release(handle)
+
+    def hold(self, subscriber: Subscriber, wds: List[int]):
+        """Adds the subscriber's references to watch descriptors. Caller holds self.lock."""
+        for wd in wds:
+            if wd not in subscriber.wds:
+                subscriber.wds.add(wd)
+                self.wd_refs[wd] = self.wd_refs.get(wd, 0) + 1
+
+    def drop(self, wd: int):
+        """Removes a watch and forgets its path. Caller holds self.lock."""
+        self.wd_refs.pop(wd, None)
+        if self.wd_parts.pop(wd, None) is not None:
+            _inotify_rm_watch(self.fd, wd)
+
+    def subscribe(self, subscriber: Subscriber):
+        """
+        Registers a subscriber and watches what it covers: the directory itself (or
+        its subtree), or the parent directory of a file.
+
+        Raises:
+            WatchLimitError: If the subtree is too large or the kernel limit is reached.
+            FileNotFoundError: If the directory (or a file's parent) does not exist.
+        """
+        self.start()
+        with self.lock:
+            if len(self.subscribers) >= WATCH_MAX_SUBSCRIBERS:
+                raise WatchLimitError(f"Too many watch subscriptions (max {WATCH_MAX_SUBSCRIBERS})")
+            directory = subscriber.root[:-1] if subscriber.is_file else subscriber.root
+            try:
+                wds, _ = self.watch_tree(directory, subscriber.recursive)
+                self.hold(subscriber, wds)
+            except BaseException:
+                self.unsubscribe(subscriber)
+                raise
+            self.subscribers.add(subscriber)
+            WATCH_STATS["subscriptions"] += 1
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Removes a subscriber and the watches no other subscriber uses."""
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            for wd in subscriber.wds:
+                if wd in self.wd_refs:
+                    self.wd_refs[wd] -= 1
+                    if self.wd_refs[wd] <= 0 and self.fd is not None:
+                        self.drop(wd)
+            subscriber.wds.clear()
+        if subscriber.tail is not None:
+            subscriber.tail.close()
+
+    #   --- Reader Thread ---
+    def run(self):
+        while True:
+            readable, _, _ = select.select([self.fd, self.wake_r], [], [])
+            if self.wake_r in readable:
+                return
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                logging.error(f"File watcher read failed: {e}")
+                return
+            try:
+                with self.lock:
+                    self.dispatch(self.translate(buffer))
+            except Exception as e:
+                logging.error(f"File watcher dispatch failed: {e}")
+
+    def translate(self, buffer: bytes) -> List[Dict[str, Any]]:
+        """
+        Turns raw inotify events into API events. Moves are paired by cookie into
+        "rename"; a move without its other half becomes "delete" or "create".
+        New directories below recursive subscriptions are watched immediately.
+        Caller holds self.lock.
+        """
+        events: List[Dict[str, Any]] = []
+        moves: Dict[int, Tuple[int, Dict[str, Any]]] = {}
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = os.fsdecode(buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+            WATCH_STATS["kernel_events"] += 1
+            if mask & IN_Q_OVERFLOW:
+                WATCH_STATS["overflows"] += 1
+                events.append({"type": "overflow"})
+                continue
+            if mask & IN_IGNORED:
+                self.wd_refs.pop(wd, None)
+                self.wd_parts.pop(wd, None)
+                continue
+            parts = self.wd_parts.get(wd)
+            if parts is None:
+                continue
+            is_dir = bool(mask & IN_ISDIR)
+            path = parts + (name,) if name else parts
+            event = {"type": None, "path": path, "is_dir": is_dir}
+            if mask & IN_CREATE:
+                event["type"] = "create"
+            elif mask & IN_MODIFY:
+                event["type"] = "modify"
+            elif mask & IN_DELETE:
+                event["type"] = "delete"
+            elif mask & IN_DELETE_SELF:
+                event.update(type="delete", is_dir=True, self=True)  #   Only reported to subscribers of that directory
+            elif mask & IN_MOVED_FROM:
+                event["type"] = "delete"  #   Until its IN_MOVED_TO arrives
+                moves[cookie] = (len(events), event)
+            elif mask & IN_MOVED_TO:
+                source = moves.pop(cookie, None)
+                if source is not None:
+                    index, source_event = source
+                    events[index] = {"type": "rename", "path": source_event["path"], "new_path": path, "is_dir": is_dir}
+                    if is_dir:
+                        self.move_watches(source_event["path"], path)
+                    continue
+                event["type"] = "create"
+            else:
+                continue
+            events.append(event)
+            if is_dir and event["type"] == "create":
+                events.extend(self.watch_new_directory(path))
+        for _, event in moves.values():
+            if event["is_dir"]:
+                self.forget_watches(event["path"])  #   Moved out of the tree
+        return events
+
+    def watch_new_directory(self, path: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """
+        Extends recursive subscriptions to a new directory. Entries created before
+        the watch was in place are reported as "create" events.
+        """
+        holders = [subscriber for subscriber in self.subscribers if subscriber.recursive and subscriber.covers(path)]
+        if not holders:
+            return []
+        try:
+            wds, found = self.watch_tree(path, True)
+        except (OSError, WatchLimitError) as e:
+            logging.warning(f"Could not watch new directory {join_parts(path)}: {e}")
+            return []
+        for subscriber in holders:
+            self.hold(subscriber, wds)
+        return [{"type": "create", "path": entry, "is_dir": is_dir} for entry, is_dir in found]
+
+    def move_watches(self, old: Tuple[str, ...], new: Tuple[str, ...]):
+        """Updates the paths of watches below a renamed directory (the watches follow the inode)."""
+        for wd, parts in list(self.wd_parts.items()):
+            if parts[:len(old)] == old:
+                self.wd_parts[wd] = new + parts[len(old):]
+
+    def forget_watches(self, path: Tuple[str, ...]):
+        for wd, parts in list(self.wd_parts.items()):
+            if parts[:len(path)] == path:
+                self.drop(wd)
+
+    def dispatch(self, events: List[Dict[str, Any]]):
+        """Hands each subscriber the events it covers. Caller holds self.lock."""
+        if not events:
+            return
+        for subscriber in list(self.subscribers):
+            matched = []
+            for event in events:
+                kind = event["type"]
+                if kind == "overflow":
+                    matched.append(event)
+                elif kind == "rename":
+                    old_in, new_in = subscriber.covers(event["path"]), subscriber.covers(event["new_path"])
+                    if old_in and new_in:
+                        matched.append(dict(event, path=join_parts(event["path"]), new_path=join_parts(event["new_path"])))
+                    elif old_in:
+                        matched.append({"type": "delete", "path": join_parts(event["path"]), "is_dir": event["is_dir"]})
+                    elif new_in:
+                        matched.append({"type": "create", "path": join_parts(event["new_path"]), "is_dir": event["is_dir"]})
+                elif event.get("self"):
+                    if event["path"] == subscriber.root:
+                        matched.append({"type": kind, "path": join_parts(event["path"]), "is_dir": True})
+                elif subscriber.covers(event["path"]):
+                    matched.append(dict(event, path=join_parts(event["path"])))
+            if not matched:
+                continue
+            subscriber.deliver(matched)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"watches": len(self.wd_parts), "subscribers": len(self.subscribers)}
+
+WATCH_STATS = {"subscriptions": 0, "kernel_events": 0, "delivered": 0, "coalesced": 0, "overflows": 0, "cursors_expired": 0}
+_watchers: Dict[str, Watcher] = {}
+
+def get_watcher(base_dir: str) -> Watcher:
+    """Returns the shared watcher for a base directory."""
+    paths = get_path_resolver(base_dir)
+    watcher = _watchers.get(paths.base_dir)
+    if watcher is None:
+        watcher = _watchers.setdefault(paths.base_dir, Watcher(paths))
+    return watcher
+
+def sse_event(event: Dict[str, Any]) -> str:
+    """Formats an event as a Server-Sent Events message."""
+    return f"id: {event.get('id', 0)}\nevent: {event['type']}\ndata: {encode_json(event).decode('utf-8')}\n\n"
+
+def setup_watch_endpoints(app: FastAPI, base_dir: str):
+    """
+    Sets up the file watch endpoints (SSE stream and long-poll).
+
+    Args:
+        app: The FastAPI application instance.
+        base_dir: The base directory for file operations.
+    """
+    paths = get_path_resolver(base_dir)
+    watcher = get_watcher(base_dir)
+    cursors: Dict[str, Tuple[Subscriber, List[float]]] = {}  #   cursor -> (subscriber, [lease expiry, polling flag])
+    cursors_lock = threading.Lock()  #   Shared with the reaper thread
+    reaper: Dict[str, Any] = {"thread": None, "stopping": threading.Event()}
+
+    def stop_reaper():
+        reaper["stopping"].set()
+
+    app.router.add_event_handler("shutdown", stop_reaper)
+    app.router.add_event_handler("shutdown", watcher.stop)
+
+    def require_inotify():
+        if not INOTIFY_AVAILABLE:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="File watching requires inotify (Linux)"
+            )
+
+    async def open_subscription(path: Optional[str], recursive: bool, tail: bool, offset: Optional[int], encoding: str) -> Subscriber:
+        """Validates the watch parameters and registers a subscriber."""
+        require_inotify()
+        if encoding not in ("utf-8", "base64"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="encoding must be utf-8 or base64")
+        root = split_path(paths.base_dir, path)
+        try:
+            st = await run_io("stat", paths.lstat, path)
+            if stat.S_ISLNK(st.st_mode):
+                raise PermissionError(errno.EACCES, "Symbolic links are not allowed", path)
+            is_file = not stat.S_ISDIR(st.st_mode)
+        except FileNotFoundError:
+            is_file = True  #   A file that does not exist yet; its parent is watched
+        except PermissionError:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden")
+        except NotADirectoryError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Path not found")
+        if is_file and not root:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid path")
+        if tail and not is_file:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="tail requires a file path")
+        subscriber = Subscriber(
+            root, is_file, recursive, asyncio.get_running_loop(),
+            Tail(paths, join_parts(root), offset, encoding) if tail else None,
+        )
+        try:
+            await run_io("stat", watcher.subscribe, subscriber)
+            if subscriber.tail is not None:
+                await run_io("read", subscriber.tail.reopen)
+        except WatchLimitError as e:
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+        except (FileNotFoundError, NotADirectoryError):
+            watcher.unsubscribe(subscriber)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Path not found")
+        except PermissionError:
+            watcher.unsubscribe(subscriber)
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden")
+        except OSError as e:
+            watcher.unsubscribe(subscriber)
+            logging.error(f"Error watching {path}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to watch path: {e}"
+            )
+        return subscriber
+
+    def ready_event(subscriber: Subscriber) -> Dict[str, Any]:
+        event = {"type": "ready", "path": join_parts(subscriber.root), "recursive": subscriber.recursive, "file": subscriber.is_file}
+        if subscriber.tail is not None:
+            event["offset"] = subscriber.tail.offset
+        return event
+
+    def expire_cursors():
+        """Closes cursors whose lease ran out while nobody was polling them."""
+        now = time.monotonic()
+        with cursors_lock:
+            expired = [cursor for cursor, (_, lease) in cursors.items() if not lease[1] and lease[0] < now]
+            subscribers = [cursors.pop(cursor)[0] for cursor in expired]
+        for subscriber in subscribers:
+            watcher.unsubscribe(subscriber)
+        WATCH_STATS["cursors_expired"] += len(subscribers)
+
+    def reap_cursors(stopping: threading.Event):
+        """Expires abandoned cursors every WATCH_REAP_INTERVAL, even when no client polls."""
+        while not stopping.wait(WATCH_REAP_INTERVAL):
+            try:
+                expire_cursors()
+            except Exception as e:
+                logging.error(f"Watch cursor expiry failed: {e}")
+
+    def start_reaper():
+        """Starts the reaper thread with the first cursor (again after a shutdown)."""
+        with cursors_lock:
+            thread = reaper["thread"]
+            if thread is not None and thread.is_alive() and not reaper["stopping"].is_set():
+                return
+            reaper["stopping"] = threading.Event()
+            reaper["thread"] = threading.Thread(target=reap_cursors, args=(reaper["stopping"],), name="aion-watch-reaper", daemon=True)
+            reaper["thread"].start()
+
+    def cursors_full() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many long-poll cursors (max {WATCH_MAX_CURSORS})",
+            headers={"Retry-After": str(WATCH_REAP_INTERVAL)},
+        )
+
+    @app.get("/watch/")
+    async def watch(
+        request: Request,
+        path: Optional[str] = Query(None, description="File or directory to watch (defaults to the base directory)"),
+        recursive: bool = Query(False, description="Include the whole subtree of a directory"),
+        tail: bool = Query(False, description="Stream data appended to the file"),
+        offset: Optional[int] = Query(None, ge=0, description="Tail start offset (defaults to the end of the file)"),
+        encoding: str = Query("utf-8", description="Tail data encoding: utf-8 or base64"),
+    ):
+        """
+        Streams change events for a file or directory as Server-Sent Events.
+
+        Events: create, modify, delete, rename (with new_path), overflow (events were
+        lost; rescan), and in tail mode append (offset, data) and truncate.
+        """
+        verify_api_token(request)
+        subscriber = await open_subscription(path, recursive, tail, offset, encoding)
+        logging.info(f"Watch stream opened: {path} (recursive={recursive}, tail={tail})")
+
+        async def stream():
+            try:
+                yield sse_event(ready_event(subscriber))
+                while True:
+                    events = await subscriber.next_batch(WATCH_HEARTBEAT_SECONDS)
+                    if not events:
+                        if await request.is_disconnected():
+                            return
+                        yield ": keepalive\n\n"
+                        continue
+                    yield "".join(sse_event(event) for event in events)
+            finally:
+                watcher.unsubscribe(subscriber)
+
+        return StreamingResponse(
+            stream(), media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/watch/poll/")
+    async def watch_poll(
+        request: Request,
+        cursor: Optional[str] = Query(None, description="Cursor from the previous poll"),
+        path: Optional[str] = Query(None, description="File or directory to watch (first poll only)"),
+        recursive: bool = Query(False),
+        tail: bool = Query(False),
+        offset: Optional[int] = Query(None, ge=0),
+        encoding: str = Query("utf-8"),
+        timeout: float = Query(WATCH_POLL_TIMEOUT, ge=0, le=WATCH_POLL_MAX_TIMEOUT, description="Seconds to wait for events"),
+    ):
+        """
+        Long-poll variant of /watch/. The first call (without cursor) subscribes and
+        returns a cursor immediately; each following call returns the events since
+        the previous one, waiting up to timeout seconds for the first. A cursor that
+        is not polled for WATCH_POLL_LEASE seconds expires (410). At most
+        WATCH_MAX_CURSORS cursors may be open at once (503).
+        """
+        verify_api_token(request)
+        if cursor is None:
+            expire_cursors()
+            if len(cursors) >= WATCH_MAX_CURSORS:
+                raise cursors_full()
+            subscriber = await open_subscription(path, recursive, tail, offset, encoding)
+            cursor = uuid.uuid4().hex
+            with cursors_lock:
+                full = len(cursors) >= WATCH_MAX_CURSORS  #   Filled up while this one subscribed
+                if not full:
+                    cursors[cursor] = (subscriber, [time.monotonic() + WATCH_POLL_LEASE, False])
+            if full:
+                watcher.unsubscribe(subscriber)
+                raise cursors_full()
+            start_reaper()
+            return JSONResponse({"cursor": cursor, "events": [ready_event(subscriber)]})
+        with cursors_lock:
+            entry = cursors.get(cursor)
+            if entry is None:
+                raise HTTPException(status_code=status.HTTP_410_GONE, detail="Unknown or expired cursor")
+            subscriber, lease = entry
+            if lease[1]:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Cursor is already being polled")
+            lease[1] = True  #   Claimed under the lock, so the reaper cannot close it mid-poll
+        try:
+            events = await subscriber.next_batch(timeout)
+        finally:
+            lease[0] = time.monotonic() + WATCH_POLL_LEASE
+            lease[1] = False
+        return JSONResponse({"cursor": cursor, "events": events})
+
+    @app.delete("/watch/poll/")
+    async def close_watch_poll(request: Request, cursor: str = Query(..., description="Cursor to close")):
+        """
+        Ends a long-poll subscription.
+        """
+        verify_api_token(request)
+        request.state.read_only = True  #   Does not modify files
+        with cursors_lock:
+            entry = cursors.pop(cursor, None)
+        if entry is None:
+            raise HTTPException(status_code=status.HTTP_410_GONE, detail="Unknown or expired cursor")
+        watcher.unsubscribe(entry[0])
+        return JSONResponse({"status": "success", "message": "Watch closed"})
+
+    @app.get("/metrics/watch/")
+    async def get_watch_metrics(request: Request):
+        """
+        Returns watcher counters: watches, subscribers, events and overflows.
+        """
+        verify_api_token(request)
+        return JSONResponse(dict(WATCH_STATS, **watcher.metrics(), cursors=len(cursors), max_cursors=WATCH_MAX_CURSORS, inotify=INOTIFY_AVAILABLE))
+
+#   --- Benchmark ---
+if __name__ == "__main__":
+    import tempfile
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    async def main():
+        with tempfile.TemporaryDirectory() as base_dir:
+            watcher = get_watcher(base_dir)
+            subscriber = Subscriber(("logs", "app.log"), True, False, asyncio.get_running_loop())
+            os.mkdir(os.path.join(base_dir, "logs"))
+            watcher.subscribe(subscriber)
+            latencies = []
+            with open(os.path.join(base_dir, "logs", "app.log"), "a") as file:
+                for index in range(200):
+                    started = time.perf_counter()
+                    file.write(f"line {index}\n")
+                    file.flush()
+                    await asyncio.wait_for(subscriber.ready.wait(), 5)
+                    latencies.append(time.perf_counter() - started)
+                    subscriber.ready.clear()
+                    subscriber.pending.clear()
+            watcher.unsubscribe(subscriber)
+            watcher.stop()
+            latencies.sort()
+            print(f"write -> event: median {latencies[len(latencies) // 2] * 1e6:.0f} us, "
+                  f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f} us "
+                  f"(a client polling every 100 ms waits 50 ms on average)")
+
+    asyncio.run(main())
@@ -0,0 +1,234 @@
+#   WorkerPoolModule.py
+#   Warm interpreter pool for whitelisted Python script execution in the AION RWX API
+
+import os
+import sys
+import json
+import time
+import queue
+import select
+import signal
+import shlex
+import asyncio
+import logging
+import threading
+import subprocess
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI
+
+#   --- Configuration ---
+WARM_POOL_ENABLED = os.getenv("WARM_POOL_ENABLED", "false").lower() in ("1", "true", "yes")
+WARM_POOL_SIZE = int(os.getenv("WARM_POOL_SIZE", "2"))  #   Number of pre-started interpreters
+WARM_WORKER_MAX_TASKS = 100  #   Scripts run by one interpreter before it is recycled
+WARM_POOL_PRELOAD: List[str] = [m for m in os.getenv("WARM_POOL_PRELOAD", "").split(",") if m]  #   Modules imported up front
+WARM_POOL_TIMEOUT = 15  #   Seconds per script (same as /execute/)
+WARM_POOL_MEMORY_LIMIT = 1024 * 1024 * 1024  #   Address-space limit per script, in bytes (0 = unlimited)
+WARM_POOL_CPU_LIMIT = 30  #   CPU seconds per script (0 = unlimited)
+WARM_POOL_ACQUIRE_TIMEOUT = 5  #   Seconds to wait for an idle interpreter before falling back to Popen
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_worker.py")
+
+class WarmWorker:
+    """A pre-started interpreter running warm_worker.py, which forks one child per script."""
+
+    def __init__(self, preload: List[str]):
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT] + preload,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            start_new_session=True,  #   Own process group, so a hung script can be killed with it
+        )
+        self.tasks = 0
+        ready = self.read_line(timeout=60)
+        if not ready or not json.loads(ready).get("ready"):
+            self.close()
+            raise RuntimeError("Warm worker failed to start")
+
+    def read_line(self, timeout: float) -> Optional[str]:
+        """Reads one protocol line from the worker, or returns None on timeout/EOF."""
+        readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not readable:
+            return None
+        return self.process.stdout.readline() or None
+
+    def run(self, request: Dict[str, Any], timeout: float) -> Optional[Dict[str, Any]]:
+        """Sends a script request and waits for its result (None if the worker hung or died)."""
+        self.tasks += 1
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+        line = self.read_line(timeout)
+        return json.loads(line) if line else None
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        """Kills the worker and any script it is still running."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        self.process.wait()
+
+class WarmPool:
+    """
+    A fixed number of warm interpreters. Each script runs in a freshly forked child
+    of an idle interpreter, so callers skip interpreter startup and preloaded imports
+    while scripts stay isolated from each other. Interpreters are replaced in the
+    background after WARM_WORKER_MAX_TASKS scripts or when they fail.
+    """
+
+    def __init__(self, size: int = WARM_POOL_SIZE, preload: Optional[List[str]] = None):
+        self.size = size
+        self.preload = preload if preload is not None else WARM_POOL_PRELOAD
+        self.idle: "queue.Queue[WarmWorker]" = queue.Queue()
+        self.closed = False
+        self.stats = {"runs": 0, "fallbacks": 0, "recycled": 0, "failures": 0}
+
+    def start(self):
+        """Starts the interpreters in the background."""
+        self.closed = False
+        for _ in range(self.size):
+            self.spawn_async()
+
+    def spawn_async(self):
+        threading.Thread(target=self.spawn, name="aion-warm-spawn", daemon=True).start()
+
+    def spawn(self):
+        if self.closed:
+            return
+        try:
+            worker = WarmWorker(self.preload)
+        except (OSError, RuntimeError) as e:
+            logging.error(f"Failed to start warm worker: {e}")
+            return
+        if self.closed:
+            worker.close()
+        else:
+            self.idle.put(worker)
+
+    def stop(self):
+        """Stops all idle interpreters; busy ones are closed when they are returned."""
+        self.closed = True
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def run_script(self, script: str, args: List[str], timeout: float = WARM_POOL_TIMEOUT) -> Optional[Dict[str, Any]]:
+        """
+        Runs a Python script on a warm interpreter (blocking).
+
+        Args:
+            script: Path of the script to run.
+            args: Command-line arguments for the script.
+            timeout: Seconds before the script is killed.
+
+        Returns:
+            A dictionary with returncode, stdout, stderr and timed_out, or None if no
+            interpreter was available and the caller should fall back to Popen.
+        """
+        try:
+            worker = self.idle.get(timeout=WARM_POOL_ACQUIRE_TIMEOUT)
+        except queue.Empty:
+            self.stats["fallbacks"] += 1
+            return None
+        request = {
+            "script": script,
+            "args": args,
+            "cwd": os.getcwd(),
+            "timeout": timeout,
+            "memory_limit": WARM_POOL_MEMORY_LIMIT,
+            "cpu_limit": WARM_POOL_CPU_LIMIT,
+        }
+        result = worker.run(request, timeout + 5)  #   The child enforces timeout itself via SIGALRM
+        if result is None:
+            self.stats["failures"] += 1
+            worker.close()
+            self.spawn_async()
+            result = {"returncode": -signal.SIGKILL, "stdout": "", "stderr": "Script timed out", "timed_out": True}
+        elif self.closed or not worker.alive() or worker.tasks >= WARM_WORKER_MAX_TASKS:
+            self.stats["recycled"] += 1
+            worker.close()
+            self.spawn_async()
+        else:
+            self.idle.put(worker)
+        self.stats["runs"] += 1
+        return result
+
+WARM_POOL: Optional[WarmPool] = None
+
+def warm_script_invocation(command: str) -> Optional[List[str]]:
+    """
+    Returns [script, *args] if the command is a plain "python[3] script.py ..." call
+    that can run on the warm pool, otherwise None (interpreter flags such as -m or -c
+    are left to the regular subprocess path).
+    """
+    parts = shlex.split(command)
+    if len(parts) < 2 or parts[0] not in ("python", "python3") or not parts[1].endswith(".py"):
+        return None
+    return parts[1:]
+
+async def run_warm_script(command: str) -> Optional[Dict[str, Any]]:
+    """
+    Runs a whitelisted script command on the warm pool if it is enabled and applicable.
+
+    Args:
+        command: The (already whitelisted) command.
+
+    Returns:
+        The script result, or None if the command should go through subprocess.Popen.
+    """
+    if WARM_POOL is None:
+        return None
+    invocation = warm_script_invocation(command)
+    if invocation is None:
+        return None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, WARM_POOL.run_script, invocation[0], invocation[1:])
+
+def setup_warm_pool(app: FastAPI) -> Optional[WarmPool]:
+    """
+    Creates the warm interpreter pool (if WARM_POOL_ENABLED) and ties it to the app lifecycle.
+
+    Args:
+        app: The FastAPI application instance.
+
+    Returns:
+        The pool, or None if it is disabled.
+    """
+    global WARM_POOL
+    if not WARM_POOL_ENABLED:
+        return None
+    WARM_POOL = WarmPool()
+    app.router.add_event_handler("startup", WARM_POOL.start)
+    app.router.add_event_handler("shutdown", WARM_POOL.stop)
+    return WARM_POOL
+
+#   --- Benchmark ---
+if __name__ == "__main__":
+    import tempfile
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as script_file:
+        script_file.write("import json, sys\nprint(json.dumps(sys.argv[1:]))\n")
+    runs = 50
+    started = time.perf_counter()
+    for index in range(runs):
+        subprocess.run([sys.executable, script_file.name, str(index)], capture_output=True, text=True)
+    cold = (time.perf_counter() - started) / runs
+    pool = WarmPool(size=2, preload=["json"])
+    pool.start()
+    pool.run_script(script_file.name, ["warmup"])
+    started = time.perf_counter()
+    for index in range(runs):
+        pool.run_script(script_file.name, [str(index)])
+    warm = (time.perf_counter() - started) / runs
+    pool.stop()
+    os.remove(script_file.name)
+    print(f"subprocess.run: {cold * 1000:.2f} ms/script, warm pool: {warm * 1000:.2f} ms/script")
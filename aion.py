@@ -2,20 +2,35 @@
 #   RWX (c) 2025 Gregory L. Magnusson BANKON
 #   Secure API for file and command execution with GPT-4 agent interaction
 import os
-import shutil
 import subprocess
 import logging
 import json
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends, status, Query, Body
+import re
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException, Depends, status, Query, Body, Request
 from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel, validator
 from config import BASE_DIRECTORY, API_TOKEN
-from urllib.parse import unquote
 import shlex
 from dotenv import load_dotenv
-
-app = FastAPI(title="AION RWX API")
+from SecurityModule import safe_path
+from PathModule import get_path_resolver
+from IOModule import run_io, setup_io_endpoints
+from UploadModule import setup_upload_endpoints
+from JobModule import setup_job_endpoints
+from WorkerPoolModule import setup_warm_pool, run_warm_script
+from CommandCacheModule import setup_command_cache, match_cache_policy, normalize_command, fs_generation, COMMAND_CACHE
+from PatchModule import setup_patch_endpoints, file_etag
+from SyncModule import setup_sync_endpoints
+from SessionModule import setup_session_endpoint
+from WatchModule import setup_watch_endpoints
+from CopyModule import setup_copy_endpoints
+from RateLimitModule import setup_rate_limiting
+from SerializationModule import FastJSONResponse, encoded_response
+from CompressionModule import setup_compression_endpoints, compressed_response, file_version_key
+
+app = FastAPI(title="AION RWX API", default_response_class=FastJSONResponse)
 
 #   --- Load Environment Variables ---
 load_dotenv()  #   Load variables from .env file
@@ -48,43 +63,10 @@ def verify_api_token(request: Request):
         )
 
 #   --- Path Handling ---
-def safe_path(sub_path: str) -> str:
-    """
-    Constructs a safe absolute path, preventing access outside the BASE_DIRECTORY.
-    Decodes URL-encoded paths.  Handles various edge cases.
-
-    Args:
-        sub_path: The sub-path to append to BASE_DIRECTORY.
-
-    Returns:
-        The safe absolute path.
-
-    Raises:
-        HTTPException: 403 Forbidden if the path is unsafe.
-        HTTPException: 400 Bad Request if the path is invalid.
-    """
-    if not sub_path:
-        return BASE_DIRECTORY
-    try:
-        decoded_path = unquote(sub_path)  #   Decode URL-encoded paths
-        normalized_path = os.path.normpath(decoded_path)
-        full_path = os.path.abspath(os.path.join(BASE_DIRECTORY, normalized_path))
-        if not full_path.startswith(os.path.abspath(BASE_DIRECTORY)):
-            logging.warning(f"Unsafe path access attempted: {full_path}")
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
-            )
-        return full_path
-    except ValueError as ve:
-        logging.error(f"Invalid path: {sub_path} - {ve}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid path: {ve}"
-        )
-    except Exception as e:
-        logging.error(f"Error processing path: {sub_path} - {e}")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid path"
-        )
+#   File endpoints resolve paths relative to an open descriptor of BASE_DIRECTORY without
+#   following symlinks (see PathModule.py). safe_path (SecurityModule) is the shared
+#   string-level containment check.
+PATHS = get_path_resolver(BASE_DIRECTORY)
 
 #   --- Command Whitelisting ---
 def load_whitelist() -> List[str]:
@@ -98,7 +80,11 @@ def load_whitelist() -> List[str]:
     try:
         with open("whitelist.json", "r") as file:
             whitelist_data = json.load(file)
-        return whitelist_data.get("allowed_commands", [])
+        #   Entries may be plain strings or objects with a "command" key (see CommandCacheModule)
+        return [
+            entry["command"] if isinstance(entry, dict) else entry
+            for entry in whitelist_data.get("allowed_commands", [])
+        ]
     except FileNotFoundError:
         logging.error("whitelist.json not found. API might be unstable.")
         return []  #   Return an empty list to avoid errors
@@ -167,16 +153,28 @@ async def list_files(
         HTTPException: 500 Internal Server Error if an error occurs during file listing.
     """
     verify_api_token(request)
-    target_path = safe_path(path)
-    if not os.path.exists(target_path):
+    files = await list_directory(path)
+    return await compressed_response(request, {"files": files})
+
+async def list_directory(path: Optional[str]) -> List[str]:
+    """
+    Lists a directory under BASE_DIRECTORY (shared by /list/ and the WebSocket session).
+
+    Raises:
+        HTTPException: 403, 404 or 500 as documented on /list/.
+    """
+    try:
+        return await run_io("read", PATHS.listdir, path)
+    except (FileNotFoundError, NotADirectoryError):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Folder not found"
         )
-    try:
-        files = os.listdir(target_path)
-        return JSONResponse({"files": files})
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
     except OSError as e:
-        logging.error(f"Error listing files in {target_path}: {e}")
+        logging.error(f"Error listing files in {path}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to list files: {e}",
@@ -206,17 +204,35 @@ async def read_file(
         HTTPException: 500 Internal Server Error if an error occurs while reading the file.
     """
     verify_api_token(request)
-    target_path = safe_path(file_path)
-    if not os.path.isfile(target_path):
+    content, version = await read_file_content(file_path)
+    cache_key = file_version_key(file_path, version) if version is not None else None
+    response = await compressed_response(request, {"content": content}, cache_key)
+    if version is not None:
+        response.headers["ETag"] = file_etag(version)  #   For If-Match on /patch/
+    return response
+
+async def read_file_content(file_path: str) -> Tuple[str, Optional[os.stat_result]]:
+    """
+    Reads a text file under BASE_DIRECTORY (shared by /read/ and the WebSocket session).
+
+    Returns:
+        The content and the stat result of the version read (None if it changed while reading).
+
+    Raises:
+        HTTPException: 403, 404 or 500 as documented on /read/.
+    """
+    try:
+        return await run_io("read", PATHS.read_text_versioned, file_path)  #   Resolve, open and read in one step
+    except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
         )
-    try:
-        with open(target_path, "r") as file:
-            content = file.read()
-        return JSONResponse({"content": content})
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
     except OSError as e:
-        logging.error(f"Error reading file {target_path}: {e}")
+        logging.error(f"Error reading file {file_path}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to read file: {e}",
@@ -259,7 +275,25 @@ async def execute_command(
         HTTPException: 500 Internal Server Error for unexpected errors.
     """
     verify_api_token(request)
-    command = command_request.command
+    result = await run_command(command_request.command, request.state)
+    return encoded_response(request, result)
+
+async def run_command(command: str, state: Any) -> Dict[str, Any]:
+    """
+    Runs a whitelisted command through the command cache, the warm pool or subprocess
+    (shared by /execute/ and the WebSocket session).
+
+    Args:
+        command: The (stripped) command.
+        state: request.state or the session operation state; read_only is set for
+               cacheable commands so they do not bump the filesystem generation.
+
+    Returns:
+        {"status": "success", "output": ..., "cached": ...}
+
+    Raises:
+        HTTPException: 400, 403 or 500 as documented on /execute/.
+    """
     if not command:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Command cannot be empty"
@@ -269,6 +303,46 @@ async def execute_command(
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN, detail="Command not allowed"
         )
+    cache_policy = match_cache_policy(command)  #   None unless the whitelist declares it cacheable
+    if cache_policy is not None:
+        state.read_only = True  #   Cacheable commands do not invalidate the cache themselves
+        cache_key = normalize_command(command)
+        cached_output = COMMAND_CACHE.get(cache_key)
+        if cached_output is not None:
+            logging.info(f"Command served from cache: {command}")
+            return {"status": "success", "output": cached_output, "cached": True}
+        generation = fs_generation()
+    warm_result = await run_warm_script(command)  #   None unless the warm pool is enabled and applicable
+    if warm_result is not None:
+        logging.info(f"Executed script on warm pool: {command}")
+        if warm_result["timed_out"]:
+            logging.error(f"Command timed out: {command}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Command timed out"
+            )
+        if warm_result["returncode"] != 0:
+            logging.error(f"Command failed: {command} | Error: {warm_result['stderr']}")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=warm_result["stdout"] or warm_result["stderr"] or "Command failed",
+            )
+        output = warm_result["stdout"]
+    else:
+        output = await asyncio.get_running_loop().run_in_executor(None, run_subprocess, command)  #   Keeps the event loop free
+    if cache_policy is not None:
+        COMMAND_CACHE.put(cache_key, output, cache_policy, generation)
+    return {"status": "success", "output": output, "cached": False}
+
+def run_subprocess(command: str) -> str:
+    """
+    Runs a whitelisted command with subprocess.Popen (blocking; called from an executor).
+
+    Returns:
+        The command's stdout.
+
+    Raises:
+        HTTPException: 400 if the command fails, 500 on timeout or OS errors.
+    """
     try:
         logging.info(f"Executing command: {command}")
         process = subprocess.Popen(
@@ -284,7 +358,8 @@ async def execute_command(
                 status_code=status.HTTP_400_BAD_REQUEST, detail=output or error or "Command failed"
             )
         logging.info(f"Command output: {output}")
-        return JSONResponse({"status": "success", "output": output})
+    except HTTPException:
+        raise
     except subprocess.TimeoutExpired:
         process.kill()
         logging.error(f"Command timed out: {command}")
@@ -302,6 +377,7 @@ async def execute_command(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Internal server error: {e}",
         )
+    return output
 
 #   --- File Management ---
 class FileOperationResponse(BaseModel):
@@ -331,18 +407,20 @@ async def create_file(
         HTTPException: 500 Internal Server Error if an error occurs during file creation.
     """
     verify_api_token(request)
-    target_path = safe_path(file_path)
-    if os.path.exists(target_path):
+    try:
+        await run_io("write", PATHS.write_text, file_path, content)  #   O_EXCL: no check-then-create race
+        logging.info(f"File created: {file_path}")
+        return JSONResponse({"status": "success", "message": "File created"})
+    except FileExistsError:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="File already exists"
         )
-    try:
-        with open(target_path, "w") as file:
-            file.write(content)
-        logging.info(f"File created: {target_path}")
-        return JSONResponse({"status": "success", "message": "File created"})
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
     except OSError as e:
-        logging.error(f"Error creating file {target_path}: {e}")
+        logging.error(f"Error creating file {file_path}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create file: {e}",
@@ -367,17 +445,20 @@ async def delete_file(
         HTTPException: 500 Internal Server Error if an error occurs during file deletion.
     """
     verify_api_token(request)
-    target_path = safe_path(file_path)
-    if not os.path.exists(target_path):
+    try:
+        await run_io("delete", PATHS.remove, file_path)
+        logging.info(f"File deleted: {file_path}")
+        return JSONResponse({"status": "success", "message": "File deleted"})
+    except (FileNotFoundError, NotADirectoryError):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
         )
-    try:
-        os.remove(target_path)
-        logging.info(f"File deleted: {target_path}")
-        return JSONResponse({"status": "success", "message": "File deleted"})
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
     except OSError as e:
-        logging.error(f"Error deleting file {target_path}: {e}")
+        logging.error(f"Error deleting file {file_path}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete file: {e}",
@@ -406,22 +487,24 @@ async def rename_file(
         HTTPException: 500 Internal Server Error if an error occurs during renaming.
     """
     verify_api_token(request)
-    old_path = safe_path(old_file_path)
-    new_path = safe_path(new_file_path)
-    if not os.path.exists(old_path):
+    try:
+        await run_io("write", PATHS.rename, old_file_path, new_file_path)
+        logging.info(f"File renamed from {old_file_path} to {new_file_path}")
+        return JSONResponse({"status": "success", "message": "File renamed"})
+    except (FileNotFoundError, NotADirectoryError):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
         )
-    if os.path.exists(new_path):
+    except FileExistsError:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="File already exists at new path"
         )
-    try:
-        os.rename(old_path, new_path)
-        logging.info(f"File renamed from {old_path} to {new_path}")
-        return JSONResponse({"status": "success", "message": "File renamed"})
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
     except OSError as e:
-        logging.error(f"Error renaming file from {old_path} to {new_path}: {e}")
+        logging.error(f"Error renaming file from {old_file_path} to {new_file_path}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to rename file: {e}",
@@ -449,20 +532,23 @@ async def create_directory(
         HTTPException: 500 Internal Server Error if an error occurs during directory creation.
     """
     verify_api_token(request)
-    target_path = safe_path(dir_path)
     try:
         if recursive:
-            os.makedirs(target_path, exist_ok=True)  #   Create directories recursively
+            await run_io("write", PATHS.mkdir, dir_path, parents=True, exist_ok=True)  #   Create directories recursively
         else:
-            os.makedirs(target_path)
-        logging.info(f"Directory created: {target_path} (recursive={recursive})")
+            await run_io("write", PATHS.mkdir, dir_path)
+        logging.info(f"Directory created: {dir_path} (recursive={recursive})")
         return JSONResponse({"status": "success", "message": "Directory created"})
     except FileExistsError:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Directory already exists"
         )
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
     except OSError as e:
-        logging.error(f"Error creating directory {target_path}: {e}")
+        logging.error(f"Error creating directory {dir_path}: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create directory: {e}",
@@ -490,22 +576,75 @@ async def delete_directory(
         HTTPException: 500 Internal Server Error if an error occurs during directory deletion.
     """
     verify_api_token(request)
-    target_path = safe_path(dir_path)
-    if not os.path.exists(target_path):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found"
-        )
     try:
         if recursive:
-            shutil.rmtree(target_path)
-            logging.info(f"Directory deleted recursively: {target_path}")
+            await run_io("bulk", PATHS.rmtree, dir_path)
+            logging.info(f"Directory deleted recursively: {dir_path}")
         else:
-            os.rmdir(target_path)
-            logging.info(f"Directory deleted: {target_path}")
+            await run_io("delete", PATHS.rmdir, dir_path)
+            logging.info(f"Directory deleted: {dir_path}")
         return JSONResponse({"status": "success", "message": "Directory deleted"})
+    except (FileNotFoundError, NotADirectoryError):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Directory not found"
+        )
+    except PermissionError:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Access forbidden"
+        )
     except OSError as e:
-        logging.error(f"Error deleting directory {target_path} (recursive={recursive}): {e}")
+        logging.error(f"Error deleting directory {dir_path} (recursive={recursive}): {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to delete directory: {e}",
         )
+
+#   --- I/O Pool Metrics ---
+setup_io_endpoints(app)
+
+#   --- Streaming Uploads ---
+setup_upload_endpoints(app, BASE_DIRECTORY)
+
+#   --- Background Jobs ---
+setup_job_endpoints(app, BASE_DIRECTORY, is_command_allowed)
+
+#   --- Warm Script Pool (optional) ---
+setup_warm_pool(app)
+
+#   --- Command Result Cache ---
+setup_command_cache(app)
+
+#   --- Response Compression ---
+setup_compression_endpoints(app)
+
+#   --- Ranged Edits ---
+setup_patch_endpoints(app, BASE_DIRECTORY)
+
+#   --- Checksums and Delta Sync ---
+setup_sync_endpoints(app, BASE_DIRECTORY)
+
+#   --- Server-Side Copy and Move ---
+setup_copy_endpoints(app, BASE_DIRECTORY)
+
+#   --- File Change Notifications ---
+setup_watch_endpoints(app, BASE_DIRECTORY)
+
+#   --- Multiplexed WebSocket Session ---
+async def session_list(args: Dict[str, Any], state: Any) -> Dict[str, Any]:
+    return {"files": await list_directory(args.get("path"))}
+
+async def session_read(args: Dict[str, Any], state: Any) -> Dict[str, Any]:
+    content, version = await read_file_content(args["file_path"])
+    return {"content": content, "etag": file_etag(version) if version is not None else None}
+
+async def session_execute(args: Dict[str, Any], state: Any) -> Dict[str, Any]:
+    return await run_command(ExecuteCommandRequest(command=args["command"]).command, state)
+
+setup_session_endpoint(app, {
+    "list": (session_list, True),
+    "read": (session_read, True),
+    "execute": (session_execute, False),
+})
+
+#   --- Admission Control (registered last so it runs before the other middleware) ---
+setup_rate_limiting(app)
@@ -6,15 +6,19 @@ import tensorflow as tf
 from sklearn.cluster import KMeans
 import networkx as nx
 import heapq
+import threading
 import collections
-from typing import List, Dict, Tuple, Any
+from typing import List, Dict, Tuple, Any, Optional
 import logging
+from inference import ThreatModel, THREAT_MODEL_FORMAT
+from routing import RoutingGraph
 
 #   --- Configuration ---
 #   Adjust these parameters as needed
 CNN_EPOCHS = 10
 KMEANS_CLUSTERS = 5
 PATH_WEIGHT = 'capacity'
+MAX_NETWORKS = 64  #   Resident networks (optimize_network_flow with a network_id); least recently used are dropped
 
 #   --- Logging Setup ---
 #   Ensure logging is configured (e.g., in AION.py)
@@ -22,16 +26,83 @@ PATH_WEIGHT = 'capacity'
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 #   --- AI-Powered Threat Analysis ---
-def ai_threat_analysis(threat_data: Dict[str, Any]) -> Dict[str, List[float]]:
+def fit_threat_models(indicators: np.ndarray, labels: np.ndarray) -> Tuple[tf.keras.Model, KMeans]:
+    """
+    Trains the threat CNN and fits the KMeans anomaly model.
+
+    Args:
+        indicators: (samples, features) threat indicators.
+        labels: (samples, classes) one-hot labels.
+
+    Returns:
+        The trained Keras model and the fitted KMeans model.
+    """
+    cnn_model = tf.keras.models.Sequential([
+        tf.keras.layers.Conv1D(32, 3, activation='relu', input_shape=(indicators.shape[1], 1)),
+        tf.keras.layers.MaxPooling1D(2),
+        tf.keras.layers.Flatten(),
+        tf.keras.layers.Dense(64, activation='relu'),
+        tf.keras.layers.Dense(labels.shape[1], activation='softmax')  #   Dynamically adjust output size
+    ])
+    cnn_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    cnn_data = indicators.reshape(indicators.shape[0], indicators.shape[1], 1)
+    cnn_model.fit(cnn_data, labels, epochs=CNN_EPOCHS, verbose=0)  #   Reduced verbosity
+
+    kmeans = KMeans(n_clusters=KMEANS_CLUSTERS, random_state=0, n_init='auto')
+    kmeans.fit(indicators)
+    return cnn_model, kmeans
+
+def export_threat_models(cnn_model: tf.keras.Model, kmeans: KMeans, path: Optional[str] = None) -> ThreatModel:
+    """
+    Converts fitted threat models to a ThreatModel (inference.py), which scores
+    without TensorFlow or scikit-learn.
+
+    Args:
+        cnn_model: The model trained by fit_threat_models.
+        kmeans: The KMeans model fitted by fit_threat_models.
+        path: If given, the .npz artifact is also written there.
+
+    Returns:
+        The ThreatModel.
+    """
+    conv = [layer for layer in cnn_model.layers if isinstance(layer, tf.keras.layers.Conv1D)]
+    pool = [layer for layer in cnn_model.layers if isinstance(layer, tf.keras.layers.MaxPooling1D)]
+    dense = [layer for layer in cnn_model.layers if isinstance(layer, tf.keras.layers.Dense)]
+    if len(conv) != 1 or len(pool) != 1 or len(dense) != 2:
+        raise ValueError("Unexpected threat model architecture.")
+    conv_kernel, conv_bias = conv[0].get_weights()
+    hidden_kernel, hidden_bias = dense[0].get_weights()
+    output_kernel, output_bias = dense[1].get_weights()
+    pool_size = pool[0].pool_size[0] if isinstance(pool[0].pool_size, tuple) else pool[0].pool_size
+    if conv[0].padding != 'valid' or pool[0].padding != 'valid' or tuple(conv[0].strides) != (1,) or pool[0].strides[0] != pool_size:
+        raise ValueError("Only valid padding, unit conv stride and non-overlapping pooling are exported.")
+    model = ThreatModel({
+        "format": np.int64(THREAT_MODEL_FORMAT),
+        "input_length": np.int64(cnn_model.input_shape[1]),
+        "conv_kernel": conv_kernel, "conv_bias": conv_bias, "pool_size": np.int64(pool_size),
+        "hidden_kernel": hidden_kernel, "hidden_bias": hidden_bias,
+        "output_kernel": output_kernel, "output_bias": output_bias,
+        "centroids": kmeans.cluster_centers_,
+    })
+    if path is not None:
+        model.save(path)
+    return model
+
+def ai_threat_analysis(threat_data: Dict[str, Any], export_path: Optional[str] = None) -> Dict[str, np.ndarray]:
     """
     Analyzes threat data to predict and classify potential security risks.
 
     Args:
         threat_data: A dictionary containing threat indicators and labels.
                      Example: {'indicators': [[...], [...]], 'labels': [[...], [...]]}
+        export_path: If given, the fitted models are saved there as a NumPy artifact
+                     that inference.ThreatModel can load to score new indicators
+                     without retraining or importing TensorFlow.
 
     Returns:
-        A dictionary containing CNN predictions, anomaly scores, and risk scores.
+        A dictionary containing CNN predictions, anomaly scores, and risk scores as NumPy
+        arrays. They are left as arrays so SerializationModule can encode them without
+        per-element conversion (call .tolist() if plain lists are needed).
     """
 
     try:
@@ -43,38 +114,64 @@ def ai_threat_analysis(threat_data: Dict[str, Any]) -> Dict[str, List[float]]:
         if len(indicators) == 0 or len(indicators) != len(labels):
             raise ValueError("Inconsistent number of indicators and labels.")
 
-        #   2. CNN Model
-        cnn_model = tf.keras.models.Sequential([
-            tf.keras.layers.Conv1D(32, 3, activation='relu', input_shape=(indicators.shape[1], 1)),
-            tf.keras.layers.MaxPooling1D(2),
-            tf.keras.layers.Flatten(),
-            tf.keras.layers.Dense(64, activation='relu'),
-            tf.keras.layers.Dense(labels.shape[1], activation='softmax')  #   Dynamically adjust output size
-        ])
-        cnn_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-        cnn_data = indicators.reshape(indicators.shape[0], indicators.shape[1], 1)
-        cnn_model.fit(cnn_data, labels, epochs=CNN_EPOCHS, verbose=0)  #   Reduced verbosity
-        cnn_predictions = cnn_model.predict(cnn_data, verbose=0)
-
-        #   3. Anomaly Detection
-        kmeans = KMeans(n_clusters=KMEANS_CLUSTERS, random_state=0, n_init='auto')
-        kmeans.fit(indicators)
-        anomaly_scores = kmeans.transform(indicators).min(axis=1)
-
-        #   4. Predictive Risk Scoring
-        risk_scores = [cnn_predictions[i].max() * anomaly_scores[i] for i in range(len(indicators))]
-
-        return {
-            "cnn_predictions": cnn_predictions.tolist(),
-            "anomaly_scores": anomaly_scores.tolist(),
-            "risk_scores": risk_scores,
-        }
+        #   2. CNN Model and 3. Anomaly Detection
+        cnn_model, kmeans = fit_threat_models(indicators, labels)
+
+        #   4. Scoring and Predictive Risk Scoring, through the exported model (no model.predict overhead)
+        return export_threat_models(cnn_model, kmeans, export_path).score(indicators)
 
     except Exception as e:
         logging.error(f"Threat analysis failed: {e}")
         return {"error": str(e)}  #   Return error details
 
 #   --- Network Optimization ---
+NETWORKS: "collections.OrderedDict[str, RoutingGraph]" = collections.OrderedDict()  #   Resident graphs by network_id (LRU), kept up to date with deltas
+NETWORKS_LOCK = threading.Lock()
+
+def load_network(network_id: str, edges: List[Dict[str, Any]]) -> RoutingGraph:
+    """Makes a topology resident under network_id, replacing any previous one and dropping the least recently used beyond MAX_NETWORKS."""
+    graph = RoutingGraph(edges)
+    with NETWORKS_LOCK:
+        NETWORKS.pop(network_id, None)
+        NETWORKS[network_id] = graph
+        while len(NETWORKS) > MAX_NETWORKS:
+            dropped, _ = NETWORKS.popitem(last=False)
+            logging.info(f"Resident network dropped (least recently used): {dropped}")
+    return graph
+
+def get_network(network_id: str) -> RoutingGraph:
+    """
+    Returns a resident network and marks it as recently used.
+
+    Raises:
+        KeyError: If the network is not loaded.
+    """
+    with NETWORKS_LOCK:
+        graph = NETWORKS[network_id]
+        NETWORKS.move_to_end(network_id)
+        return graph
+
+def drop_network(network_id: str) -> bool:
+    """Frees a resident network. Returns False if it was not loaded."""
+    with NETWORKS_LOCK:
+        return NETWORKS.pop(network_id, None) is not None
+
+def update_network(network_id: str, updates: List[Dict[str, Any]]):
+    """
+    Applies edge deltas to a resident network and repairs its cached routes.
+    The batch is applied completely or not at all.
+
+    Args:
+        network_id: A network previously loaded by optimize_network_flow.
+        updates: Edge deltas, e.g. {'op': 'update', 'from': 'A', 'to': 'B', 'capacity': 4}
+                 (ops: 'insert', 'update', 'delete'; see routing.RoutingGraph.apply).
+
+    Raises:
+        KeyError: If the network is not loaded.
+        ValueError: If an update is invalid (the message names its index).
+    """
+    get_network(network_id).apply(updates)
+
 def optimize_network_flow(network_data: Dict[str, Any]) -> List[str]:
     """
     Optimizes network traffic flow to minimize congestion and latency.
@@ -82,20 +179,42 @@ def optimize_network_flow(network_data: Dict[str, Any]) -> List[str]:
     Args:
         network_data: A dictionary representing the network topology.
                       Example: {'edges': [...], 'source': 'A', 'target': 'C'}
+                      With a 'network_id', the topology stays resident: later calls
+                      may send only 'updates' (edge deltas, see update_network)
+                      instead of 'edges', and routes are repaired incrementally
+                      instead of being recomputed.
 
     Returns:
         An optimized routing path (list of nodes), or an empty list on failure.
     """
     try:
-        if not isinstance(network_data, dict) or 'edges' not in network_data or 'source' not in network_data or 'target' not in network_data:
+        if not isinstance(network_data, dict) or 'source' not in network_data or 'target' not in network_data:
             raise ValueError("Invalid network data format.")
+        source = network_data['source']
+        target = network_data['target']
 
+        network_id = network_data.get('network_id')
+        if network_id is not None:
+            if 'edges' in network_data:
+                graph = load_network(network_id, network_data['edges'])
+            else:
+                try:
+                    graph = get_network(network_id)
+                except KeyError:
+                    raise ValueError(f"Unknown network {network_id}: send its edges first.")
+            if network_data.get('updates'):
+                graph.apply(network_data['updates'])
+            optimized_path = graph.shortest_path(source, target)
+            if not optimized_path:
+                raise nx.NetworkXNoPath()
+            return optimized_path
+
+        if 'edges' not in network_data:
+            raise ValueError("Invalid network data format.")
         graph = nx.Graph()
         for edge in network_data['edges']:
             graph.add_edge(edge['from'], edge['to'], capacity=edge['capacity'])
 
-        source = network_data['source']
-        target = network_data['target']
         optimized_path = nx.shortest_path(graph, source=source, target=target, weight=PATH_WEIGHT)
         return optimized_path
 
@@ -194,6 +313,12 @@ if __name__ == "__main__":
     try:
         optimized_path = optimize_network_flow(network_data)
         print("Optimized Path:", optimized_path)
+        #   Resident network: load once, then send only link metric changes
+        optimize_network_flow(dict(network_data, network_id='sample'))
+        print("Repaired Path:", optimize_network_flow({
+            'network_id': 'sample', 'source': 'A', 'target': 'C',
+            'updates': [{'op': 'update', 'from': 'A', 'to': 'E', 'capacity': 1}, {'op': 'delete', 'from': 'B', 'to': 'C'}],
+        }))
     except Exception as e:
         print(f"Error in network optimization: {e}")
 
@@ -0,0 +1,158 @@
+#   inference.py
+#   Framework-free inference for the fitted threat models of algorithms.py
+#
+#   export_threat_models (algorithms.py) writes the CNN weights and KMeans centroids
+#   to a NumPy .npz artifact. ThreatModel loads it with NumPy only - no TensorFlow or
+#   scikit-learn import - and scores small batches in microseconds instead of paying
+#   model.predict's per-call framework overhead.
+
+import os
+import threading
+import numpy as np
+from typing import Dict, Tuple
+
+#   --- Configuration ---
+THREAT_MODEL_FORMAT = 1  #   Bumped when the artifact layout changes
+
+class ThreatModel:
+    """
+    The threat CNN (Conv1D -> ReLU -> MaxPooling1D -> Flatten -> Dense -> ReLU ->
+    Dense -> softmax) and the KMeans centroids, as NumPy arrays.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        if int(arrays.get("format", -1)) != THREAT_MODEL_FORMAT:
+            raise ValueError(f"Unsupported threat model format: {arrays.get('format')}")
+        self.conv_kernel = np.asarray(arrays["conv_kernel"], dtype=np.float32)  #   (width, channels, filters) as in Keras
+        self.conv_bias = np.asarray(arrays["conv_bias"], dtype=np.float32)
+        self.pool_size = int(arrays["pool_size"])
+        self.hidden_kernel = np.asarray(arrays["hidden_kernel"], dtype=np.float32)
+        self.hidden_bias = np.asarray(arrays["hidden_bias"], dtype=np.float32)
+        self.output_kernel = np.asarray(arrays["output_kernel"], dtype=np.float32)
+        self.output_bias = np.asarray(arrays["output_bias"], dtype=np.float32)
+        self.centroids = np.asarray(arrays["centroids"], dtype=np.float64)
+        self.input_length = int(arrays["input_length"])
+
+        #   Precomputed once so scoring is a few matrix products
+        width, channels, filters = self.conv_kernel.shape
+        self.channels = channels
+        self.conv_matrix = self.conv_kernel.reshape(width * channels, filters)  #   Matches the (window, channel) order of the windows
+        steps = self.input_length - width + 1
+        self.pooled_steps = steps // self.pool_size
+        self.window_index = np.arange(steps)[:, None] + np.arange(width)[None, :]  #   (steps, width) gather for im2col
+        if self.hidden_kernel.shape[0] != self.pooled_steps * filters:
+            raise ValueError("Threat model layers do not fit together.")
+
+    @classmethod
+    def load(cls, path: str) -> "ThreatModel":
+        with np.load(path, allow_pickle=False) as artifact:
+            return cls({name: artifact[name] for name in artifact.files})
+
+    def save(self, path: str):
+        """Writes the artifact atomically (a temporary file renamed into place)."""
+        temporary = f"{path}.tmp-{os.getpid()}"
+        with open(temporary, "wb") as file:
+            np.savez(
+                file, format=np.int64(THREAT_MODEL_FORMAT), input_length=np.int64(self.input_length),
+                conv_kernel=self.conv_kernel, conv_bias=self.conv_bias, pool_size=np.int64(self.pool_size),
+                hidden_kernel=self.hidden_kernel, hidden_bias=self.hidden_bias,
+                output_kernel=self.output_kernel, output_bias=self.output_bias, centroids=self.centroids,
+            )
+        os.replace(temporary, path)
+
+    def predict(self, indicators: np.ndarray) -> np.ndarray:
+        """Class probabilities, as the Keras model's predict() returns them."""
+        x = np.asarray(indicators, dtype=np.float32).reshape(-1, self.input_length, self.channels)
+        windows = x[:, self.window_index].reshape(x.shape[0], self.window_index.shape[0], -1)
+        conv = np.maximum(windows @ self.conv_matrix + self.conv_bias, 0)
+        usable = self.pooled_steps * self.pool_size  #   Keras drops the incomplete last pool window
+        pooled = conv[:, :usable].reshape(x.shape[0], self.pooled_steps, self.pool_size, -1).max(axis=2)
+        hidden = np.maximum(pooled.reshape(x.shape[0], -1) @ self.hidden_kernel + self.hidden_bias, 0)
+        logits = hidden @ self.output_kernel + self.output_bias
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def anomaly_scores(self, indicators: np.ndarray) -> np.ndarray:
+        """
+        Distance to the nearest centroid (KMeans.transform(...).min(axis=1)). Computed
+        from the differences directly: |x|^2 - 2x.c + |c|^2 cancels catastrophically
+        for points near a centroid, which are exactly the low scores.
+        """
+        x = np.asarray(indicators, dtype=np.float64).reshape(-1, self.centroids.shape[1])
+        return np.linalg.norm(x[:, None, :] - self.centroids, axis=2).min(axis=1)
+
+    def score(self, indicators: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Scores indicators like ai_threat_analysis, without retraining.
+
+        Returns:
+            A dictionary with cnn_predictions, anomaly_scores and risk_scores as NumPy arrays.
+        """
+        predictions = self.predict(indicators)
+        anomaly_scores = self.anomaly_scores(indicators)
+        return {
+            "cnn_predictions": predictions,
+            "anomaly_scores": anomaly_scores,
+            "risk_scores": predictions.max(axis=1) * anomaly_scores,
+        }
+
+#   --- Loaded Model Cache ---
+_models: Dict[str, Tuple[int, ThreatModel]] = {}
+_models_lock = threading.Lock()
+
+def get_threat_model(path: str) -> ThreatModel:
+    """Returns the model stored at path, reloading it only when the file changes."""
+    version = os.stat(path).st_mtime_ns
+    with _models_lock:
+        cached = _models.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+    model = ThreatModel.load(path)
+    with _models_lock:
+        _models[path] = (version, model)
+    return model
+
+#   --- Parity Check and Benchmark ---
+if __name__ == "__main__":
+    import sys
+    import time
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    samples, features, classes = 256, 16, 4
+    indicators = rng.random((samples, features))
+    labels = np.eye(classes)[rng.integers(0, classes, samples)]
+    path = os.path.join(tempfile.mkdtemp(), "threat_model.npz")
+
+    try:
+        from algorithms import fit_threat_models, export_threat_models
+    except ImportError as e:
+        sys.exit(f"Parity check needs TensorFlow and scikit-learn ({e}).")
+
+    cnn_model, kmeans = fit_threat_models(indicators, labels)
+    export_threat_models(cnn_model, kmeans, path)
+    model = ThreatModel.load(path)
+
+    expected = cnn_model.predict(indicators.reshape(samples, features, 1), verbose=0)
+    np.testing.assert_allclose(model.predict(indicators), expected, rtol=1e-5, atol=1e-6)
+    #   scikit-learn uses the |x|^2 - 2x.c + |c|^2 expansion, whose absolute error is about
+    #   sqrt(machine epsilon) times the data scale near a centroid; the direct distances are exact to rounding
+    np.testing.assert_allclose(model.anomaly_scores(indicators), kmeans.transform(indicators).min(axis=1), rtol=1e-7, atol=1e-6)
+    print(f"Parity with Keras and scikit-learn: OK ({samples} samples, artifact {os.path.getsize(path)} bytes)")
+
+    for batch in (1, 4, 8, 64):
+        sample = indicators[:batch]
+        runs = 200
+        started = time.perf_counter()
+        for _ in range(runs):
+            cnn_model.predict(sample.reshape(batch, features, 1), verbose=0)
+            kmeans.transform(sample)
+        framework = (time.perf_counter() - started) / runs
+        runs = 5000
+        started = time.perf_counter()
+        for _ in range(runs):
+            model.score(sample)
+        runtime = (time.perf_counter() - started) / runs
+        print(f"batch {batch:3d}: Keras + scikit-learn {framework * 1e6:9.1f} us, NumPy runtime {runtime * 1e6:7.1f} us ({framework / runtime:5.0f}x)")
@@ -0,0 +1,134 @@
+#   warm_worker.py
+#   Pre-started Python interpreter used by WorkerPoolModule to run whitelisted scripts
+#
+#   The worker preloads the modules given on its command line, prints a ready line and
+#   then reads one JSON request per line from stdin. Every script runs in a forked child
+#   (so scripts never share state) with resource limits applied; the result is written
+#   back as one JSON line on stdout.
+
+import os
+import sys
+import json
+import atexit
+import signal
+import threading
+import resource
+import tempfile
+import importlib
+import traceback
+
+def run_child(request: dict, stdout_fd: int, stderr_fd: int):
+    """
+    Runs a script in the forked child process. Never returns.
+
+    Args:
+        request: The script request (script, args, cwd, timeout, memory_limit, cpu_limit).
+        stdout_fd: File descriptor that receives the script's stdout.
+        stderr_fd: File descriptor that receives the script's stderr.
+    """
+    code = 1
+    try:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        if request.get("memory_limit"):
+            resource.setrlimit(resource.RLIMIT_AS, (request["memory_limit"], request["memory_limit"]))
+        if request.get("cpu_limit"):
+            resource.setrlimit(resource.RLIMIT_CPU, (request["cpu_limit"], request["cpu_limit"]))
+        if request.get("cwd"):
+            os.chdir(request["cwd"])
+        if request.get("timeout"):
+            signal.alarm(int(request["timeout"]))  #   SIGALRM terminates the child
+        script = request["script"]
+        sys.argv = [script] + list(request.get("args", []))
+        sys.path[0] = os.path.dirname(os.path.abspath(script))
+        import runpy
+        runpy.run_path(script, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    finally:
+        exit_child(code)
+
+def exit_child(code: int):
+    """
+    Exits the forked child the way a normal interpreter exit would: os._exit skips
+    joining non-daemon threads, atexit handlers and flushing buffered output, so a
+    script relying on any of them would lose work or output.
+    """
+    try:
+        threading._shutdown()  #   Waits for non-daemon threads started by the script
+        atexit._run_exitfuncs()  #   Prints (and swallows) exceptions raised by handlers
+    except BaseException:
+        traceback.print_exc()
+        code = code or 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+def run_request(request: dict) -> dict:
+    """
+    Forks a child for one script request and collects its exit status and output.
+
+    Args:
+        request: The script request.
+
+    Returns:
+        A result dictionary with returncode, stdout, stderr and timed_out.
+    """
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        pid = os.fork()
+        if pid == 0:
+            run_child(request, out.fileno(), err.fileno())
+        _, wait_status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(wait_status):
+            returncode = -os.WTERMSIG(wait_status)
+        else:
+            returncode = os.WEXITSTATUS(wait_status)
+        out.seek(0)
+        err.seek(0)
+        return {
+            "returncode": returncode,
+            "stdout": out.read().decode("utf-8", errors="replace"),
+            "stderr": err.read().decode("utf-8", errors="replace"),
+            "timed_out": returncode == -signal.SIGALRM,
+        }
+
+def main():
+    for name in sys.argv[1:]:
+        try:
+            importlib.import_module(name)  #   Warm up imports shared by the scripts
+        except ImportError as e:
+            print(f"warm_worker: cannot preload {name}: {e}", file=sys.stderr)
+    protocol_out = sys.stdout
+    protocol_out.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+    protocol_out.flush()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            result = run_request(json.loads(line))
+        except Exception as e:
+            result = {"returncode": 1, "stdout": "", "stderr": f"warm_worker error: {e}", "timed_out": False}
+        protocol_out.write(json.dumps(result) + "\n")
+        protocol_out.flush()
+
+if __name__ == "__main__":
+    main()